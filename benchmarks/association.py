@@ -0,0 +1,107 @@
+"""
+Scaling benchmark for detection-to-track association.
+
+Compares the original loop-based associate_detections_to_trackers (kept
+here as a reference) with the vectorized version in trackers/sort.py,
+with and without connected-component gating, and checks that all three
+return the same matches.
+
+Usage:
+    python -m benchmarks.association --boxes 10 50 100 200 400
+"""
+import argparse
+import time
+import numpy as np
+from trackers.sort import associate_detections_to_trackers, iou_batch
+from .synthetic import moving_boxes
+
+
+def reference_associate(detections, trackers, iou_threshold=0.3):
+  """associate_detections_to_trackers before vectorization, for timing and result comparison."""
+  if (len(trackers) == 0):
+    return np.empty((0, 2), dtype=int), np.arange(len(detections)), np.empty((0, 5), dtype=int)
+
+  iou_matrix = iou_batch(detections, trackers)
+
+  if min(iou_matrix.shape) > 0:
+    a = (iou_matrix > iou_threshold).astype(np.int32)
+    if a.sum(1).max() == 1 and a.sum(0).max() == 1:
+      matched_indices = np.stack(np.where(a), axis=1)
+    else:
+      try:
+        import lap
+        _, x, y = lap.lapjv(-iou_matrix, extend_cost=True)
+        matched_indices = np.array([[y[i], i] for i in x if i >= 0])
+      except ImportError:
+        from scipy.optimize import linear_sum_assignment
+        x, y = linear_sum_assignment(-iou_matrix)
+        matched_indices = np.array(list(zip(x, y)))
+  else:
+    matched_indices = np.empty(shape=(0, 2))
+
+  unmatched_detections = []
+  for d, det in enumerate(detections):
+    if (d not in matched_indices[:, 0]):
+      unmatched_detections.append(d)
+  unmatched_trackers = []
+  for t, trk in enumerate(trackers):
+    if (t not in matched_indices[:, 1]):
+      unmatched_trackers.append(t)
+
+  matches = []
+  for m in matched_indices:
+    if (iou_matrix[m[0], m[1]] < iou_threshold):
+      unmatched_detections.append(m[0])
+      unmatched_trackers.append(m[1])
+    else:
+      matches.append(m.reshape(1, 2))
+  if (len(matches) == 0):
+    matches = np.empty((0, 2), dtype=int)
+  else:
+    matches = np.concatenate(matches, axis=0)
+
+  return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+
+
+def make_scene(n_boxes, seed):
+  """Detections and slightly shifted track predictions for a crowded frame."""
+  frames = moving_boxes(n_boxes, 2, width=40 * n_boxes ** 0.5 * 4, height=40 * n_boxes ** 0.5 * 3, seed=seed)
+  trackers = next(frames)
+  detections = next(frames)
+  return detections, trackers
+
+
+def same_result(a, b):
+  key = lambda result: (sorted(map(tuple, result[0].tolist())), sorted(result[1].tolist()), sorted(result[2].tolist()))
+  return key(a) == key(b)
+
+
+def time_ms(fn, scenes, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    for detections, trackers in scenes:
+      fn(detections, trackers)
+  return 1000 * (time.perf_counter() - start) / (repeat * len(scenes))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Time association against the number of boxes")
+  parser.add_argument("--boxes", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+  parser.add_argument("--scenes", type=int, default=10, help="Random scenes per size")
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+
+  variants = [
+    ("reference", reference_associate),
+    ("vectorized", lambda d, t: associate_detections_to_trackers(d, t)),
+    ("gated", lambda d, t: associate_detections_to_trackers(d, t, gate=True)),
+  ]
+
+  print(f"{'boxes':>6} " + " ".join(f"{name + ' ms':>14}" for name, _ in variants) + "  same result")
+  for n_boxes in args.boxes:
+    scenes = [make_scene(n_boxes, seed) for seed in range(args.scenes)]
+    timings = [time_ms(fn, scenes, args.repeat) for _, fn in variants]
+    same = all(
+      same_result(reference_associate(d, t), fn(d, t)) for d, t in scenes for _, fn in variants[1:]
+    )
+    print(f"{n_boxes:>6} " + " ".join(f"{ms:>14.3f}" for ms in timings) + f"  {same}")
@@ -0,0 +1,75 @@
+"""
+Throughput benchmark for batched YOLO inference.
+
+Reads the first frames of a recorded clip, crops the detection ROI the same
+way main.py does and runs the crops through VehicleTracker at several batch
+sizes.
+
+Usage:
+    python -m benchmarks.batch_inference --video input_videos/input_video.mp4 \
+        --model models/vehicle_tracker_model.pt --batch-sizes 1 4 8 16
+"""
+import argparse
+import time
+import cv2
+from trackers import VehicleTracker, FrameBatcher
+from utils import get_roi_start
+
+
+def load_roi_crops(video_path, max_frames):
+  cap = cv2.VideoCapture(video_path)
+  crops = []
+  while cap.isOpened() and len(crops) < max_frames:
+    status, frame = cap.read()
+    if not status:
+      break
+    height = frame.shape[0]
+    crops.append(frame[get_roi_start(height):height])
+  cap.release()
+  return crops
+
+
+def run_batch_size(vehicle_tracker, crops, batch_size, max_wait):
+  batcher = FrameBatcher(vehicle_tracker, batch_size=batch_size, max_wait=max_wait)
+  added_at = {}
+  latencies = []
+
+  start = time.perf_counter()
+  for i, crop in enumerate(crops):
+    added_at[i] = time.perf_counter()
+    for key, _ in batcher.add(i, crop):
+      latencies.append(time.perf_counter() - added_at.pop(key))
+  for key, _ in batcher.flush():
+    latencies.append(time.perf_counter() - added_at.pop(key))
+  elapsed = time.perf_counter() - start
+
+  latencies.sort()
+  return {
+    'fps': len(crops) / elapsed,
+    'mean_latency_ms': 1000 * sum(latencies) / len(latencies),
+    'p95_latency_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+  }
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Compare YOLO throughput across batch sizes")
+  parser.add_argument("--video", default="input_videos/input_video.mp4")
+  parser.add_argument("--model", default="models/vehicle_tracker_model.pt")
+  parser.add_argument("--frames", type=int, default=256, help="Number of frames to read from the clip")
+  parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+  parser.add_argument("--max-wait", type=float, default=1.0, help="Batch deadline in seconds")
+  args = parser.parse_args()
+
+  crops = load_roi_crops(args.video, args.frames)
+  if not crops:
+    raise SystemExit(f"Could not read any frames from {args.video}")
+
+  vehicle_tracker = VehicleTracker(model_path=args.model)
+  # Warm up the model so the first batch size is not charged for initialisation
+  vehicle_tracker.track_batch(crops[:1])
+
+  print(f"{len(crops)} frames, ROI {crops[0].shape[1]}x{crops[0].shape[0]}")
+  print(f"{'batch':>6} {'frames/s':>10} {'mean ms':>10} {'p95 ms':>10}")
+  for batch_size in args.batch_sizes:
+    stats = run_batch_size(vehicle_tracker, crops, batch_size, args.max_wait)
+    print(f"{batch_size:>6} {stats['fps']:>10.1f} {stats['mean_latency_ms']:>10.1f} {stats['p95_latency_ms']:>10.1f}")
@@ -0,0 +1,61 @@
+"""
+Detector calls saved by frame skipping against counting accuracy.
+
+Runs the headless pipeline over a recorded clip once per skip setting
+(every frame, every k-th frame, adaptive) and compares the billed
+per-lane, per-class counts with a hand-counted summary such as
+outputs/real_lane_vehicle_counts.csv.
+
+Usage:
+    python -m benchmarks.frame_skip --video input_videos/input_video.mp4 --intervals 1 2 3 4 --adaptive 6
+"""
+import argparse
+import time
+import cv2
+from detectors import LaneDetector
+from pipeline import FramePipeline, FrameSkipPolicy, TollBilling
+from trackers import VehicleTracker, Sort
+from utils import billed_counts, count_errors, load_lane_vehicle_counts
+
+
+def run(video, vehicle_tracker, lines, skip_policy, conf):
+  cap = cv2.VideoCapture(video)
+  first_frame = cap.read()[1]
+  billing = TollBilling(LaneDetector.from_lines(first_frame, lines))
+  pipeline = FramePipeline(cap, vehicle_tracker, Sort(), billing, render=False,
+                           conf_threshold=conf, skip_policy=skip_policy)
+  start = time.perf_counter()
+  pipeline.start()
+  pipeline.join()
+  elapsed = time.perf_counter() - start
+  cap.release()
+  return billing, pipeline.tracking_stage.stats.count / elapsed
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Detector calls saved by frame skipping against count accuracy")
+  parser.add_argument("--video", default="input_videos/input_video.mp4")
+  parser.add_argument("--model", default="models/vehicle_tracker_model.pt")
+  parser.add_argument("--truth", default="outputs/real_lane_vehicle_counts.csv", help="Hand-counted lane summary")
+  parser.add_argument("--intervals", type=int, nargs="+", default=[1, 2, 3, 4], help="Fixed detector intervals to try")
+  parser.add_argument("--adaptive", type=int, nargs="*", default=[6], help="Longest intervals to try adaptively")
+  parser.add_argument("--conf", type=float, default=0.5)
+  args = parser.parse_args()
+
+  truth = load_lane_vehicle_counts(args.truth)
+  vehicle_tracker = VehicleTracker(model_path=args.model)
+
+  # Detect lanes once so every run bills against the same lanes
+  lanes_detector = LaneDetector(cv2.VideoCapture(args.video).read()[1])
+  lanes_detector.detect()
+
+  settings = [(f"every {k}", FrameSkipPolicy(k)) for k in args.intervals]
+  settings += [(f"adaptive {k}", FrameSkipPolicy(k, adaptive=True)) for k in args.adaptive]
+
+  print(f"{'detector':>12} {'calls':>7} {'saved':>7} {'frames/s':>9} {'billed':>7} {'lane/class err':>15} {'total err':>10}")
+  for name, skip_policy in settings:
+    billing, fps = run(args.video, vehicle_tracker, lanes_detector.lines(), skip_policy, args.conf)
+    stats = skip_policy.stats()
+    absolute, total = count_errors(billed_counts(billing.detection_history), truth)
+    print(f"{name:>12} {stats['detected']:>7} {stats['skip_ratio'] * 100:>6.1f}% {fps:>9.1f} "
+          f"{len(billing.detection_history):>7} {absolute:>15} {total:>+10}")
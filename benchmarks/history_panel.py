@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for the detection history panel.
+
+Compares drawing the panel from scratch every frame with the cached
+DetectionHistoryRenderer, both when nothing changed since the previous
+frame and when one vehicle is billed every frame. With --db the records
+are kept in a DetectionStore, and every changed frame is a SQLite query.
+
+Before timing, some vehicles are billed again in another lane, and the
+history's lane views are checked against a plain list filter: records
+stay in the order they were first billed, whichever store is used.
+
+Usage:
+    python -m benchmarks.history_panel --records 2000 --frames 200
+    python -m benchmarks.history_panel --records 200000 --db /tmp/history_panel.db
+    python -m benchmarks.history_panel --records 2000 --db :memory:
+"""
+import argparse
+import os
+import time
+from utils.detection_history import DetectionHistory
+from utils.detection_store import DetectionStore
+from utils.display_utils import create_detection_history_image, DetectionHistoryRenderer
+
+VEHICLE_TYPES = ["4-wheel", "6-wheel", "6-more-wheel"]
+TOLL_FEES = {"4-wheel": 30, "6-wheel": 75, "6-more-wheel": 120}
+
+
+def bill(history, id, lane=None):
+  vehicle_type = VEHICLE_TYPES[id % len(VEHICLE_TYPES)]
+  lane = id % 5 + 1 if lane is None else lane
+  return history.upsert(id, vehicle_type, lane, "2025-03-12 10:38:27", "Waiting for payment", TOLL_FEES[vehicle_type])
+
+
+def check_lane_order(history, expected):
+  """Exit unless every lane view of `history` matches filtering `expected` ({id: record}, first billed first)."""
+  for lane in range(6):
+    ids = [id for id, record in expected.items() if lane == 0 or record['lane'] == lane]
+    if [record['id'] for record in history.by_lane(lane)] != ids or \
+        [record['id'] for record in history.latest(30, lane)] != ids[-30:] or history.count(lane) != len(ids):
+      raise SystemExit(f"{type(history).__name__} lane {lane} is not in the order records were first billed")
+
+
+def time_per_frame(render, frames, between_frames=None):
+  total = 0.0
+  for frame in range(frames):
+    if between_frames is not None:
+      between_frames(frame)
+    start = time.perf_counter()
+    render()
+    total += time.perf_counter() - start
+  return 1000 * total / frames
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Time the detection history panel per frame")
+  parser.add_argument("--records", type=int, default=2000, help="Records already in the history")
+  parser.add_argument("--frames", type=int, default=200)
+  parser.add_argument("--lane", type=int, default=0, help="Selected lane filter")
+  parser.add_argument("--db", default=None, help="Keep the records in a DetectionStore at this (new) path")
+  args = parser.parse_args()
+
+  if args.db:
+    for suffix in ("", "-wal", "-shm"):
+      if os.path.exists(args.db + suffix):
+        os.remove(args.db + suffix)
+    history = DetectionStore(args.db)
+  else:
+    history = DetectionHistory()
+  expected = {}
+  for id in range(args.records):
+    expected[id] = bill(history, id).to_dict()
+  # Bill some vehicles again in the next lane, as TollBilling does when a track comes back
+  for id in range(0, args.records, 7):
+    expected[id] = bill(history, id, lane=id % 5 + 2 if id % 5 < 4 else 1).to_dict()
+  if args.db:
+    history.flush()
+  check_lane_order(history, expected)
+  renderer = DetectionHistoryRenderer()
+  next_id = [args.records]
+
+  def bill_next(_):
+    bill(history, next_id[0])
+    next_id[0] += 1
+    if args.db:
+      # Commit the new vehicle before the frame, so each frame reads a new version
+      history.flush()
+
+  results = [
+    ("full redraw", time_per_frame(lambda: create_detection_history_image(history, selected_lane=args.lane), args.frames)),
+    ("cached, unchanged", time_per_frame(lambda: renderer.render(history, args.lane), args.frames)),
+    ("cached, 1 new record/frame", time_per_frame(lambda: renderer.render(history, args.lane), args.frames, bill_next)),
+  ]
+
+  print(f"{args.records} records, lane filter {args.lane}")
+  for name, ms in results:
+    print(f"{name:<28} {ms:>8.3f} ms/frame")
+  history.close()
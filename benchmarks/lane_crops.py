@@ -0,0 +1,94 @@
+"""
+Per-lane crop inference against full-ROI inference at different occupancy.
+
+A synthetic road frame is drawn with vehicles in 1 to all lanes. For each
+occupancy the full ROI is run through the model once to stand in for the
+tracker's live tracks, then both ways are timed: one model call on the
+whole ROI, and LaneCropper planning, one call on the crops, mapping back
+and de-duplication. Lanes are filled from the middle outwards, since the
+outer lanes reach to the frame edges. By default crops are timed at every
+occupancy; with --max-coverage set as in the pipeline (0.6), occupancies
+that would fall back to the full ROI show `full`.
+
+Usage:
+    python -m benchmarks.lane_crops --model models/vehicle_tracker_model.pt --resolution 1920x1080
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from detectors import LaneDetector
+from pipeline import LaneCropper
+from pipeline.frame_pipeline import FramePacket
+from trackers import VehicleTracker, results_to_detections
+from utils import get_roi_start
+from .lane_detection import make_frame
+
+
+def draw_vehicles(frame, lanes_detector, lanes, roi_start, per_lane=2):
+  """Bright boxes centred on the lanes in `lanes`, spread over the ROI rows."""
+  height, width = frame.shape[:2]
+  boundaries = lanes_detector.line_x_at(np.linspace(roi_start, height - 1, per_lane + 2)[1:-1])
+  edges = np.hstack([np.zeros((per_lane, 1)), boundaries, np.full((per_lane, 1), width)])
+  rows = np.linspace(roi_start, height - 1, per_lane + 2)[1:-1]
+  w, h = width // 16, (height - roi_start) // (per_lane + 3)
+  for lane in lanes:
+    for row, edge in zip(rows, edges):
+      x = (edge[lane - 1] + edge[lane]) / 2
+      cv2.rectangle(frame, (int(x - w / 2), int(row - h / 2)), (int(x + w / 2), int(row + h / 2)), (240, 240, 240), -1)
+  return frame
+
+
+def time_ms(fn, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    result = fn()
+  return 1000 * (time.perf_counter() - start) / repeat, result
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Compare per-lane crop inference with full-ROI inference")
+  parser.add_argument("--model", default="models/vehicle_tracker_model.pt")
+  parser.add_argument("--resolution", default="1920x1080")
+  parser.add_argument("--lanes", type=int, default=5, help="Lanes drawn on the synthetic road")
+  parser.add_argument("--repeat", type=int, default=20)
+  parser.add_argument("--max-coverage", type=float, default=1.0, help="LaneCropper's fallback threshold")
+  args = parser.parse_args()
+
+  width, height = map(int, args.resolution.split("x"))
+  road = make_frame(width, height, n_lanes=args.lanes, n_vehicles=0)
+  roi_start = get_roi_start(height)
+  lanes_detector = LaneDetector(road)
+  lanes_detector.detect()
+  n_lanes = len(lanes_detector.lane_spaces)
+  if n_lanes == 0:
+    raise SystemExit("No lanes found on the synthetic road")
+
+  vehicle_tracker = VehicleTracker(model_path=args.model)
+  vehicle_tracker.track_batch([road[roi_start:]])  # warm up
+
+  print(f"{n_lanes} lanes, ROI {width}x{height - roi_start}")
+  print(f"{'busy lanes':>10} {'crops':>6} {'width %':>8} {'full ms':>8} {'crops ms':>9} {'speedup':>8} {'boxes full/crops':>17}")
+  middle_out = sorted(range(1, n_lanes + 1), key=lambda lane: abs(lane - (n_lanes + 1) / 2))
+  for busy in range(1, n_lanes + 1):
+    frame = draw_vehicles(road.copy(), lanes_detector, middle_out[:busy], roi_start)
+    packet = FramePacket(0, frame, roi_start, "")
+
+    full_ms, results = time_ms(lambda: vehicle_tracker.track_batch([packet.roi]), args.repeat)
+    detections, classes = results_to_detections(results[0], offset=(0, roi_start))
+
+    # The full-ROI boxes play the tracker's live tracks; no periodic full frames while timing
+    cropper = LaneCropper(lanes_detector, full_every=10 ** 9, max_coverage=args.max_coverage)
+    cropper.plan(packet)  # the first frame is always a full one
+    cropper.observe(np.hstack([detections[:, :4], np.arange(len(detections))[:, None], classes[:, None]]))
+    spans = cropper.plan(packet)
+    if spans is None:
+      print(f"{busy:>10} {'full':>6} {100.0:>8.0f} {full_ms:>8.1f} {'-':>9} {'-':>8} {len(detections):>17}")
+      continue
+
+    def run_crops():
+      return cropper.detect(vehicle_tracker, packet, cropper.plan(packet), conf_threshold=0.5)
+    crops_ms, (crop_detections, _) = time_ms(run_crops, args.repeat)
+    coverage = 100 * sum(x1 - x0 for x0, x1 in spans) / packet.roi.shape[1]
+    print(f"{busy:>10} {len(spans):>6} {coverage:>8.0f} {full_ms:>8.1f} {crops_ms:>9.1f} "
+          f"{full_ms / crops_ms:>7.2f}x {f'{len(detections)}/{len(crop_detections)}':>17}")
@@ -0,0 +1,105 @@
+"""
+Lane detection cost on 1080p and 4K frames.
+
+Times the Canny + Hough step and the segment grouping separately, comparing
+the original per-segment grouping loop (kept here as a reference) with
+the vectorized LaneDetector.group_segments, and times a full find_lines
+at full resolution and on the half-size frame the background lane model
+uses.
+
+Usage:
+    python -m benchmarks.lane_detection --resolutions 1920x1080 3840x2160
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from detectors import LaneDetector
+
+
+def reference_group(lines):
+  """The grouping loop of LaneDetector.detect before vectorization, for timing."""
+  grouped_lines = []
+  for line in lines:
+    x1, y1, x2, y2 = line[0]
+    if y1 < y2:
+      x1, y1, x2, y2 = x2, y2, x1, y1
+    if x2 != x1:
+      angle = np.degrees(np.arctan((y2-y1)/(x2-x1)))
+    else:
+      angle = 90
+    if abs(angle) > 50:
+      found_group = False
+      for group in grouped_lines:
+        group_x1, group_y1, group_x2, group_y2 = group[0]
+        group_angle = np.degrees(np.arctan((group_y2-group_y1)/(group_x2-group_x1))) if group_x2 != group_x1 else 90
+        if abs(angle - group_angle) < 15 and np.sqrt((x1-group_x1)**2 + (y1-group_y1)**2) < 100:
+          group.append([x1, y1, x2, y2])
+          found_group = True
+          break
+      if not found_group:
+        grouped_lines.append([[x1, y1, x2, y2]])
+  return sorted([group[0] for group in grouped_lines], key=lambda line: line[0])
+
+
+def make_frame(width, height, n_lanes=5, n_vehicles=12, seed=0):
+  """A road with solid and dashed lane markings converging to the top, noise and bright vehicles."""
+  rng = np.random.default_rng(seed)
+  frame = rng.normal(70, 3, (height, width, 3)).clip(0, 255).astype(np.uint8)
+  thickness = max(2, width // 300)
+  for i in range(1, n_lanes):
+    bottom = width * i / n_lanes
+    top = width / 2 + (bottom - width / 2) / 3
+    if i % 2:
+      cv2.line(frame, (int(bottom), height), (int(top), 0), (200, 200, 200), thickness)
+    else:
+      for start in np.arange(0, 1, 0.1):
+        y_a, y_b = height * (1 - start), height * (1 - start - 0.06)
+        x_a, x_b = bottom + (top - bottom) * (1 - y_a / height), bottom + (top - bottom) * (1 - y_b / height)
+        cv2.line(frame, (int(x_a), int(y_a)), (int(x_b), int(y_b)), (200, 200, 200), thickness)
+  for _ in range(n_vehicles):
+    x, y = rng.uniform(0, width * 0.9), rng.uniform(height * 0.3, height * 0.9)
+    w, h = rng.uniform(0.04, 0.1) * width, rng.uniform(0.05, 0.1) * height
+    cv2.rectangle(frame, (int(x), int(y)), (int(x + w), int(y + h)), (240, 240, 240), -1)
+  return frame
+
+
+def hough(frame, scale=1.0):
+  gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+  gray = cv2.GaussianBlur(gray, (1, 1), 0)
+  edges = cv2.Canny(gray, 50, 70)
+  return cv2.HoughLinesP(edges, 1, np.pi/180, max(1, int(100 * scale)),
+                         minLineLength=300 * scale, maxLineGap=250 * scale)
+
+
+def time_ms(fn, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    fn()
+  return 1000 * (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Time lane detection at high resolutions")
+  parser.add_argument("--resolutions", nargs="+", default=["1920x1080", "3840x2160"])
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+
+  print(f"{'resolution':>10} {'segments':>9} {'hough ms':>9} {'ref group ms':>13} {'vec group ms':>13} "
+        f"{'lines ref/vec':>14} {'full ms':>8} {'half ms':>8}")
+  for resolution in args.resolutions:
+    width, height = map(int, resolution.split("x"))
+    frame = make_frame(width, height)
+    small = cv2.resize(frame, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+
+    lines = hough(frame)
+    segments = np.empty((0, 1, 4), dtype=np.int32) if lines is None else lines
+    hough_ms = time_ms(lambda: hough(frame), args.repeat)
+    reference_ms = time_ms(lambda: reference_group(segments), args.repeat)
+    vectorized_ms = time_ms(lambda: LaneDetector.group_segments(segments.reshape(-1, 4), height), args.repeat)
+    full_ms = time_ms(lambda: LaneDetector.find_lines(frame), args.repeat)
+    half_ms = time_ms(lambda: LaneDetector.find_lines(small, 0.5), args.repeat)
+    n_lines = f"{len(reference_group(segments))}/{len(LaneDetector.group_segments(segments.reshape(-1, 4), height))}"
+
+    print(f"{resolution:>10} {len(segments):>9} {hough_ms:>9.1f} {reference_ms:>13.2f} {vectorized_ms:>13.2f} "
+          f"{n_lines:>14} {full_ms:>8.1f} {half_ms:>8.1f}")
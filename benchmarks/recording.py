@@ -0,0 +1,101 @@
+"""
+Detections recorded once and replayed without a model.
+
+A Recording holds the detector output of every frame of a clip, with the
+lane lines and ROI needed to bill it, and is stored as one compressed .npz:
+all boxes in one float32 array, classes as uint8 and a row offset per frame.
+Boxes are recorded at a low confidence so replays can try other thresholds.
+"""
+import cv2
+import numpy as np
+from trackers import FrameBatcher, results_to_detections
+from utils import get_roi_start
+
+
+class Recording:
+  def __init__(self, boxes, classes, offsets, frame_shape, roi_start, lines, fps=30.0, passed=None):
+    self.boxes = boxes  # (N, 5) [x1, y1, x2, y2, conf] of all frames
+    self.classes = classes  # (N,) class index of each box
+    self.offsets = offsets  # (frames + 1,) first box row of each frame
+    self.frame_shape = tuple(int(v) for v in frame_shape)
+    self.roi_start = int(roi_start)
+    self.lines = [list(map(int, line)) for line in lines]
+    self.fps = float(fps)
+    self.passed = passed  # (lane, class) of each vehicle that really passed, when known
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def frames(self, conf_threshold=0.5):
+    """Yield (detections, classes) per frame, keeping boxes above `conf_threshold`."""
+    boxes = self.boxes.astype(float)
+    classes = self.classes.astype(int)
+    for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+      keep = boxes[start:end, 4] > conf_threshold
+      yield boxes[start:end][keep], classes[start:end][keep]
+
+  def save(self, path):
+    extra = {} if self.passed is None else {'passed': np.asarray(self.passed, dtype=np.int16).reshape(-1, 2)}
+    np.savez_compressed(
+      path, boxes=self.boxes, classes=self.classes, offsets=self.offsets,
+      frame_shape=np.array(self.frame_shape), roi_start=self.roi_start,
+      lines=np.asarray(self.lines, dtype=np.int32).reshape(-1, 4), fps=self.fps, **extra
+    )
+
+  @classmethod
+  def load(cls, path):
+    with np.load(path) as data:
+      passed = [tuple(row) for row in data['passed'].tolist()] if 'passed' in data else None
+      return cls(data['boxes'], data['classes'], data['offsets'], data['frame_shape'],
+                 int(data['roi_start']), data['lines'].tolist(), float(data['fps']), passed)
+
+  @classmethod
+  def from_frames(cls, frames, frame_shape, roi_start, lines, fps=30.0, passed=None):
+    """Pack an iterable of per-frame (detections, classes)."""
+    boxes, classes, offsets = [], [], [0]
+    for dets, det_classes in frames:
+      boxes.append(np.asarray(dets, dtype=np.float32).reshape(-1, 5))
+      classes.append(np.asarray(det_classes, dtype=np.uint8))
+      offsets.append(offsets[-1] + len(boxes[-1]))
+    boxes = np.vstack(boxes) if boxes else np.empty((0, 5), dtype=np.float32)
+    classes = np.concatenate(classes) if classes else np.empty((0,), dtype=np.uint8)
+    return cls(boxes, classes, np.array(offsets, dtype=np.int64), frame_shape, roi_start, lines, fps, passed)
+
+  @classmethod
+  def from_traffic(cls, traffic, fps=30.0):
+    """Record a synthetic TollTraffic scene; its passed vehicles become the ground truth."""
+    recording = cls.from_frames(traffic.frames(), (traffic.height, traffic.width, 3),
+                                get_roi_start(traffic.height), traffic.lines, fps)
+    recording.passed = list(traffic.passed)
+    return recording
+
+  @classmethod
+  def from_video(cls, video, vehicle_tracker, lines, conf_threshold=0.1, batch_size=8, max_frames=None):
+    """Run the detector over the ROI of every frame of `video` once."""
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    batcher = FrameBatcher(vehicle_tracker, batch_size=batch_size, max_wait=float("inf"))
+    frames = {}
+    frame_shape = None
+    roi_start = 0
+
+    def collect(ready):
+      for index, result in ready:
+        frames[index] = results_to_detections(result, offset=(0, roi_start), conf_threshold=conf_threshold)
+
+    index = 0
+    while cap.isOpened() and (max_frames is None or index < max_frames):
+      status, frame = cap.read()
+      if not status:
+        break
+      if frame_shape is None:
+        frame_shape = frame.shape
+        roi_start = get_roi_start(frame.shape[0])
+      collect(batcher.add(index, frame[roi_start:]))
+      index += 1
+    collect(batcher.flush())
+    cap.release()
+
+    if frame_shape is None:
+      raise ValueError(f"Could not read any frames from {video}")
+    return cls.from_frames((frames[i] for i in range(index)), frame_shape, roi_start, lines, fps)
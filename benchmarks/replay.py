@@ -0,0 +1,190 @@
+"""
+End-to-end benchmark of everything after the detector, on recorded detections.
+
+Detections are recorded once (from a clip and a model, or from synthetic
+traffic) into a compact .npz, then replayed through SORT, lane assignment,
+class resolution and toll calculation (TollBilling) and history persistence
+(DetectionHistoryWriter) with no model, video or window. Reports frames/s,
+per-stage latency percentiles and peak memory, so regressions in the
+non-inference hot path show up on any CPU-only machine.
+
+Usage:
+    # Record a clip once (needs the model), then replay it anywhere
+    python -m benchmarks.replay record --video input_videos/input_video.mp4 --out outputs/benchmarks/clip.npz
+    python -m benchmarks.replay run outputs/benchmarks/clip.npz --tracker batch
+
+    # Scaling curves on synthetic traffic
+    python -m benchmarks.replay scale --vehicles 5 20 50 --lanes 5 --occlusion 0 0.2
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from detectors import LaneDetector
+from pipeline import TollBilling
+from trackers import Sort, BatchSort
+from utils import DetectionHistory, DetectionHistoryWriter, billable_passed
+from .recording import Recording
+from .synthetic import TollTraffic
+
+STAGES = ["track", "lanes", "bill", "persist", "frame"]
+
+
+class TimedLanes:
+  """Lanes detector stand-in that adds the time spent in lane lookups to `elapsed`."""
+  def __init__(self, lanes_detector):
+    self.lanes_detector = lanes_detector
+    self.elapsed = 0.0
+
+  def get_lane_numbers(self, points):
+    start = time.perf_counter()
+    lanes = self.lanes_detector.get_lane_numbers(points)
+    self.elapsed += time.perf_counter() - start
+    return lanes
+
+
+def replay(recording, tracker="sort", conf=0.5, max_age=1, min_hits=3, detect_every=1, output_dir=None):
+  """
+  Replay `recording` once. Returns per-stage times in seconds ({stage: array
+  with one entry per frame}), the billing object and the elapsed wall time.
+  With `detect_every` > 1 only every n-th frame's detections are used and
+  SORT is advanced on the others, like FrameSkipPolicy.
+  """
+  blank = np.zeros(recording.frame_shape, dtype=np.uint8)
+  lanes = TimedLanes(LaneDetector.from_lines(blank, recording.lines))
+  tracker_class = BatchSort if tracker == "batch" else Sort
+  sort = tracker_class(max_age=max_age, min_hits=min_hits)
+  billing = TollBilling(lanes, DetectionHistory())
+
+  # Timestamps are formatted up front; decode pays for them in the real pipeline
+  start_time = datetime.datetime(2025, 1, 1)
+  timestamps = [(start_time + datetime.timedelta(seconds=i / recording.fps)).strftime("%Y-%m-%d %H:%M:%S")
+                for i in range(len(recording))]
+  frames = list(recording.frames(conf))
+  times = {stage: np.empty(len(frames)) for stage in STAGES}
+
+  with tempfile.TemporaryDirectory() as tmp:
+    writer = DetectionHistoryWriter(output_dir=output_dir or tmp)
+    clock = time.perf_counter
+    started = clock()
+    for i, ((dets, classes), timestamp) in enumerate(zip(frames, timestamps)):
+      t0 = clock()
+      if i % detect_every:
+        tracks = sort.advance(with_class=True)
+      else:
+        tracks = sort.update(np.hstack([dets, classes[:, None]]))
+      t1 = clock()
+      lanes.elapsed = 0.0
+      records = billing.update(tracks, recording.roi_start, timestamp)
+      t2 = clock()
+      writer.write(records)
+      t3 = clock()
+      times['track'][i] = t1 - t0
+      times['lanes'][i] = lanes.elapsed
+      times['bill'][i] = t2 - t1 - lanes.elapsed
+      times['persist'][i] = t3 - t2
+      times['frame'][i] = t3 - t0
+    elapsed = clock() - started
+    with contextlib.redirect_stdout(io.StringIO()):
+      writer.close()
+  return times, billing, elapsed
+
+
+def peak_rss_mb():
+  with open("/proc/self/status") as status:
+    for line in status:
+      if line.startswith("VmHWM:"):
+        return int(line.split()[1]) / 1024
+  return float("nan")
+
+
+def report(name, recording, args):
+  times, billing, elapsed = replay(recording, args.tracker, args.conf, args.max_age, args.min_hits)
+  # A second pass under tracemalloc for the Python-heap peak, so it does not slow the timed one
+  tracemalloc.start()
+  replay(recording, args.tracker, args.conf, args.max_age, args.min_hits)
+  heap_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+  tracemalloc.stop()
+
+  # Out of the vehicles that should be billed, the same count evaluate.py scores against
+  passed = "" if recording.passed is None else f" of {len(billable_passed(recording.passed))}"
+  print(f"{name}: {len(recording)} frames, {len(recording.boxes)} boxes, {len(billing.detection_history)}{passed} billed, "
+        f"{len(recording) / elapsed:.0f} frames/s, peak heap {heap_mb:.1f} MiB, peak RSS {peak_rss_mb():.0f} MiB")
+  print(f"  {'stage':<8} {'p50 us':>8} {'p95 us':>8} {'p99 us':>8} {'max us':>8} {'share':>6}")
+  total = times['frame'].sum()
+  for stage in STAGES:
+    p50, p95, p99 = np.percentile(times[stage], [50, 95, 99]) * 1e6
+    print(f"  {stage:<8} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f} {times[stage].max() * 1e6:>8.0f} "
+          f"{times[stage].sum() / total * 100:>5.0f}%")
+
+
+def add_replay_arguments(parser):
+  parser.add_argument("--tracker", choices=["sort", "batch"], default="sort")
+  parser.add_argument("--conf", type=float, default=0.5, help="Confidence threshold applied on replay")
+  parser.add_argument("--max-age", type=int, default=1)
+  parser.add_argument("--min-hits", type=int, default=3)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Record detections once and replay them through tracking and billing")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  record = commands.add_parser("record", help="Run the model over a clip and save its detections")
+  record.add_argument("--video", default="input_videos/input_video.mp4")
+  record.add_argument("--model", default="models/vehicle_tracker_model.pt")
+  record.add_argument("--out", default="outputs/benchmarks/recording.npz")
+  record.add_argument("--conf", type=float, default=0.1, help="Lowest confidence kept in the recording")
+  record.add_argument("--batch-size", type=int, default=8)
+  record.add_argument("--max-frames", type=int, default=None)
+
+  synthetic = commands.add_parser("synthetic", help="Save synthetic traffic as a recording")
+  synthetic.add_argument("--out", default="outputs/benchmarks/synthetic.npz")
+  synthetic.add_argument("--vehicles", type=int, default=20, help="Vehicles on the road at once")
+  synthetic.add_argument("--lanes", type=int, default=5)
+  synthetic.add_argument("--occlusion", type=float, default=0.05, help="Share of detections hidden")
+  synthetic.add_argument("--frames", type=int, default=3000)
+
+  run = commands.add_parser("run", help="Replay a recording")
+  run.add_argument("recording")
+  add_replay_arguments(run)
+
+  scale = commands.add_parser("scale", help="Replay synthetic traffic of increasing density")
+  scale.add_argument("--vehicles", type=int, nargs="+", default=[5, 20, 50])
+  scale.add_argument("--lanes", type=int, nargs="+", default=[5])
+  scale.add_argument("--occlusion", type=float, nargs="+", default=[0.0, 0.2])
+  scale.add_argument("--frames", type=int, default=3000)
+  add_replay_arguments(scale)
+  args = parser.parse_args()
+
+  if args.command == "record":
+    import cv2
+    from trackers import VehicleTracker
+    first_frame = cv2.VideoCapture(args.video).read()[1]
+    if first_frame is None:
+      raise SystemExit(f"Could not read {args.video}")
+    lanes_detector = LaneDetector(first_frame)
+    lanes_detector.detect()
+    recording = Recording.from_video(args.video, VehicleTracker(model_path=args.model), lanes_detector.lines(),
+                                     conf_threshold=args.conf, batch_size=args.batch_size, max_frames=args.max_frames)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    recording.save(args.out)
+    print(f"Recorded {len(recording)} frames, {len(recording.boxes)} boxes to {args.out} "
+          f"({os.path.getsize(args.out) / 1024:.0f} KiB)")
+  elif args.command == "synthetic":
+    recording = Recording.from_traffic(TollTraffic(args.vehicles, args.frames, args.lanes, occlusion_rate=args.occlusion))
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    recording.save(args.out)
+    print(f"Saved {len(recording)} frames, {len(recording.boxes)} boxes, {len(recording.passed)} vehicles to {args.out}")
+  elif args.command == "run":
+    report(args.recording, Recording.load(args.recording), args)
+  else:
+    for n_lanes in args.lanes:
+      for occlusion in args.occlusion:
+        for n_vehicles in args.vehicles:
+          traffic = TollTraffic(n_vehicles, args.frames, n_lanes, occlusion_rate=occlusion)
+          report(f"{n_vehicles} vehicles, {n_lanes} lanes, {occlusion:.0%} occluded", Recording.from_traffic(traffic), args)
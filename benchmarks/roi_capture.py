@@ -0,0 +1,110 @@
+"""
+Memory and throughput of the capture stage: full frames against RoiCapture.
+
+Each mode decodes the same clip in its own process while holding as many
+packets in flight as the pipeline's queues can (`--in-flight`), and reports
+decode frames/s, bytes allocated per frame (tracemalloc, which sees NumPy
+buffers) and peak RSS. Without --video a synthetic 1080p clip is written
+to a temporary file first.
+
+Usage:
+    python -m benchmarks.roi_capture --video input_videos/input_video.mp4
+"""
+import argparse
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+from pipeline import RoiCapture
+from pipeline.frame_pipeline import FramePacket
+from utils import get_roi_start
+from .lane_detection import make_frame
+
+
+def write_clip(path, width=1920, height=1080, n_frames=300):
+  writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (width, height))
+  background = make_frame(width, height, n_vehicles=0)
+  for i in range(n_frames):
+    frame = background.copy()
+    for lane in range(4):
+      y = (i * 8 + lane * 150) % height
+      x = int(width * (lane + 0.5) / 5)
+      cv2.rectangle(frame, (x, y), (x + 160, y + 120), (240, 240, 240), -1)
+    writer.write(frame)
+  writer.release()
+
+
+def peak_rss_mb():
+  with open("/proc/self/status") as status:
+    for line in status:
+      if line.startswith("VmHWM:"):
+        return int(line.split()[1]) / 1024
+  return float("nan")
+
+
+def run_mode(video, mode, in_flight):
+  cap = cv2.VideoCapture(video)
+  status, first_frame = cap.read()
+  roi_start = get_roi_start(first_frame.shape[0])
+  if mode != "full":
+    cap = RoiCapture(cap, first_frame.shape, roi_start, scale=float(mode.split("x")[1]), n_slots=in_flight + 1)
+
+  held = collections.deque()
+  frames = 0
+  allocated = 0
+  tracemalloc.start()
+  start = time.perf_counter()
+  while True:
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    if mode == "full":
+      status, frame = cap.read()
+      packet = FramePacket(frames, frame, roi_start, "") if status else None
+    else:
+      status, roi, release = cap.read_roi()
+      packet = FramePacket(frames, None, roi_start, "", release, roi=roi, roi_scale=cap.scale) if status else None
+    if packet is None:
+      break
+    allocated += tracemalloc.get_traced_memory()[1] - before
+
+    # Keep packets alive like the pipeline's queues do, then let the oldest go
+    held.append(packet)
+    if len(held) > in_flight:
+      held.popleft().release()
+    frames += 1
+  elapsed = time.perf_counter() - start
+  tracemalloc.stop()
+
+  for packet in held:
+    packet.release()
+  cap.release()
+  print(f"{mode:>8} {frames:>7} {frames / elapsed:>9.1f} {allocated / frames / 1024:>12.1f} {peak_rss_mb():>13.1f}")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Compare full-frame and ROI-only capture")
+  parser.add_argument("--video", default=None, help="Clip to decode (default: a synthetic 1080p clip)")
+  parser.add_argument("--modes", nargs="+", default=["full", "roi-x1", "roi-x0.5"])
+  parser.add_argument("--in-flight", type=int, default=24, help="Packets held at once (3 queues of 8)")
+  parser.add_argument("--mode", default=None, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.mode is not None:
+    run_mode(args.video, args.mode, args.in_flight)
+    sys.exit()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    video = args.video
+    if video is None:
+      video = os.path.join(tmp, "clip.avi")
+      write_clip(video)
+
+    print(f"{'mode':>8} {'frames':>7} {'frames/s':>9} {'KiB alloc/fr':>12} {'peak RSS MiB':>13}")
+    for mode in args.modes:
+      # One process per mode so peak RSS is not shared between them
+      subprocess.run([sys.executable, "-m", "benchmarks.roi_capture", "--video", video,
+                      "--mode", mode, "--in-flight", str(args.in_flight)], check=True)
@@ -0,0 +1,124 @@
+"""
+Synthetic traffic for benchmarks that do not need a video or a model.
+"""
+import numpy as np
+
+
+def moving_boxes(n_objects, n_frames, width=1920, height=1080, miss_rate=0.0, seed=0):
+  """
+  Yield one (N, 5) detection array per frame for `n_objects` boxes moving
+  at constant velocity with a little measurement noise. Objects that leave
+  the frame re-enter at the opposite edge. Each detection is dropped with
+  probability `miss_rate` to simulate occlusion.
+  """
+  rng = np.random.default_rng(seed)
+  size = rng.uniform(40, 160, (n_objects, 2))
+  position = rng.uniform((0, 0), (width, height), (n_objects, 2))
+  velocity = rng.uniform(-6, 6, (n_objects, 2))
+
+  for _ in range(n_frames):
+    position = (position + velocity) % (width, height)
+    noise = rng.normal(0, 1.0, (n_objects, 4))
+    dets = np.empty((n_objects, 5))
+    dets[:, :2] = position
+    dets[:, 2:4] = position + size
+    dets[:, :4] += noise
+    dets[:, 4] = rng.uniform(0.5, 1.0, n_objects)
+
+    visible = rng.random(n_objects) >= miss_rate
+    yield dets[visible]
+
+
+def lane_lines(n_lanes, width=1920, height=1080):
+  """Lane lines [x1, y1, x2, y2] (bottom point first) converging towards the top, like a plaza camera sees them."""
+  lines = []
+  for i in range(1, n_lanes):
+    bottom = width * i / n_lanes
+    top = width / 2 + (bottom - width / 2) / 3
+    lines.append([int(bottom), height, int(top), 0])
+  return lines
+
+
+class TollTraffic:
+  """
+  Vehicles driving down the lanes of `lane_lines` towards the camera.
+
+  About `n_vehicles` are on the road at once: each one enters near the top
+  in a random lane with a random class, drives down its lane at a constant
+  speed and leaves at the bottom, when another takes its place after a
+  short gap. Detections carry a little noise and are hidden in bursts of
+  1-4 frames so that about `occlusion_rate` of them are missing.
+
+  frames() yields (detections, classes) per frame; vehicles that left the
+  frame are appended to `passed` as (lane, class index), which is what a
+  perfect counter would bill.
+  """
+  # Box (width, height) at the bottom of the frame, relative to the frame, per class index
+  CLASS_SIZES = [(0.03, 0.08), (0.08, 0.14), (0.12, 0.25), (0.1, 0.2)]
+  CLASS_WEIGHTS = [0.1, 0.6, 0.1, 0.2]
+
+  def __init__(self, n_vehicles, n_frames, n_lanes=5, width=1920, height=1080, occlusion_rate=0.0, seed=0):
+    self.n_vehicles = n_vehicles
+    self.n_frames = n_frames
+    self.n_lanes = n_lanes
+    self.width = width
+    self.height = height
+    self.occlusion_rate = occlusion_rate
+    self.seed = seed
+    self.lines = lane_lines(n_lanes, width, height)
+    self.passed = []
+
+  def frames(self):
+    rng = np.random.default_rng(self.seed)
+    self.passed = []
+    n = self.n_vehicles
+    edges = np.array([[0, self.height, 0, 0]] + self.lines + [[self.width, self.height, self.width, 0]], dtype=float)
+    sizes = np.array(self.CLASS_SIZES) * (self.width, self.height)
+
+    lane = rng.integers(1, self.n_lanes + 1, n)
+    cls = rng.choice(len(sizes), n, p=self.CLASS_WEIGHTS)
+    speed = rng.uniform(4, 12, n)
+    # Spread the first vehicles over the road so traffic starts in its steady state
+    y = rng.uniform(self.height * 0.2, self.height, n)
+    wait = np.zeros(n, dtype=int)
+    hidden = np.zeros(n, dtype=int)
+    start_hiding = self.occlusion_rate / 2.5  # bursts are 2.5 frames long on average
+
+    for _ in range(self.n_frames):
+      moving = wait == 0
+      y[moving] += speed[moving]
+      wait[~moving] -= 1
+
+      # Vehicles past the bottom edge are billed and replaced after a gap
+      left = moving & (y - sizes[cls, 1] > self.height)
+      for i in np.nonzero(left)[0]:
+        self.passed.append((int(lane[i]), int(cls[i])))
+      count = int(left.sum())
+      lane[left] = rng.integers(1, self.n_lanes + 1, count)
+      cls[left] = rng.choice(len(sizes), count, p=self.CLASS_WEIGHTS)
+      speed[left] = rng.uniform(4, 12, count)
+      y[left] = self.height * 0.2
+      wait[left] = rng.integers(0, 30, count)
+
+      # Centre of the lane on the vehicle's bottom row; boxes shrink with distance
+      t = y / self.height
+      left_x = edges[lane - 1, 2] + (edges[lane - 1, 0] - edges[lane - 1, 2]) * t
+      right_x = edges[lane, 2] + (edges[lane, 0] - edges[lane, 2]) * t
+      centre = (left_x + right_x) / 2
+      scale = 0.4 + 0.6 * t
+      w, h = sizes[cls, 0] * scale, sizes[cls, 1] * scale
+
+      dets = np.empty((n, 5))
+      dets[:, 0], dets[:, 1] = centre - w / 2, y - h
+      dets[:, 2], dets[:, 3] = centre + w / 2, y
+      dets[:, :4] += rng.normal(0, 1.0, (n, 4))
+      dets[:, [0, 2]] = dets[:, [0, 2]].clip(0, self.width)
+      dets[:, [1, 3]] = dets[:, [1, 3]].clip(0, self.height)
+      dets[:, 4] = rng.uniform(0.5, 1.0, n)
+
+      hidden = np.maximum(hidden - 1, 0)
+      starts = (hidden == 0) & (rng.random(n) < start_hiding)
+      hidden[starts] = rng.integers(1, 5, int(starts.sum()))
+
+      visible = (wait == 0) & (hidden == 0) & (dets[:, 1] < self.height)
+      yield dets[visible], cls[visible]
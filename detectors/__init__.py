@@ -1 +1,3 @@
-from .lanes_detector import LaneDetector
\ No newline at end of file
+from .lanes_detector import LaneDetector, lane_spaces_key
+from .lane_model import IncrementalLaneModel
+from .lane_calibration import LaneCalibrationCache
\ No newline at end of file
@@ -0,0 +1,137 @@
+import base64
+import datetime
+import json
+import os
+import re
+import cv2
+import numpy as np
+from .lanes_detector import LaneDetector
+
+CALIBRATION_VERSION = 1
+FINGERPRINT_SIZE = (160, 90)
+
+def edge_fingerprint(frame, size=FINGERPRINT_SIZE):
+  """
+  Cheap summary of the static scene: a small boolean edge map of `frame`.
+  Lane markings, kerbs and booths dominate it, so it barely changes with
+  traffic but does change when the camera moves or is replaced.
+  """
+  gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+  small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+  return cv2.Canny(small, 50, 70) > 0
+
+def fingerprint_similarity(cached, live):
+  """
+  Share of the cached edge pixels that still have an edge within one pixel
+  in the live frame (1.0 for identical scenes). Edges added by traffic in
+  the live frame do not lower the score.
+  """
+  if cached.shape != live.shape:
+    return 0.0
+  if not cached.any():
+    return 1.0 if not live.any() else 0.0
+  live = cv2.dilate(live.astype(np.uint8), np.ones((3, 3), np.uint8)) > 0
+  return float((cached & live).sum() / cached.sum())
+
+class LaneCalibrationCache:
+  """
+  Lane calibrations (lane lines and lane_spaces) saved as small versioned
+  JSON files, one per camera ID and frame resolution, so a restart can skip
+  lane detection.
+
+  A cached calibration is only used if its edge fingerprint still matches
+  the live frame (similarity of at least `min_similarity`); otherwise the
+  lanes are detected again and the file is replaced.
+  """
+  def __init__(self, cache_dir="outputs/lane_calibration", min_similarity=0.6):
+    self.cache_dir = cache_dir
+    self.min_similarity = min_similarity
+
+  def path_for(self, camera_id, frame):
+    height, width = frame.shape[:2]
+    safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', str(camera_id))
+    return os.path.join(self.cache_dir, f"{safe_id}_{width}x{height}.json")
+
+  def save(self, camera_id, lanes_detector, frame=None):
+    """Write the calibration of `lanes_detector`, fingerprinted on `frame` (its own frame by default)."""
+    frame = lanes_detector.frame if frame is None else frame
+    height, width = frame.shape[:2]
+    fingerprint = edge_fingerprint(frame)
+
+    calibration = {
+      'version': CALIBRATION_VERSION,
+      'camera_id': str(camera_id),
+      'resolution': [width, height],
+      'created': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+      'lines': [[int(v) for v in line] for line in lanes_detector.lines()],
+      'lane_spaces': [
+        {
+          'lane_number': space['lane_number'],
+          'left_line': None if space['left_line'] is None else [int(v) for v in space['left_line'][0]],
+          'right_line': None if space['right_line'] is None else [int(v) for v in space['right_line'][0]],
+        }
+        for space in lanes_detector.lane_spaces
+      ],
+      'fingerprint': {
+        'size': list(FINGERPRINT_SIZE),
+        'edges': base64.b64encode(np.packbits(fingerprint)).decode('ascii'),
+      },
+    }
+
+    path = self.path_for(camera_id, frame)
+    os.makedirs(self.cache_dir, exist_ok=True)
+    # Write to a temporary file first so a crash never leaves a half-written calibration
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+      json.dump(calibration, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+  def load(self, camera_id, frame):
+    """
+    The cached calibration for this camera and resolution as a LaneDetector
+    on `frame`, or None if there is none, it is from another version or the
+    scene no longer matches. Also returns the fingerprint similarity (None
+    when there was nothing to compare).
+    """
+    path = self.path_for(camera_id, frame)
+    try:
+      with open(path) as f:
+        calibration = json.load(f)
+    except (OSError, ValueError):
+      return None, None
+
+    height, width = frame.shape[:2]
+    if calibration.get('version') != CALIBRATION_VERSION or calibration.get('resolution') != [width, height]:
+      return None, None
+
+    size = tuple(calibration['fingerprint']['size'])
+    edges = np.frombuffer(base64.b64decode(calibration['fingerprint']['edges']), dtype=np.uint8)
+    cached = np.unpackbits(edges)[:size[0] * size[1]].reshape(size[1], size[0]).astype(bool)
+    similarity = fingerprint_similarity(cached, edge_fingerprint(frame, size))
+    if similarity < self.min_similarity:
+      return None, similarity
+
+    # lane_spaces follow from the lines, they are stored for people reading the file
+    return LaneDetector.from_lines(frame, calibration['lines']), similarity
+
+  def load_or_detect(self, camera_id, frame, refresh=False):
+    """
+    Cache-first lane detection for `frame`.
+
+    Returns:
+        lanes_detector: LaneDetector for this camera
+        source: "cache" if the saved calibration was used, "detected" otherwise
+        similarity: Fingerprint similarity of the saved calibration, None if there was none
+    """
+    similarity = None
+    if not refresh:
+      lanes_detector, similarity = self.load(camera_id, frame)
+      if lanes_detector is not None:
+        return lanes_detector, "cache", similarity
+
+    lanes_detector = LaneDetector(frame)
+    lanes_detector.detect()
+    if lanes_detector.lanes:
+      self.save(camera_id, lanes_detector)
+    return lanes_detector, "detected", similarity
@@ -0,0 +1,246 @@
+import threading
+import time
+import cv2
+import numpy as np
+from .lanes_detector import LaneDetector
+
+class IncrementalLaneModel:
+  """
+  Keeps the lane lines of a fixed camera up to date while the video runs.
+
+  Every `interval` seconds the next submitted frame is downsampled by
+  `scale` and lane detection runs on it in a background thread. The lines
+  found are matched to the current ones and merged with exponential
+  smoothing: a matched line moves `smoothing` of the way towards the new
+  detection, a new line must be found `confirm_after` times in a row before
+  it is used, and a line that is not found `max_misses` times in a row is
+  dropped. A truck over the markings or a lighting glitch on one frame
+  therefore cannot replace good lanes.
+
+  Each merge builds a new LaneDetector and publishes it with one attribute
+  assignment, so readers always see a complete detector and never wait
+  for detection. The model can be used in place of a LaneDetector for lane
+  lookups and drawing, which always go to the latest published detector.
+  """
+  def __init__(self, lanes_detector, interval=30.0, scale=0.5, smoothing=0.3,
+               match_distance=40, confirm_after=2, max_misses=3):
+    self.frame = lanes_detector.frame  # only its shape is used, for the published lane maps
+    self.lane_map_scale = lanes_detector.lane_map_scale
+    self.interval = interval
+    self.scale = scale
+    self.smoothing = smoothing
+    self.match_distance = match_distance
+    self.confirm_after = confirm_after
+    self.max_misses = max_misses
+
+    # Each line is kept as its x on two reference rows (bottom and middle of the frame),
+    # so segments of the same marking compare equal however Hough cut them
+    height = self.frame.shape[0]
+    self.reference_rows = np.array([height - 1, height // 2], dtype=float)
+    self._lines = self._merge_duplicates(self._to_params(lanes_detector.lines()))
+    self._misses = np.zeros(len(self._lines), dtype=int)
+    self._candidates = np.empty((0, 2))
+    self._candidate_hits = np.empty((0,), dtype=int)
+
+    self.current = None  # the published LaneDetector, replaced whole on every merge
+    self._publish()
+
+    self.redetections = 0
+    self.last_ms = 0.0
+    self.max_ms = 0.0
+    self.total_ms = 0.0
+    self.submit_max_ms = 0.0
+    self.drift_px = 0.0  # mean distance between the last detection and the lines it matched
+    self.max_drift_px = 0.0
+    self.error = None
+
+    self._lock = threading.Lock()
+    self._wake = threading.Event()
+    self._pending_frame = None
+    self._closed = False
+    self._started_at = None
+    self._next_run = None
+    self._thread = threading.Thread(target=self._run, name="lane-model", daemon=True)
+
+  @property
+  def lanes(self):
+    return self.current.lanes
+
+  @property
+  def lane_spaces(self):
+    return self.current.lane_spaces
+
+  def get_lane_numbers(self, points):
+    return self.current.get_lane_numbers(points)
+
+  def get_lane_number(self, x_position, y_position=None):
+    return self.current.get_lane_number(x_position, y_position)
+
+  def display_lane(self, frame, in_place=False):
+    return self.current.display_lane(frame, in_place)
+
+  def start(self):
+    self._started_at = time.monotonic()
+    self._next_run = self._started_at + self.interval
+    self._thread.start()
+
+  def close(self):
+    self._closed = True
+    self._wake.set()
+    if self._thread.is_alive():
+      self._thread.join()
+
+  def submit(self, frame):
+    """
+    Offer the latest frame. Cheap unless a re-detection is due, in which case
+    a downsampled copy is handed to the worker. Returns True if it was taken.
+    """
+    if self._next_run is None or time.monotonic() < self._next_run or self._pending_frame is not None:
+      return False
+
+    start = time.monotonic()
+    small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+    with self._lock:
+      self._pending_frame = small
+    self._next_run = start + self.interval
+    self._wake.set()
+    self.submit_max_ms = max(self.submit_max_ms, (time.monotonic() - start) * 1000)
+    return True
+
+  def stats(self):
+    elapsed = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+    return {
+      'redetections': self.redetections,
+      'lines': len(self._lines),
+      'last_ms': self.last_ms,
+      'mean_ms': self.total_ms / self.redetections if self.redetections else 0.0,
+      'max_ms': self.max_ms,
+      'submit_max_ms': self.submit_max_ms,
+      'busy_fraction': self.total_ms / 1000 / elapsed if elapsed > 0 else 0.0,
+      'drift_px': self.drift_px,
+      'max_drift_px': self.max_drift_px,
+    }
+
+  def format_stats(self):
+    s = self.stats()
+    return (f"Lanes: {s['redetections']} re-detections, {s['lines']} lines, "
+            f"{s['mean_ms']:.1f} ms mean / {s['max_ms']:.1f} ms max, "
+            f"{s['busy_fraction'] * 100:.2f}% of run time, "
+            f"drift {s['drift_px']:.1f} px (max {s['max_drift_px']:.1f} px)")
+
+  def _run(self):
+    while True:
+      self._wake.wait()
+      self._wake.clear()
+      if self._closed:
+        return
+
+      with self._lock:
+        frame, self._pending_frame = self._pending_frame, None
+      if frame is None:
+        continue
+
+      start = time.monotonic()
+      try:
+        lines = LaneDetector.find_lines(frame, self.scale)
+        self.update(np.array(lines, dtype=float).reshape(-1, 4) / self.scale)
+      except Exception as error:
+        # Keep tracking with the lanes we have
+        self.error = error
+        print(f"Lane re-detection failed: {error!r}")
+        continue
+
+      elapsed_ms = (time.monotonic() - start) * 1000
+      self.redetections += 1
+      self.last_ms = elapsed_ms
+      self.total_ms += elapsed_ms
+      self.max_ms = max(self.max_ms, elapsed_ms)
+
+  def update(self, lines):
+    """Merge freshly detected [x1, y1, x2, y2] lines (full-frame coordinates) and publish the result."""
+    detected = self._merge_duplicates(self._to_params(lines))
+    rows, cols = self._match(self._lines, detected)
+
+    # Matched lines move part of the way towards the new detection
+    if len(rows) > 0:
+      error = detected[cols] - self._lines[rows]
+      self.drift_px = float(np.abs(error).mean())
+      self.max_drift_px = max(self.max_drift_px, self.drift_px)
+      self._lines[rows] += self.smoothing * error
+
+    # Lines not seen this time are dropped after max_misses detections in a row
+    missed = np.ones(len(self._lines), dtype=bool)
+    missed[rows] = False
+    self._misses[missed] += 1
+    self._misses[~missed] = 0
+    keep = self._misses < self.max_misses
+
+    # New lines must be seen confirm_after times in a row before they count
+    new = np.ones(len(detected), dtype=bool)
+    new[cols] = False
+    self._add_candidates(detected[new])
+    confirmed = self._candidate_hits >= self.confirm_after
+
+    self._lines = np.concatenate([self._lines[keep], self._candidates[confirmed]])
+    self._misses = np.concatenate([self._misses[keep], np.zeros(int(confirmed.sum()), dtype=int)])
+    self._candidates = self._candidates[~confirmed]
+    self._candidate_hits = self._candidate_hits[~confirmed]
+
+    order = np.argsort(self._lines[:, 0], kind='stable')
+    self._lines, self._misses = self._lines[order], self._misses[order]
+    self._publish()
+
+  def _add_candidates(self, unmatched):
+    rows, cols = self._match(self._candidates, unmatched)
+    seen = np.zeros(len(self._candidates), dtype=bool)
+    seen[rows] = True
+    self._candidates[rows] = unmatched[cols]
+    self._candidate_hits[rows] += 1
+
+    new = np.ones(len(unmatched), dtype=bool)
+    new[cols] = False
+    self._candidates = np.concatenate([self._candidates[seen], unmatched[new]])
+    self._candidate_hits = np.concatenate([self._candidate_hits[seen], np.ones(int(new.sum()), dtype=int)])
+
+  def _publish(self):
+    height = self.frame.shape[0]
+    bottom, middle = self.reference_rows
+    x_bottom = self._lines[:, 0]
+    x_top = x_bottom + (self._lines[:, 1] - x_bottom) * bottom / (bottom - middle)  # extrapolated to row 0
+    lines = [[int(round(xb)), int(height - 1), int(round(xt)), 0] for xb, xt in zip(x_bottom, x_top)]
+    self.current = LaneDetector.from_lines(self.frame, lines, lane_map_scale=self.lane_map_scale)
+
+  def _to_params(self, lines):
+    """[x1, y1, x2, y2] lines -> (N, 2) array of their x on the reference rows."""
+    lines = np.asarray(lines, dtype=float).reshape(-1, 4)
+    x1, y1, x2, y2 = lines.T
+    dy = np.where(y2 != y1, y2 - y1, 1)
+    slope = np.where(y2 != y1, (x2 - x1) / dy, 0)
+    return x1[:, None] + (self.reference_rows[None, :] - y1[:, None]) * slope[:, None]
+
+  def _merge_duplicates(self, params):
+    """Average lines closer than match_distance, which are pieces of the same marking."""
+    params = params[np.argsort(params[:, 0], kind='stable')]
+    merged = []
+    for line in params:
+      if merged and np.abs(line - merged[-1][-1]).mean() < self.match_distance:
+        merged[-1].append(line)
+      else:
+        merged.append([line])
+    return np.array([np.mean(group, axis=0) for group in merged]).reshape(-1, 2)
+
+  def _match(self, current, detected):
+    """Greedy nearest-first matching of two small line sets; returns matched (current, detected) indices."""
+    if len(current) == 0 or len(detected) == 0:
+      return np.empty((0,), dtype=int), np.empty((0,), dtype=int)
+
+    distance = np.abs(current[:, None, :] - detected[None, :, :]).mean(axis=2)
+    rows, cols = [], []
+    for flat in np.argsort(distance, axis=None):
+      row, col = np.unravel_index(flat, distance.shape)
+      if distance[row, col] >= self.match_distance:
+        break
+      if row not in rows and col not in cols:
+        rows.append(row)
+        cols.append(col)
+    return np.array(rows, dtype=int), np.array(cols, dtype=int)
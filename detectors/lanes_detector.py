@@ -1,88 +1,176 @@
 import cv2
 import numpy as np
 
+def lane_spaces_key(lane_spaces):
+  """
+  Hashable summary of the lane geometry in `lane_spaces`, for caches of
+  anything derived from the lanes. It compares equal exactly when the lanes
+  are the same, unlike id(), which a new lane list can reuse after the old
+  one is garbage collected.
+  """
+  def line_key(line):
+    return None if line is None else tuple(line[0])
+  return tuple((space['lane_number'], line_key(space['left_line']), line_key(space['right_line']))
+               for space in lane_spaces)
+
 class LaneDetector:
-  def __init__(self, frame):
+  def __init__(self, frame, lane_map_scale=4):
     self.frame = frame
     self.lanes = []
     self.lane_colors = {}
     self.lane_spaces = []
+    self.lane_map = None  # Downsampled per-pixel lane numbers, built from the lane lines
+    self.lane_map_scale = lane_map_scale
+    
+  @classmethod
+  def from_lines(cls, frame, lines, lane_map_scale=4):
+    """Build a detector for `frame` from lane lines found earlier, without running detection."""
+    lanes_detector = cls(frame, lane_map_scale=lane_map_scale)
+    lanes_detector.set_lines(lines)
+    return lanes_detector
     
   def detect(self):
-    detect_lanes = []
+    lines = self.find_lines(self.frame)
+    
+    if lines:
+      self.set_lines(lines)
+    else:
+      print("No lines detected")
+      
+  @staticmethod
+  def find_lines(frame, scale=1.0):
+    """
+    Find lane lines with Canny + HoughLinesP and group nearby segments.
     
-    gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+    Args:
+        frame: BGR image to search
+        scale: How much `frame` was resized from full resolution; the Hough
+            and grouping distances are scaled by it so a downsampled frame
+            finds the same lines
+            
+    Returns:
+        One [x1, y1, x2, y2] line per lane marking in `frame` coordinates,
+        bottom point first, sorted by x1
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     gray = cv2.GaussianBlur(gray, (1, 1), 0)
     edges = cv2.Canny(gray, 50, 70)
-    lines = cv2.HoughLinesP(edges, 1, np.pi/180, 100, minLineLength=300, maxLineGap=250)
-
-    if lines is not None:
-      grouped_lines = []
-      for line in lines:
-        x1, y1, x2, y2 = line[0]
-        
-        # Make sure y1 is always at the bottom (larger y value) and y2 at the top (smaller y value)
-        if y1 < y2:
-            x1, y1, x2, y2 = x2, y2, x1, y1
-            
-        if x2 != x1:
-          angle = np.degrees(np.arctan((y2-y1)/(x2-x1)))
-        else:
-          angle = 90
+    lines = cv2.HoughLinesP(edges, 1, np.pi/180, max(1, int(100 * scale)),
+                            minLineLength=300 * scale, maxLineGap=250 * scale)
+    
+    if lines is None:
+      return []
+    
+    return LaneDetector.group_segments(lines.reshape(-1, 4), frame.shape[0], scale)
+  
+  @staticmethod
+  def group_segments(segments, height, scale=1.0, max_angle=40, max_gap=100, max_angle_jump=15):
+    """
+    Group Hough segments into lane lines with whole-array operations.
+    
+    Segments leaning more than `max_angle` degrees from vertical are dropped.
+    The rest are sorted by where they cross the bottom row of the frame and
+    split into groups wherever that crossing jumps by more than `max_gap`
+    pixels (times `scale`) or the lean by more than `max_angle_jump` degrees.
+    Each group is fitted with one line through all of its endpoints,
+    weighted by segment length.
+    
+    Args:
+        segments: (N, 4) array of [x1, y1, x2, y2] segments
+        height: Frame height in pixels
+        scale: Frame downsampling factor, see find_lines
         
-        if abs(angle) > 50:
-          found_group = False
-          for group in grouped_lines:
-            group_x1, group_y1, group_x2, group_y2 = group[0]
-            group_angle = np.degrees(np.arctan((group_y2-group_y1)/(group_x2-group_x1))) if group_x2 != group_x1 else 90
-            
-            if abs(angle - group_angle) < 15 and np.sqrt((x1-group_x1)**2 + (y1-group_y1)**2) < 100:
-              group.append([x1, y1, x2, y2])  # Store the sorted coordinates
-              found_group = True
-              break
-          
-          if not found_group:
-            grouped_lines.append([[x1, y1, x2, y2]])  # Store the sorted coordinates
-      
-      # Store the grouped lines as lanes
-      for group in grouped_lines:
-        detect_lanes.append([group[0]])
+    Returns:
+        One [x1, y1, x2, y2] line per group, bottom point first, sorted by x1
+    """
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+    
+    # Make sure y1 is always at the bottom (larger y value) and y2 at the top (smaller y value)
+    flip = segments[:, 1] < segments[:, 3]
+    segments[flip] = segments[flip][:, [2, 3, 0, 1]]
+    x1, y1, x2, y2 = segments.T
+    
+    # Lean from vertical; near-vertical lines are what a lane camera sees
+    lean = np.degrees(np.arctan2(x2 - x1, y1 - y2))
+    steep = np.abs(lean) < max_angle
+    if not steep.any():
+      return []
+    segments, lean = segments[steep], lean[steep]
+    x1, y1, x2, y2 = segments.T
+    
+    # Where each segment crosses the bottom row, the anchor used for grouping
+    slope = (x2 - x1) / np.where(y1 != y2, y1 - y2, 1)  # dx per row going up
+    anchor = x1 - (height - 1 - y1) * slope
+    
+    order = np.argsort(anchor, kind='stable')
+    segments, lean, anchor = segments[order], lean[order], anchor[order]
+    breaks = (np.diff(anchor) > max_gap * scale) | (np.abs(np.diff(lean)) > max_angle_jump)
+    starts = np.concatenate([[0], np.nonzero(breaks)[0] + 1])
+    
+    # Weighted least squares fit of x = a * y + b over both endpoints of every segment in a group
+    x1, y1, x2, y2 = segments.T
+    weight = np.maximum(np.hypot(x2 - x1, y2 - y1), 1)
+    sums = [
+      np.add.reduceat(weight * (v1 + v2), starts) for v1, v2 in
+      ((np.ones_like(y1), np.ones_like(y2)), (y1, y2), (y1 * y1, y2 * y2), (x1, x2), (x1 * y1, x2 * y2))
+    ]
+    n, sy, syy, sx, sxy = sums
+    det = n * syy - sy * sy
+    a = np.where(det > 0, (n * sxy - sy * sx) / np.where(det > 0, det, 1), 0)
+    b = (sx - a * sy) / n
+    
+    bottom = np.maximum.reduceat(y1, starts)
+    top = np.minimum.reduceat(y2, starts)
+    lines = np.stack([a * bottom + b, bottom, a * top + b, top], axis=1)
+    
+    detect_lines = np.rint(lines).astype(int).tolist()
+    detect_lines.sort(key=lambda line: line[0])  # Sort by x1 value
+    return detect_lines
+  
+  def set_lines(self, lines):
+    """Use `lines` ([x1, y1, x2, y2] each, sorted by x1) as the lane lines and rebuild the lane spaces."""
+    self.lanes = [[list(line)] for line in lines]
+    self.lane_spaces = []
+    
+    if not self.lanes:
+      self.build_lane_map()
+      return
+    
+    # Leftmost lane (from left edge of image to first line)
+    self.lane_spaces.append({
+        'lane_number': 1,
+        'left_line': None,
+        'right_line': self.lanes[0]
+    })
+    
+    # Middle lanes (between detected lines)
+    for i in range(len(self.lanes)-1):
+        lane_number = i + 2
+        left_line = self.lanes[i]
+        right_line = self.lanes[i+1]
+        self.lane_spaces.append({
+            'lane_number': lane_number,
+            'left_line': left_line,
+            'right_line': right_line
+        })
         
-      self.lanes = detect_lanes
-      self.lanes.sort(key=lambda lane: lane[0][0])  # Sort by x1 value
-      
-      self.lane_spaces = []
-      
-      # Leftmost lane (from left edge of image to first line)
-      self.lane_spaces.append({
-          'lane_number': 1,
-          'left_line': None,
-          'right_line': self.lanes[0]
-      })
-      
-      # Middle lanes (between detected lines)
-      for i in range(len(self.lanes)-1):
-          lane_number = i + 2
-          left_line = self.lanes[i]
-          right_line = self.lanes[i+1]
-          self.lane_spaces.append({
-              'lane_number': lane_number,
-              'left_line': left_line,
-              'right_line': right_line
-          })
-          
-      # Rightmost lane (from last line to right edge of image)
-      self.lane_spaces.append({
-          'lane_number': len(self.lanes) + 1,
-          'left_line': self.lanes[-1],
-          'right_line': None
-      })
-    else:
-      print("No lines detected")
+    # Rightmost lane (from last line to right edge of image)
+    self.lane_spaces.append({
+        'lane_number': len(self.lanes) + 1,
+        'left_line': self.lanes[-1],
+        'right_line': None
+    })
+    
+    self.build_lane_map()
+    
+  def lines(self):
+    """The current lane lines as a list of [x1, y1, x2, y2]."""
+    return [list(lane[0]) for lane in self.lanes]
       
   # Update to the display_lane method
-  def display_lane(self, frame):
-      result_frame = frame.copy()
+  def display_lane(self, frame, in_place=False):
+      # Draw on the caller's frame when it owns it, which saves a full-frame copy per frame
+      result_frame = frame if in_place else frame.copy()
       
       # Draw all lane lines first
       for i, lane in enumerate(self.lanes):
@@ -133,28 +221,69 @@ class LaneDetector:
       
       return result_frame
       
-  def get_lane_number(self, x_position):
-      """Determine which lane a point is in based on its x-coordinate."""
-      for lane_space in self.lane_spaces:
-          lane_number = lane_space['lane_number']
-          left_line = lane_space['left_line']
-          right_line = lane_space['right_line']
-          
-          # Calculate lane boundaries
-          if left_line is None:
-              # Leftmost lane
-              left_x = 0
-              right_x = right_line[0][0]
-          elif right_line is None:
-              # Rightmost lane
-              left_x = left_line[0][0]
-              right_x = self.frame.shape[1]
-          else:
-              # Regular lanes between two lines
-              left_x = left_line[0][0]
-              right_x = right_line[0][0]
+  def line_x_at(self, y_positions):
+      """
+      X-coordinate of every lane line at each of the given rows, following the
+      full (extrapolated) line rather than only its bottom point.
+      
+      Returns:
+          Array of shape (len(y_positions), number of lines)
+      """
+      lines = np.array([lane[0] for lane in self.lanes], dtype=float).reshape(-1, 4)
+      x1, y1, x2, y2 = lines.T
+      dy = np.where(y2 != y1, y2 - y1, 1)
+      slope = np.where(y2 != y1, (x2 - x1) / dy, 0)  # dx per row
+      y_positions = np.asarray(y_positions, dtype=float)
+      return x1[None, :] + (y_positions[:, None] - y1[None, :]) * slope[None, :]
+  
+  def build_lane_map(self):
+      """
+      Precompute a downsampled label image with the lane number of every
+      cell, so lane lookups are a single array index. A cell's lane is one
+      more than the number of lane lines to its left on that row, which
+      matches the numbering of lane_spaces at the bottom of the frame.
+      """
+      if not self.lane_spaces:
+          self.lane_map = None
+          return
+      
+      height, width = self.frame.shape[:2]
+      scale = self.lane_map_scale
+      rows = np.arange(0, height, scale) + (scale - 1) / 2
+      cols = np.arange(0, width, scale) + (scale - 1) / 2
+      
+      boundaries = self.line_x_at(rows)  # (rows, lines)
+      lines_left = (boundaries[:, None, :] < cols[None, :, None]).sum(axis=2)
+      self.lane_map = (lines_left + 1).astype(np.uint8)
+  
+  def get_lane_numbers(self, points):
+      """
+      Look up the lane of many (x, y) points at once.
+      
+      Args:
+          points: Array-like of shape (N, 2) with x, y frame coordinates
           
-          if left_x <= x_position <= right_x:
-              return lane_number
-              
-      return 0  # Not in any recognized lane
+      Returns:
+          Int array of N lane numbers, 0 for points left or right of the frame or when no
+          lanes were detected. Points above or below the frame use its top or bottom row.
+      """
+      points = np.asarray(points, dtype=float).reshape(-1, 2)
+      lanes = np.zeros(len(points), dtype=int)
+      if self.lane_map is None:
+          return lanes
+      
+      height, width = self.frame.shape[:2]
+      x, y = points[:, 0], points[:, 1]
+      inside = (x >= 0) & (x <= width)
+      
+      scale = self.lane_map_scale
+      col = np.minimum(x[inside] // scale, self.lane_map.shape[1] - 1).astype(int)
+      row = np.clip(y[inside] // scale, 0, self.lane_map.shape[0] - 1).astype(int)
+      lanes[inside] = self.lane_map[row, col]
+      return lanes
+  
+  def get_lane_number(self, x_position, y_position=None):
+      """Determine which lane a point is in (on the bottom row of the frame if no y is given)."""
+      if y_position is None:
+          y_position = self.frame.shape[0] - 1
+      return int(self.get_lane_numbers([[x_position, y_position]])[0])
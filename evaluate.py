@@ -0,0 +1,143 @@
+import argparse
+import csv
+import itertools
+import os
+import time
+import cv2
+from detectors import LaneDetector
+from pipeline import FramePipeline, FrameSkipPolicy, RoiCapture, TollBilling
+from trackers import Sort
+from utils import (
+  billed_counts, count_error_table, count_errors, fee_errors, get_roi_start, load_lane_vehicle_counts, pareto_front,
+  truth_from_passed
+)
+
+SETTING_KEYS = ['detect_every', 'roi_scale', 'max_age', 'min_hits', 'conf']
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(
+    description="Sweep pipeline settings over a clip or recorded detections and compare the billed counts "
+                "with ground truth, as a speed/accuracy Pareto table"
+  )
+  source = parser.add_mutually_exclusive_group(required=True)
+  source.add_argument("--video", help="Clip to run the full pipeline on (needs --model)")
+  source.add_argument("--recording", help="Detections recorded with benchmarks.replay, replayed without a model")
+  parser.add_argument("--model", default="models/vehicle_tracker_model.pt", help="YOLO model weights")
+  parser.add_argument("--truth", default=None,
+                      help="Hand-counted lane summary (default: the vehicles a synthetic recording knows passed, "
+                           "else outputs/real_lane_vehicle_counts.csv)")
+  parser.add_argument("--detect-every", type=int, nargs="+", default=[1], help="Detector intervals to try")
+  parser.add_argument("--roi-scale", type=float, nargs="+", default=[None],
+                      help="ROI resolutions to try (video only), e.g. 1 0.75 0.5")
+  parser.add_argument("--max-age", type=int, nargs="+", default=[1], help="SORT max_age values to try")
+  parser.add_argument("--min-hits", type=int, nargs="+", default=[3], help="SORT min_hits values to try")
+  parser.add_argument("--conf", type=float, nargs="+", default=[0.5], help="Confidence thresholds to try")
+  parser.add_argument("--out", default=None, help="Write one CSV row per setting here")
+  parser.add_argument("--details", default=None, help="Write per-lane/class counts of every setting here")
+  args = parser.parse_args()
+
+  if args.recording and args.roi_scale != [None]:
+    parser.error("--roi-scale needs --video, recorded detections were made at one resolution")
+  return args
+
+
+def run_video(video, vehicle_tracker, lines, setting):
+  cap = cv2.VideoCapture(video)
+  first_frame = cap.read()[1]
+  billing = TollBilling(LaneDetector.from_lines(first_frame, lines))
+  if setting['roi_scale'] is not None:
+    cap = RoiCapture(cap, first_frame.shape, get_roi_start(first_frame.shape[0]), scale=setting['roi_scale'])
+  skip_policy = FrameSkipPolicy(setting['detect_every']) if setting['detect_every'] > 1 else None
+  tracker = Sort(max_age=setting['max_age'], min_hits=setting['min_hits'])
+
+  pipeline = FramePipeline(cap, vehicle_tracker, tracker, billing, render=False,
+                           conf_threshold=setting['conf'], skip_policy=skip_policy)
+  start = time.perf_counter()
+  pipeline.start()
+  pipeline.join()
+  elapsed = time.perf_counter() - start
+  cap.release()
+  return billing, pipeline.tracking_stage.stats.count / elapsed
+
+
+def run_recording(recording, setting):
+  from benchmarks.replay import replay
+  _, billing, elapsed = replay(recording, conf=setting['conf'], max_age=setting['max_age'],
+                               min_hits=setting['min_hits'], detect_every=setting['detect_every'])
+  return billing, len(recording) / elapsed
+
+
+def format_setting(setting):
+  scale = "full" if setting['roi_scale'] is None else f"{setting['roi_scale']:g}"
+  return (f"{setting['detect_every']:>6} {scale:>6} {setting['max_age']:>7} {setting['min_hits']:>8} "
+          f"{setting['conf']:>5.2f}")
+
+
+def describe(setting):
+  scale = "full frames" if setting['roi_scale'] is None else f"ROI scale {setting['roi_scale']:g}"
+  return (f"detector every {setting['detect_every']} frames, {scale}, max_age {setting['max_age']}, "
+          f"min_hits {setting['min_hits']}, conf {setting['conf']:g}")
+
+
+if __name__ == "__main__":
+  args = parse_args()
+
+  if args.recording:
+    from benchmarks.recording import Recording
+    recording = Recording.load(args.recording)
+    run = lambda setting: run_recording(recording, setting)
+  else:
+    from trackers import VehicleTracker
+    vehicle_tracker = VehicleTracker(model_path=args.model)
+    # Detect lanes once so every setting bills against the same lanes
+    lanes_detector = LaneDetector(cv2.VideoCapture(args.video).read()[1])
+    lanes_detector.detect()
+    run = lambda setting: run_video(args.video, vehicle_tracker, lanes_detector.lines(), setting)
+
+  if args.truth is None and args.recording and recording.passed is not None:
+    truth = truth_from_passed(recording.passed)
+  else:
+    truth = load_lane_vehicle_counts(args.truth or "outputs/real_lane_vehicle_counts.csv")
+
+  rows = []
+  details = []
+  for values in itertools.product(args.detect_every, args.roi_scale, args.max_age, args.min_hits, args.conf):
+    setting = dict(zip(SETTING_KEYS, values))
+    billing, fps = run(setting)
+    counts = billed_counts(billing.detection_history)
+    count_error, total_error = count_errors(counts, truth)
+    fee_error, total_fee_error = fee_errors(counts, truth)
+    rows.append(dict(setting, fps=fps, billed=len(billing.detection_history), count_error=count_error,
+                     total_error=total_error, fee_error=fee_error, total_fee_error=total_fee_error))
+    details += [dict(setting, lane=lane, vehicle_type=v_type, counted=counted, truth=expected, error=error)
+                for lane, v_type, counted, expected, error in count_error_table(counts, truth)]
+    print(f"{describe(setting)}: {fps:.1f} frames/s, lane/class error {count_error}, fee error {fee_error}")
+
+  front = set(pareto_front(rows, 'fps', 'count_error'))
+  print()
+  print(f"{'every':>6} {'scale':>6} {'max_age':>7} {'min_hits':>8} {'conf':>5} {'frames/s':>9} {'billed':>7} "
+        f"{'lane/class err':>15} {'total err':>10} {'fee err':>8} {'total fee err':>14}  pareto")
+  order = sorted(range(len(rows)), key=lambda i: -rows[i]['fps'])
+  for i in order:
+    row = rows[i]
+    print(f"{format_setting(row)} {row['fps']:>9.1f} {row['billed']:>7} {row['count_error']:>15} "
+          f"{row['total_error']:>+10} {row['fee_error']:>8} {row['total_fee_error']:>+14}  {'*' if i in front else ''}")
+
+  correct = [i for i in order if rows[i]['fee_error'] == 0]
+  if correct:
+    print(f"\nFastest setting that bills every lane correctly: {describe(rows[correct[0]])} "
+          f"({rows[correct[0]]['fps']:.1f} frames/s)")
+  else:
+    best = min(order, key=lambda i: (rows[i]['fee_error'], rows[i]['count_error']))
+    print(f"\nNo setting bills every lane correctly; the closest is {describe(rows[best])} "
+          f"(fee error {rows[best]['fee_error']})")
+
+  for path, table in ((args.out, rows), (args.details, details)):
+    if path:
+      os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+      with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(table[0]))
+        writer.writeheader()
+        writer.writerows(table)
+      print(f"Saved {path}")
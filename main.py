@@ -1,217 +1,231 @@
-import math
+import argparse
 import os
+import time
 import cv2
-import cvzone
-import numpy as np
-import datetime
-from trackers import VehicleTracker, Sort
-from detectors import LaneDetector
-from constants import CLASS_NAMES
-from utils import calculate_toll_fee, save_detection_history_to_csv
+from trackers import VehicleTracker, Sort, BatchSort
+from detectors import IncrementalLaneModel, LaneCalibrationCache
+from pipeline import (
+  BillingEventStream, FramePipeline, FrameSkipPolicy, HttpSink, JsonlSink, LaneCropper, Metrics, MetricsLogger,
+  MetricsServer, MotionGate, RoiCapture, SharedFrameCapture, SqliteSink, TollBilling
+)
+from utils import DetectionHistory, DetectionHistoryWriter, DetectionStore, get_roi_start
 from utils.display_utils import (
     draw_detection_boundary, 
+    draw_tracking_overlay,
     display_detection_history_window
 )
 
 
+def parse_args():
+  parser = argparse.ArgumentParser(description="Detect, track and bill vehicles at a toll plaza")
+  parser.add_argument("--video", default="input_videos/input_video.mp4", help="Video file or stream URL")
+  parser.add_argument("--model", default="models/vehicle_tracker_model.pt", help="YOLO model weights")
+  parser.add_argument("--conf", type=float, default=0.5, help="Minimum detection confidence")
+  parser.add_argument("--headless", action="store_true",
+                      help="Skip all overlay drawing and windows, only produce billing records and counts")
+  parser.add_argument("--tracker", choices=["sort", "batch"], default="sort",
+                      help="SORT engine: one Kalman filter per track, or all tracks vectorized in one batch")
+  parser.add_argument("--class-votes", action="store_true",
+                      help="Bill each vehicle as the class most confidently detected over its track, not the last one")
+  parser.add_argument("--batch-size", type=int, default=1, help="Frames per inference batch")
+  parser.add_argument("--max-wait", type=float, default=0.05, help="Max seconds a frame waits for its batch to fill")
+  parser.add_argument("--queue-size", type=int, default=8, help="Capacity of each pipeline queue")
+  parser.add_argument("--history-window", type=int, default=5000,
+                      help="Billing records kept in memory, older ones are spilled to outputs/")
+  parser.add_argument("--history-db", default=None,
+                      help="Keep billing records in this SQLite database instead of memory; the history panel "
+                           "reads from it and earlier runs stay queryable")
+  parser.add_argument("--policy", choices=["block", "drop_oldest"], default="block",
+                      help="What to do when inference falls behind decode (drop_oldest for live feeds)")
+  parser.add_argument("--decode-process", action="store_true",
+                      help="Decode in a separate process into shared-memory frame slots")
+  parser.add_argument("--camera-id", default=None,
+                      help="Camera name for the saved lane calibration (default: the video file name)")
+  parser.add_argument("--calibration-dir", default="outputs/lane_calibration", help="Where lane calibrations are saved")
+  parser.add_argument("--recalibrate", action="store_true",
+                      help="Detect lanes even if a saved calibration still matches the scene")
+  parser.add_argument("--lane-refresh", type=float, default=0,
+                      help="Re-detect lanes in the background every N seconds and smooth them in (0 to detect once)")
+  parser.add_argument("--detect-every", type=int, default=1,
+                      help="Run the detector on every N-th frame and advance tracks by prediction in between")
+  parser.add_argument("--adaptive-skip", action="store_true",
+                      help="Pick the detector interval from track speed and count, up to --detect-every")
+  parser.add_argument("--motion-gate", action="store_true",
+                      help="Only run the detector when a lane shows motion or vehicles are still tracked")
+  parser.add_argument("--lane-crops", action="store_true",
+                      help="Run the detector on crops of the busy lanes instead of the whole ROI when traffic is sparse")
+  parser.add_argument("--metrics-port", type=int, default=None,
+                      help="Serve per-stage timings and counters for Prometheus on http://127.0.0.1:PORT/metrics")
+  parser.add_argument("--metrics-log", default=None,
+                      help="Append per-stage timings and counters to this file as one JSON line per interval")
+  parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between --metrics-log lines")
+  events = parser.add_mutually_exclusive_group()
+  events.add_argument("--events-jsonl", default=None, help="Stream billing events to this JSON-lines file")
+  events.add_argument("--events-sqlite", default=None, help="Stream billing events to this SQLite database")
+  events.add_argument("--events-url", default=None,
+                      help="POST billing events in batches to this HTTP endpoint, retrying until it accepts them")
+  parser.add_argument("--roi-scale", type=float, default=None,
+                      help="Headless only: decode into reused buffers and keep just the detection region, "
+                           "resized by this factor (1 keeps full resolution)")
+  args = parser.parse_args()
+  
+  if args.roi_scale is not None:
+    if not args.headless:
+      parser.error("--roi-scale needs --headless, there are no full frames to draw on")
+    if args.decode_process or args.lane_refresh > 0:
+      parser.error("--roi-scale cannot be combined with --decode-process or --lane-refresh")
+  return args
+
+
 if __name__ == "__main__": 
+  args = parse_args()
+  
   # Load the video
-  cap = cv2.VideoCapture("input_videos/input_video.mp4")
+  cap = cv2.VideoCapture(args.video)
   
   # Load the vehicle tracker model
-  vehicle_tracker = VehicleTracker(model_path="models/vehicle_tracker_model.pt")
+  vehicle_tracker = VehicleTracker(model_path=args.model)
   
-  # Initialize the lane detector
+  # Initialize the lane detector, from the saved calibration if the scene hasn't changed
   first_frame = cap.read()[1]
-  lanes_detector = LaneDetector(first_frame)
-  lanes_detector.detect()
+  camera_id = args.camera_id or os.path.splitext(os.path.basename(args.video))[0]
+  calibration = LaneCalibrationCache(args.calibration_dir)
+  lanes_detector, lanes_source, similarity = calibration.load_or_detect(camera_id, first_frame, refresh=args.recalibrate)
+  if similarity is not None:
+    print(f"Lanes for camera '{camera_id}': {lanes_source} (scene similarity {similarity:.2f})")
+  else:
+    print(f"Lanes for camera '{camera_id}': {lanes_source}")
+  
+  # Optionally keep the lanes up to date, so a bad first frame doesn't spoil the whole run
+  lane_model = None
+  if args.lane_refresh > 0:
+    lane_model = IncrementalLaneModel(lanes_detector, interval=args.lane_refresh)
+    lanes_detector = lane_model
   
   # Initialize the SORT tracker
-  tracker = Sort()
+  tracker_class = BatchSort if args.tracker == "batch" else Sort
+  tracker = tracker_class(class_votes=args.class_votes)
   
-  # Add tracking variables
-  active_vehicles = {}  # {id: {'type': class_name, 'lane': lane_number, 'first_detected': timestamp, 'passed_threshold': bool}}
-  disappeared_vehicles = {}  # {lane_number: [(id, type), ...]}
-  vehicle_classes = {}  # {id: class_name}
-  detection_history = []  # List of detection records with timestamp and payment status
+  # Vehicle bookkeeping and billing (active vehicles, classes, detection history)
+  if args.history_db:
+    # Written in batches on the store's own thread, so memory stays flat over a shift
+    detection_history = DetectionStore(args.history_db)
+  else:
+    detection_history = DetectionHistory(
+      max_records=args.history_window, spill_path="outputs/detection_history_spill.csv"
+    )
+  # Stage timers and counters cost next to nothing unless they are exported
+  metrics = Metrics(enabled=args.metrics_port is not None or args.metrics_log is not None)
+  
+  # Optionally publish each billed vehicle to a downstream sink, off the tracking thread
+  event_stream = None
+  if args.events_jsonl or args.events_sqlite or args.events_url:
+    if args.events_jsonl:
+      sink = JsonlSink(args.events_jsonl)
+    elif args.events_sqlite:
+      sink = SqliteSink(args.events_sqlite)
+    else:
+      sink = HttpSink(args.events_url)
+    # Events the sink never accepted are kept for the next run of this camera
+    event_stream = BillingEventStream(
+      sink, camera_id=camera_id, spill_path=f"outputs/undelivered_billing_events_{camera_id}.jsonl"
+    ).start()
+  billing = TollBilling(lanes_detector, detection_history, metrics=metrics, events=event_stream)
   selected_lane = 0  # 0 means show all lanes, 1-5 means filter by lane
   
-  while cap.isOpened():
-    status, frame = cap.read()
-    
-    if not status:
-      break
-    
-    # Store previous frame's active IDs
-    previous_active_ids = set(active_vehicles.keys())
-    
-    # Get frame dimensions
-    height, width = frame.shape[:2]
-    
-    # Create a copy of the frame
-    detection_frame = frame.copy()
-    # Create a region of interest
-    roi_start = (height // 2) + 50
-    roi = detection_frame[roi_start:height, 0:width]
-
-    frame = lanes_detector.display_lane(frame)
-       
-    results = vehicle_tracker.track(roi)
-    detections = np.empty((0, 5))
-    
-    # Get current timestamp for new detections
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Track vehicles
-    for r in results:
-      boxes = r.boxes
-      for box in boxes:
-        x1, y1, x2, y2 = box.xyxy[0]
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-        
-        # Adjust y-coordinates to account for the ROI offset
-        y1 = y1 + roi_start
-        y2 = y2 + roi_start
-        
-        cls = int(box.cls[0])
-        
-        conf = math.ceil(box.conf[0] * 100) / 100
-        if conf > 0.5:
-          cvzone.putTextRect(frame, f"{CLASS_NAMES[cls]}", (x1, y2+20), 1, 1, offset=5)
-          current_array = np.array([x1, y1, x2, y2, conf])
-          detections = np.vstack([detections, current_array])
-          
-    trackers = tracker.update(detections)
-    
-    # Clear current active vehicles and update with current frame data
-    current_active_vehicles = {}
-    
-    for track in trackers:
-      x1, y1, x2, y2, id = track
-      x1, y1, x2, y2, id = int(x1), int(y1), int(x2), int(y2), int(id)
-      w, h = x2 - x1, y2 - y1 
-      
-      # Display vehicle ID
-      cvzone.putTextRect(frame, f"ID: {id}", (x1, y1-20), 1, 1, offset=5)
-      cvzone.cornerRect(frame, (x1, y1, w, h), 10, rt=1)
-      
-      # Check if vehicle has passed the ROI threshold (50 pixels below roi_start)
-      passed_threshold = y2 > (roi_start + 100)
-      
-      # Determine vehicle class from closest detection
-      vehicle_class = None
-      center_x = (x1 + x2) // 2
-      
-      # Find the vehicle class
-      min_distance = float('inf')
-      for i, det in enumerate(detections):
-        det_x1, det_y1, det_x2, det_y2, _ = det
-        det_center_x = (det_x1 + det_x2) / 2
-        det_center_y = (det_y1 + det_y2) / 2
-        dist = ((center_x - det_center_x)**2 + ((y1+y2)/2 - det_center_y)**2)**0.5
-        if dist < min_distance and dist < 50:  # 50 pixels threshold
-          min_distance = dist
-          if i < len(r.boxes):
-            vehicle_class = CLASS_NAMES[int(r.boxes[i].cls[0])]
-      
-      if vehicle_class:
-        vehicle_classes[id] = vehicle_class
-      
-      # Determine which lane the vehicle is in
-      center_x = (x1 + x2) // 2
-      vehicle_lane = lanes_detector.get_lane_number(center_x)
-      
-      # Update active vehicles dictionary, preserving first detection time and threshold status
-      if id in active_vehicles:
-        first_detected = active_vehicles[id].get('first_detected', current_time)
-        # Keep passed_threshold as True once it's set to True
-        passed_threshold = passed_threshold or active_vehicles[id].get('passed_threshold', False)
-      else:
-        first_detected = current_time
-        
-      current_active_vehicles[id] = {
-        'type': vehicle_classes.get(id, "Unknown"),
-        'lane': vehicle_lane,
-        'first_detected': first_detected,
-        'passed_threshold': passed_threshold  # Track if vehicle has passed the required distance
-      }
-    
-    # Find disappeared vehicles
-    disappeared_ids = previous_active_ids - set(current_active_vehicles.keys())
-    
-    # Record disappeared vehicles by lane and add to detection history
-    for disappeared_id in disappeared_ids:
-      if disappeared_id in active_vehicles:
-        vehicle_info = active_vehicles[disappeared_id]
-        # Only record vehicles that have passed the threshold
-        if not vehicle_info.get('passed_threshold', False):
-            continue
-            
-        lane_number = vehicle_info['lane']
-        vehicle_type = vehicle_info['type']
-        detection_time = vehicle_info.get('first_detected', current_time)
-        
-        # Skip 2-wheel vehicles - don't record them in the history
-        if "2-wheel" in vehicle_type:
-            continue
-        
-        # Add to lane-specific disappeared vehicles
-        if lane_number not in disappeared_vehicles:
-          disappeared_vehicles[lane_number] = []
-        
-        disappeared_vehicles[lane_number].append((disappeared_id, vehicle_type))
-        
-        # Calculate toll fee based on vehicle type
-        toll_fee = calculate_toll_fee(vehicle_type)
-        
-        # Check if this ID already exists in detection_history
-        existing_record_index = next((i for i, record in enumerate(detection_history) 
-                                    if record['id'] == disappeared_id), None)
-        
-        # If ID already exists in history, update that record instead of adding a new one
-        if existing_record_index is not None:
-          detection_history[existing_record_index].update({
-            'vehicle_type': vehicle_type,
-            'lane': lane_number,
-            'time': detection_time,
-            'payment_status': "Waiting for payment",
-            'toll_fee': toll_fee
-          })
-        else:
-          # Add to detection history with payment status and toll fee
-          detection_history.append({
-            'id': disappeared_id,
-            'vehicle_type': vehicle_type,
-            'lane': lane_number,
-            'time': detection_time,
-            'payment_status': "Waiting for payment",
-            'toll_fee': toll_fee
-          })
-        
-    # Update active vehicles for next frame
-    active_vehicles = current_active_vehicles
-    
-    
-    # Save detection data to CSV when program ends
-    save_detection_history_to_csv(detection_history)
+  # Append billing records to outputs/ as they happen, lane summary on a timer and at exit
+  history_writer = DetectionHistoryWriter(window=args.history_window)
   
+  # Optionally decode in a child process, straight into shared frame slots sized from the
+  # first frame; enough slots for every queue, a full inference batch and the frame on screen
+  if args.decode_process:
+    cap.release()
+    cap = SharedFrameCapture(args.video, first_frame.shape, n_slots=3 * args.queue_size + args.batch_size + 2)
+  
+  # Or keep only the detection region, in preallocated buffers reused from frame to frame
+  if args.roi_scale is not None:
+    cap = RoiCapture(cap, first_frame.shape, get_roi_start(first_frame.shape[0]), scale=args.roi_scale,
+                     n_slots=3 * args.queue_size + args.batch_size + 2)
+  
+  # Optionally skip the detector on some frames
+  skip_policy = None
+  if args.detect_every > 1 or args.adaptive_skip:
+    skip_policy = FrameSkipPolicy(args.detect_every, adaptive=args.adaptive_skip)
+  
+  # Optionally skip inference on empty, still lanes (overnight and off-peak)
+  motion_gate = MotionGate(lanes_detector) if args.motion_gate else None
+  
+  # Optionally look only at the lanes in use (the gate's per-lane motion, if any, picks lanes too)
+  lane_cropper = LaneCropper(lanes_detector, motion_gate=motion_gate) if args.lane_crops else None
+  
+  # Run decode, inference and tracking/billing on their own threads
+  pipeline = FramePipeline(
+    cap, vehicle_tracker, tracker, billing,
+    queue_size=args.queue_size, policy=args.policy, render=not args.headless,
+    batch_size=args.batch_size, max_wait=args.max_wait, conf_threshold=args.conf,
+    history_writer=history_writer, lane_model=lane_model, skip_policy=skip_policy,
+    motion_gate=motion_gate, lane_cropper=lane_cropper, metrics=metrics
+  )
+  metrics_server = MetricsServer(metrics, args.metrics_port).start() if args.metrics_port is not None else None
+  metrics_logger = MetricsLogger(metrics, args.metrics_log, args.metrics_interval).start() if args.metrics_log else None
+  start_time = time.monotonic()
+  if lane_model is not None:
+    lane_model.start()
+  pipeline.start()
+  
+  # Render tracked frames on the main thread (nothing is yielded in headless mode)
+  for packet in pipeline.frames():
+    # The packet's frame is ours until the next iteration, so draw on it directly
+    frame = lanes_detector.display_lane(packet.frame, in_place=True)
+    frame = draw_tracking_overlay(frame, packet.detections, packet.detection_classes, packet.tracks)
+    
     # Display detection history in a separate window with lane filtering
-    display_detection_history_window(detection_history, selected_lane)
+    with metrics.timer("history_panel"):
+      display_detection_history_window(billing.detection_history, selected_lane)
     
     # Draw a horizontal line showing the detection boundary
-    frame = draw_detection_boundary(frame, roi_start, width)
+    frame = draw_detection_boundary(frame, packet.roi_start, frame.shape[1])
         
     cv2.imshow("Trollway detection", frame)
     
     # Handle keyboard input
     key = cv2.waitKey(1) & 0xFF
     if key == ord("q"):
+      pipeline.stop()
       break
     elif key == ord("0"):
       selected_lane = 0  # Show all lanes
     elif key >= ord("1") and key <= ord("5"):
       selected_lane = key - ord("0")  # Show specific lane (1-5)
   
+  try:
+    pipeline.join()
+  finally:
+    if lane_model is not None:
+      lane_model.close()
+      # The smoothed lanes are the best calibration for the next restart
+      if lane_model.lanes:
+        calibration.save(camera_id, lane_model.current, first_frame)
+    history_writer.close()
+    detection_history.close()
+    if event_stream is not None:
+      event_stream.close()
+    if metrics_logger is not None:
+      metrics_logger.close()
+    if metrics_server is not None:
+      metrics_server.close()
+  elapsed = time.monotonic() - start_time
+  
+  frame_count = pipeline.tracking_stage.stats.count
+  mode = "headless" if args.headless else "GUI"
+  print(pipeline.format_stats())
+  if event_stream is not None:
+    print(event_stream.format_stats())
+  if args.history_db:
+    print(f"Billing records of run {detection_history.run_id} kept in {args.history_db}")
+  print(f"{mode}: {frame_count} frames in {elapsed:.1f}s ({frame_count / elapsed:.1f} frames/s), "
+        f"{sum(history_writer.vehicle_counts.values())} vehicles billed")
+  
   cap.release()
-  cv2.destroyAllWindows()
-
+  if not args.headless:
+    cv2.destroyAllWindows()
@@ -0,0 +1,12 @@
+from .queues import BoundedQueue, QueueClosed
+from .metrics import Metrics, MetricsServer, MetricsLogger
+from .stages import Stage, StageStats
+from .billing import TollBilling
+from .billing_events import BillingEventStream, JsonlSink, SqliteSink, HttpSink
+from .frame_skip import FrameSkipPolicy
+from .motion_gate import MotionGate
+from .lane_crops import LaneCropper
+from .frame_ring import SharedFrameRing, SharedFrameCapture
+from .capture import RoiCapture
+from .frame_pipeline import FramePacket, FramePipeline
+from .multi_camera import MultiCameraRunner
\ No newline at end of file
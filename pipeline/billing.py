@@ -0,0 +1,129 @@
+import numpy as np
+from constants import CLASS_NAMES
+from utils import calculate_toll_fee
+from utils.detection_history import DetectionHistory
+from .metrics import Metrics
+
+
+class TollBilling:
+  """
+  Per-camera vehicle bookkeeping: follows SORT tracks from frame to frame,
+  records their vehicle class and lane, and bills each vehicle when its
+  track disappears after crossing the detection threshold. With an `events`
+  stream (BillingEventStream) every billed or re-billed vehicle is also
+  published for downstream consumers.
+  """
+  def __init__(self, lanes_detector, detection_history=None, metrics=None, events=None):
+    self.lanes_detector = lanes_detector
+    self.metrics = metrics if metrics is not None else Metrics(enabled=False)  # times lane lookups
+    self.active_vehicles = {}  # {id: {'type': class_name, 'lane': lane_number, 'first_detected': timestamp, 'passed_threshold': bool}}
+    self.disappeared_vehicles = {}  # {lane_number: [(id, type), ...]}
+    self.vehicle_classes = {}  # {id: class_name}
+    # Detection records with timestamp and payment status, indexed by id, lane and vehicle type
+    self.detection_history = detection_history if detection_history is not None else DetectionHistory()
+    self.events = events
+
+  def update(self, tracks, roi_start, current_time):
+    """
+    Process one frame of SORT output.
+
+    Args:
+        tracks: SORT output rows [x1, y1, x2, y2, id, class], the class carried through SORT
+            from the detector (rows without a class column leave the vehicle type unknown)
+        roi_start: First row of the detection region in frame coordinates
+        current_time: Timestamp string used for newly seen vehicles
+
+    Returns:
+        The detection history records added or updated on this frame
+    """
+    # Store previous frame's active IDs
+    previous_active_ids = set(self.active_vehicles.keys())
+
+    # Clear current active vehicles and update with current frame data
+    current_active_vehicles = {}
+
+    # Determine which lane every vehicle is in with one lookup, using the bottom
+    # centre of its box where it meets the road
+    contact_points = np.stack([(tracks[:, 0] + tracks[:, 2]) / 2, tracks[:, 3]], axis=1)
+    with self.metrics.timer("lane_lookup"):
+      vehicle_lanes = self.lanes_detector.get_lane_numbers(contact_points)
+
+    for track, vehicle_lane in zip(tracks, vehicle_lanes):
+      x1, y1, x2, y2, id = track[:5]
+      x1, y1, x2, y2, id = int(x1), int(y1), int(x2), int(y2), int(id)
+
+      # Check if vehicle has passed the ROI threshold (50 pixels below roi_start)
+      passed_threshold = y2 > (roi_start + 100)
+
+      # Vehicle class of the detections matched to this track
+      if len(track) > 5:
+        self.vehicle_classes[id] = CLASS_NAMES[int(track[5])]
+
+      # Update active vehicles dictionary, preserving first detection time and threshold status
+      if id in self.active_vehicles:
+        first_detected = self.active_vehicles[id].get('first_detected', current_time)
+        # Keep passed_threshold as True once it's set to True
+        passed_threshold = passed_threshold or self.active_vehicles[id].get('passed_threshold', False)
+      else:
+        first_detected = current_time
+
+      current_active_vehicles[id] = {
+        'type': self.vehicle_classes.get(id, "Unknown"),
+        'lane': int(vehicle_lane),
+        'first_detected': first_detected,
+        'passed_threshold': passed_threshold  # Track if vehicle has passed the required distance
+      }
+
+    # Find disappeared vehicles
+    disappeared_ids = previous_active_ids - set(current_active_vehicles.keys())
+
+    billed_records = []
+    for disappeared_id in disappeared_ids:
+      record = self._bill(disappeared_id, current_time)
+      if record is not None:
+        billed_records.append(record)
+
+    # Update active vehicles for next frame
+    self.active_vehicles = current_active_vehicles
+
+    return billed_records
+
+  def _bill(self, disappeared_id, current_time):
+    """Record a disappeared vehicle in the detection history, returning its record if it was billed."""
+    vehicle_info = self.active_vehicles[disappeared_id]
+    # Only record vehicles that have passed the threshold
+    if not vehicle_info.get('passed_threshold', False):
+      return None
+
+    lane_number = vehicle_info['lane']
+    vehicle_type = vehicle_info['type']
+    detection_time = vehicle_info.get('first_detected', current_time)
+
+    # Skip 2-wheel vehicles - don't record them in the history
+    if "2-wheel" in vehicle_type:
+      return None
+
+    # Add to lane-specific disappeared vehicles
+    if lane_number not in self.disappeared_vehicles:
+      self.disappeared_vehicles[lane_number] = []
+
+    self.disappeared_vehicles[lane_number].append((disappeared_id, vehicle_type))
+
+    # Calculate toll fee based on vehicle type
+    toll_fee = calculate_toll_fee(vehicle_type)
+
+    # Add to detection history with payment status and toll fee,
+    # or update the existing record if this ID was already billed
+    record = self.detection_history.upsert(
+      disappeared_id,
+      vehicle_type=vehicle_type,
+      lane=lane_number,
+      time=detection_time,
+      payment_status="Waiting for payment",
+      toll_fee=toll_fee
+    )
+
+    # Only queued here; delivery happens on the event stream's own thread
+    if self.events is not None:
+      self.events.publish(record)
+    return record
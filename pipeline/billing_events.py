@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import concurrent.futures
+import http.server
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.request
+
+
+class JsonlSink:
+  """Appends each event as a JSON line and fsyncs once per batch."""
+  def __init__(self, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    self.path = path
+    self._file = open(path, 'a')
+
+  def send(self, events):
+    self._file.write("".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events))
+    self._file.flush()
+    os.fsync(self._file.fileno())
+
+  def close(self):
+    self._file.close()
+
+
+class SqliteSink:
+  """
+  Stores events in a SQLite table keyed by idempotency key, one transaction
+  per batch; a redelivered or updated event replaces the earlier row.
+  """
+  COLUMNS = ('key', 'camera_id', 'track_id', 'vehicle_type', 'lane', 'time', 'payment_status', 'toll_fee', 'emitted_at')
+
+  def __init__(self, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    self.path = path
+    # Batches are sent from the stream's worker threads, one at a time
+    self._connection = sqlite3.connect(path, check_same_thread=False)
+    self._connection.execute(
+      "CREATE TABLE IF NOT EXISTS billing_events ("
+      "key TEXT PRIMARY KEY, camera_id TEXT, track_id INTEGER, vehicle_type TEXT, lane INTEGER, "
+      "time TEXT, payment_status TEXT, toll_fee INTEGER, emitted_at REAL)"
+    )
+    self._connection.commit()
+
+  def send(self, events):
+    with self._connection:
+      self._connection.executemany(
+        f"INSERT OR REPLACE INTO billing_events ({', '.join(self.COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+        [tuple(event[column] for column in self.COLUMNS) for event in events]
+      )
+
+  def close(self):
+    self._connection.close()
+
+
+class HttpSink:
+  """
+  POSTs each batch as {"events": [...]} to `url`. Any status other than 2xx,
+  or no answer within `timeout` seconds, fails the batch so it is retried.
+  """
+  def __init__(self, url, timeout=5.0, headers=None):
+    self.url = url
+    self.timeout = timeout
+    self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+  def send(self, events):
+    body = json.dumps({'events': events}).encode()
+    request = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+      if not 200 <= response.status < 300:
+        raise RuntimeError(f"{self.url} answered {response.status}")
+
+  def close(self):
+    pass
+
+
+class BillingEventStream:
+  """
+  Hands billing events to a sink without ever blocking the caller.
+
+  publish() is called by TollBilling from the tracking thread and only
+  schedules the event on an asyncio loop running in a background thread.
+  There events are sent in batches of up to `batch_size`, waiting at most
+  `max_delay` seconds for a batch to fill. The sink's blocking send() runs
+  in a worker thread. A failed batch is retried with exponential backoff
+  (with jitter, from `backoff` up to `max_backoff` seconds) until it goes
+  through, so delivery is at least once: a batch may arrive twice if the
+  sink stored it but the acknowledgement was lost. Every event carries an
+  idempotency key built from the camera, this run and the track ID, so
+  the receiver can drop the duplicates; a vehicle billed again (its record
+  updated) keeps its key and replaces the first event.
+
+  Events still undelivered when close() gives up are appended to
+  `spill_path` (if set), and start() queues them again before anything new.
+  """
+  def __init__(self, sink, camera_id="", batch_size=50, max_delay=0.5, backoff=0.5, max_backoff=30.0,
+               spill_path=None):
+    self.sink = sink
+    self.camera_id = camera_id
+    self.batch_size = batch_size
+    self.max_delay = max_delay
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.spill_path = spill_path
+    # Track IDs restart with the process, so the run's start time keeps keys unique across restarts
+    self.run_id = time.strftime("%Y%m%dT%H%M%S")
+
+    self.published = 0
+    self.delivered = 0
+    self.batches = 0
+    self.retries = 0
+    self.last_error = None
+    self._pending = {}  # {sequence number: event} until the sink accepts it
+    self._sequence = 0
+    self._lock = threading.Lock()
+
+    self._loop = asyncio.new_event_loop()
+    # One send at a time, on a thread close() can wait for before closing the sink
+    self._sender = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="billing-events-send")
+    self._queue = None
+    self._ready = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="billing-events", daemon=True)
+    self._task = None
+
+  def start(self):
+    self._thread.start()
+    self._ready.wait()
+    if self.spill_path and os.path.exists(self.spill_path):
+      with open(self.spill_path) as file:
+        spilled = [json.loads(line) for line in file if line.strip()]
+      os.remove(self.spill_path)
+      for event in spilled:
+        self._enqueue(event)
+    return self
+
+  def key(self, track_id):
+    return f"{self.camera_id}:{self.run_id}:{track_id}"
+
+  def publish(self, record):
+    """Queue a billing record (DetectionRecord or dict) for delivery; returns at once."""
+    event = dict(record.to_dict() if hasattr(record, 'to_dict') else record)
+    track_id = event.pop('id')
+    event.update(key=self.key(track_id), camera_id=self.camera_id, track_id=track_id, emitted_at=time.time())
+    self._enqueue(event)
+
+  def pending(self):
+    with self._lock:
+      return len(self._pending)
+
+  def close(self, timeout=10.0):
+    """
+    Deliver what is queued (waiting up to `timeout` seconds), then stop and
+    close the sink. A send still running at the timeout is waited for; its
+    events count as undelivered, since the sink's answer never reached us.
+    """
+    if self._thread.is_alive():
+      future = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+      try:
+        future.result(timeout)
+      except concurrent.futures.TimeoutError:
+        future.cancel()
+        print(f"Billing events: {self.pending()} events not delivered within {timeout}s ({self.last_error!r})")
+      self._loop.call_soon_threadsafe(self._task.cancel)
+      self._thread.join()
+    # Cancelling the worker does not stop a send already running on the sender thread;
+    # let it finish so the sink is never closed under it
+    self._sender.shutdown(wait=True)
+    self.sink.close()
+
+    with self._lock:
+      undelivered = list(self._pending.values())
+    if undelivered and self.spill_path:
+      with open(self.spill_path, 'a') as file:
+        file.write("".join(json.dumps(event) + "\n" for event in undelivered))
+      print(f"Billing events: {len(undelivered)} undelivered events saved to {self.spill_path} for the next run")
+
+  def stats(self):
+    with self._lock:
+      return {
+        'published': self.published,
+        'delivered': self.delivered,
+        'pending': len(self._pending),
+        'batches': self.batches,
+        'retries': self.retries,
+        'last_error': None if self.last_error is None else repr(self.last_error),
+      }
+
+  def format_stats(self):
+    s = self.stats()
+    return (f"Billing events: {s['delivered']} of {s['published']} delivered in {s['batches']} batches, "
+            f"{s['retries']} retries, {s['pending']} pending")
+
+  def _enqueue(self, event):
+    with self._lock:
+      self._sequence += 1
+      sequence = self._sequence
+      self._pending[sequence] = event
+      self.published += 1
+    self._loop.call_soon_threadsafe(self._queue.put_nowait, (sequence, event))
+
+  def _run(self):
+    asyncio.set_event_loop(self._loop)
+    self._queue = asyncio.Queue()
+    self._task = self._loop.create_task(self._deliver())
+    self._loop.call_soon(self._ready.set)
+    try:
+      self._loop.run_until_complete(self._task)
+    except asyncio.CancelledError:
+      pass
+    finally:
+      self._loop.close()
+
+  async def _deliver(self):
+    while True:
+      batch = [await self._queue.get()]
+      deadline = self._loop.time() + self.max_delay
+      while len(batch) < self.batch_size:
+        try:
+          batch.append(await asyncio.wait_for(self._queue.get(), deadline - self._loop.time()))
+        except asyncio.TimeoutError:
+          break
+
+      attempt = 0
+      while True:
+        try:
+          await self._loop.run_in_executor(self._sender, self.sink.send, [event for _, event in batch])
+          break
+        except Exception as error:
+          delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+          attempt += 1
+          with self._lock:
+            self.retries += 1
+            self.last_error = error
+          await asyncio.sleep(delay)
+
+      with self._lock:
+        for sequence, _ in batch:
+          del self._pending[sequence]
+        self.delivered += len(batch)
+        self.batches += 1
+      for _ in batch:
+        self._queue.task_done()
+
+  async def _drain(self):
+    await self._queue.join()
+
+
+class StubBillingEndpoint:
+  """
+  Local stand-in for the payment backend, for trying HttpSink without one.
+
+  Accepts POSTed batches, keeps the latest event per idempotency key and
+  fails a `fail_rate` share of requests with a 503 (after `delay` seconds)
+  to exercise retries.
+  """
+  def __init__(self, port=8080, host="127.0.0.1", fail_rate=0.0, delay=0.0):
+    self.events = {}
+    self.requests = 0
+    self.duplicates = 0
+    lock = threading.Lock()
+    stub = self
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      def do_POST(self):
+        time.sleep(delay)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with lock:
+          stub.requests += 1
+          if random.random() < fail_rate:
+            self.send_error(503)
+            return
+          for event in json.loads(body)['events']:
+            stub.duplicates += event['key'] in stub.events
+            stub.events[event['key']] = event
+        self.send_response(204)
+        self.end_headers()
+
+      def log_message(self, format, *args):
+        pass
+
+    self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+    self.url = f"http://{host}:{self.server.server_address[1]}/events"
+    self._thread = threading.Thread(target=self.server.serve_forever, name="billing-stub", daemon=True)
+
+  def start(self):
+    self._thread.start()
+    return self
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run a local stub billing endpoint for --events-url")
+  parser.add_argument("--port", type=int, default=8080)
+  parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+  parser.add_argument("--delay", type=float, default=0.0, help="Seconds before each answer")
+  args = parser.parse_args()
+
+  stub = StubBillingEndpoint(args.port, fail_rate=args.fail_rate, delay=args.delay).start()
+  print(f"Accepting billing events on {stub.url} (Ctrl+C to stop)")
+  try:
+    while True:
+      time.sleep(5)
+      print(f"{stub.requests} requests, {len(stub.events)} events, {stub.duplicates} duplicates")
+  except KeyboardInterrupt:
+    stub.close()
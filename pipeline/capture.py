@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+from .frame_ring import SharedFrameRing
+
+
+class RoiCapture:
+  """
+  Capture stage for headless runs that keeps only the detection ROI.
+
+  Frames are decoded into one reused full-frame buffer with cap.read(buffer),
+  and the rows below `roi_start` are copied (or downscaled by `scale`) into
+  a fixed pool of preallocated ROI slots, which travel through the pipeline
+  and are recycled when their packet is done. After the first frame nothing
+  frame-sized is allocated per frame, and only the ROI is kept in flight.
+
+  Boxes found on a downscaled ROI are mapped back to full-frame coordinates
+  by the inference stage, so lanes, thresholds and billing are unchanged.
+  """
+  def __init__(self, cap, frame_shape, roi_start, scale=1.0, n_slots=16):
+    height, width = frame_shape[:2]
+    if not 0 <= roi_start < height:
+      raise ValueError(f"roi_start {roi_start} is outside a frame of height {height}")
+    self.cap = cap
+    self.roi_start = roi_start
+    self.scale = scale
+    self.roi_size = (max(1, int(round(width * scale))), max(1, int(round((height - roi_start) * scale))))  # (w, h)
+    self.ring = SharedFrameRing(n_slots, (self.roi_size[1], self.roi_size[0]) + tuple(frame_shape[2:]))
+    self._frame = np.empty(frame_shape, dtype=np.uint8)
+
+  def isOpened(self):
+    return self.cap.isOpened()
+
+  def read_roi(self):
+    """Next ROI as (status, roi view, release callback); the callback must be called exactly once."""
+    slot = self.ring.acquire()
+    status, frame = self.cap.read(self._frame)
+    if not status:
+      self.ring.release(slot)
+      return False, None, None
+    self._frame = frame  # the same buffer unless the capture had to reallocate
+
+    roi = frame[self.roi_start:]
+    dst = self.ring.frame(slot)
+    if roi.shape == dst.shape:
+      np.copyto(dst, roi)
+    else:
+      cv2.resize(roi, self.roi_size, dst=dst, interpolation=cv2.INTER_AREA)
+
+    self.ring.publish(slot)
+    self.ring.claim(slot)
+    return True, dst, lambda: self.ring.release(slot)
+
+  def read(self):
+    """Plain-capture interface: a copy of the next ROI."""
+    status, roi, release = self.read_roi()
+    if not status:
+      return False, None
+    roi = roi.copy()
+    release()
+    return True, roi
+
+  def release(self):
+    self.cap.release()
+    self.ring.close()
@@ -0,0 +1,390 @@
+import collections
+import datetime
+import queue
+import threading
+import time
+import numpy as np
+from trackers import FrameBatcher, results_to_detections
+from utils import get_roi_start
+from .metrics import Metrics
+from .queues import BoundedQueue, QueueClosed
+from .stages import Stage, StageStats
+
+
+class FramePacket:
+  """Everything the pipeline knows about one decoded frame as it moves from stage to stage."""
+  __slots__ = (
+    'index', 'frame', 'roi_start', 'roi', 'timestamp', 'decoded_at',
+    'detections', 'detection_classes', 'detected', 'tracks', 'billed_records', 'roi_scale', '_release_frame'
+  )
+
+  def __init__(self, index, frame, roi_start, timestamp, release_frame=None, roi=None, roi_scale=1.0):
+    self.index = index
+    self.frame = frame  # None when the capture only keeps the ROI
+    self.roi_start = roi_start
+    self.roi = frame[roi_start:frame.shape[0], 0:frame.shape[1]] if roi is None else roi
+    self.roi_scale = roi_scale  # size of `roi` relative to the frame region it shows
+    self.timestamp = timestamp
+    self.decoded_at = time.monotonic()
+    self.detections = np.empty((0, 5))
+    self.detection_classes = np.empty((0,), dtype=int)
+    self.detected = None  # True once the detector ran on the frame, False if it was skipped
+    self.tracks = np.empty((0, 6))
+    self.billed_records = []
+    self._release_frame = release_frame
+
+  def release(self):
+    """Give the frame's buffer back to its capture (shared frame slots); safe to call more than once."""
+    release_frame, self._release_frame = self._release_frame, None
+    if release_frame is not None:
+      release_frame()
+
+
+class DecodeStage(Stage):
+  """
+  Reads frames from a cv2.VideoCapture and wraps them in FramePackets.
+  Frames are also offered to the lane model, if any, so its periodic
+  downsample never runs on the tracking thread.
+  """
+  def __init__(self, cap, output_queue, stop_event, lane_model=None, on_error=None):
+    super().__init__("decode", output_queue=output_queue, on_error=on_error)
+    self.cap = cap
+    self.stop_event = stop_event
+    self.lane_model = lane_model
+
+  def loop(self):
+    index = 0
+    while self.cap.isOpened() and not self.stop_event.is_set():
+      start = time.monotonic()
+      packet = self._read(index)
+
+      if packet is None:
+        break
+
+      if self.lane_model is not None and packet.frame is not None:
+        self.lane_model.submit(packet.frame)
+      self.stats.record(time.monotonic() - start)
+
+      self.emit(packet)
+      index += 1
+
+  def _read(self, index):
+    # Get current timestamp for new detections
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # A RoiCapture only keeps the (possibly downscaled) detection region
+    if hasattr(self.cap, 'read_roi'):
+      status, roi, release_frame = self.cap.read_roi()
+      if not status:
+        return None
+      return FramePacket(index, None, self.cap.roi_start, current_time, release_frame,
+                         roi=roi, roi_scale=self.cap.scale)
+
+    # A SharedFrameCapture hands out frames in shared slots that must be given back
+    if hasattr(self.cap, 'read_owned'):
+      status, frame, release_frame = self.cap.read_owned()
+    else:
+      status, frame = self.cap.read()
+      release_frame = None
+    if not status:
+      return None
+    return FramePacket(index, frame, get_roi_start(frame.shape[0]), current_time, release_frame)
+
+
+class InferenceStage(Stage):
+  """
+  Runs the vehicle detector on the ROI of each frame.
+
+  Frames are grouped with a FrameBatcher, so with `batch_size` > 1 the
+  model sees several frames in one call. With a `skip_policy` the detector
+  only runs on the frames it picks; skipped frames pass straight through.
+  With a `motion_gate`, frames without motion or tracked vehicles pass
+  through with no detections. With a `lane_cropper` the detector sees only
+  the lanes in use when it picks crops, one call per frame outside the
+  batcher. Packets still leave the stage one by one and in decode order.
+  """
+  def __init__(self, vehicle_tracker, input_queue, output_queue, batch_size=1, max_wait=0.05,
+               conf_threshold=0.5, skip_policy=None, motion_gate=None, lane_cropper=None, on_error=None):
+    super().__init__("infer", input_queue=input_queue, output_queue=output_queue, on_error=on_error)
+    self.vehicle_tracker = vehicle_tracker
+    self.batcher = FrameBatcher(vehicle_tracker, batch_size=batch_size, max_wait=max_wait)
+    self.conf_threshold = conf_threshold
+    self.skip_policy = skip_policy
+    self.motion_gate = motion_gate
+    self.lane_cropper = lane_cropper
+    self._waiting = collections.deque()  # packets in decode order, until they can leave
+
+  def loop(self):
+    while True:
+      try:
+        packet = self.input_queue.get(timeout=self.batcher.remaining_wait())
+      except queue.Empty:
+        # The oldest queued frame hit the batch deadline
+        self._run(self.batcher.flush)
+        continue
+      except QueueClosed:
+        self._run(self.batcher.flush)
+        return
+
+      self._waiting.append(packet)
+      if self.motion_gate is not None and not self.motion_gate.check(packet.roi, packet.roi_start, packet.roi_scale):
+        # Nothing moving and nothing tracked: SORT still gets the frame, with no detections
+        packet.detected = True
+        self._emit_ready()
+        continue
+
+      if self.skip_policy is not None and not self.skip_policy.should_detect():
+        packet.detected = False
+        self._emit_ready()
+        continue
+
+      if self.lane_cropper is not None:
+        spans = self.lane_cropper.plan(packet)
+        if spans is not None:
+          self._run_crops(packet, spans)
+          continue
+
+      self._run(lambda: self.batcher.add(packet, packet.roi))
+
+  def _run(self, step):
+    start = time.monotonic()
+    ready = step()
+    if not ready:
+      return
+
+    for packet, result in ready:
+      packet.detections, packet.detection_classes = results_to_detections(
+        result, offset=(0, packet.roi_start), conf_threshold=self.conf_threshold, scale=packet.roi_scale
+      )
+      packet.detected = True
+      if self.lane_cropper is not None:
+        self.lane_cropper.observe_detections(packet.detections)
+    self.stats.record(time.monotonic() - start, items=len(ready))
+    self._emit_ready()
+
+  def _run_crops(self, packet, spans):
+    start = time.monotonic()
+    if spans:
+      packet.detections, packet.detection_classes = self.lane_cropper.detect(
+        self.vehicle_tracker, packet, spans, conf_threshold=self.conf_threshold
+      )
+    else:
+      # No lane in use: SORT gets the frame with no detections, as with the motion gate
+      self.lane_cropper.observe_detections(packet.detections)
+    packet.detected = True
+    self.stats.record(time.monotonic() - start)
+    self._emit_ready()
+
+  def _emit_ready(self):
+    # Skipped frames wait behind frames still in a batch, so the tracker sees them in order
+    while self._waiting and self._waiting[0].detected is not None:
+      self.emit(self._waiting.popleft())
+
+
+class TrackingStage(Stage):
+  """
+  Runs SORT on the frame's detections, then billing and history persistence.
+  On frames the detector skipped, SORT is only advanced along its motion model.
+  Each step is timed and frames, detections, tracks and billing events are
+  counted in `metrics`.
+  """
+  def __init__(self, tracker, billing, input_queue, output_queue=None, history_writer=None,
+               skip_policy=None, motion_gate=None, lane_cropper=None, metrics=None, on_error=None):
+    super().__init__("track", input_queue=input_queue, output_queue=output_queue, on_error=on_error)
+    self.tracker = tracker
+    self.billing = billing
+    self.history_writer = history_writer
+    self.skip_policy = skip_policy
+    self.motion_gate = motion_gate
+    self.lane_cropper = lane_cropper
+    self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+    self.latency = StageStats("end_to_end")
+
+  def process(self, packet):
+    with self.metrics.timer("sort"):
+      if packet.detected is False:
+        packet.tracks = self.tracker.advance(with_class=True)
+      else:
+        # Pass the detector class along with each box so SORT returns it per track
+        dets = np.hstack([packet.detections, packet.detection_classes[:, None]])
+        packet.tracks = self.tracker.update(dets)
+    if self.skip_policy is not None:
+      self.skip_policy.observe(packet.index, packet.tracks, packet.detected is not False)
+    if self.motion_gate is not None:
+      self.motion_gate.observe(packet.tracks)
+    if self.lane_cropper is not None:
+      self.lane_cropper.observe(packet.tracks)
+    with self.metrics.timer("billing"):
+      packet.billed_records = self.billing.update(packet.tracks, packet.roi_start, packet.timestamp)
+
+    # Append new and changed billing records to the detection log
+    if self.history_writer is not None:
+      with self.metrics.timer("history_write"):
+        self.history_writer.write(packet.billed_records)
+
+    if self.metrics.enabled:
+      self.metrics.count("frames")
+      self.metrics.count("detections", len(packet.detections) if packet.detected else 0)
+      self.metrics.count("billing_events", len(packet.billed_records))
+      self.metrics.gauge("active_tracks", len(packet.tracks))
+
+    self.latency.record(time.monotonic() - packet.decoded_at)
+    if self.output_queue is None:
+      packet.release()  # nothing renders it
+    return packet
+
+
+class FramePipeline:
+  """
+  Decode -> infer -> track/bill -> render pipeline for one video source.
+
+  Each stage runs on its own thread and stages are joined by bounded
+  queues. `policy` sets what happens when inference falls behind decode:
+  "block" throttles the decoder (files), "drop_oldest" skips stale frames
+  (live feeds). The render queue always drops the oldest frame so a slow
+  GUI never holds up billing.
+
+  Rendering stays with the caller, which iterates `frames()` on the main
+  thread because OpenCV windows must be driven from there. With a
+  SharedFrameCapture as `cap`, frames live in shared slots that are
+  recycled when a packet is dropped, billed (headless) or rendered, so a
+  packet's frame is only valid inside the body of the `frames()` loop.
+  A RoiCapture keeps only the detection region and is for headless runs.
+
+  With a `lane_model` (an IncrementalLaneModel, normally also the billing's
+  lanes detector) decoded frames are fed to its background re-detection
+  and its cost shows up in the stats.
+
+  With a `skip_policy` (FrameSkipPolicy) the detector runs only on the
+  frames it picks and SORT is advanced on the others. With a `motion_gate`
+  (MotionGate) it does not run on frames where nothing moves or is tracked.
+  With a `lane_cropper` (LaneCropper) it runs on crops of the busy lanes
+  instead of the whole ROI when traffic is sparse.
+
+  With `metrics` (an enabled Metrics) every stage's StageStats and the
+  steps of the tracking stage feed its histograms, and queue depths are
+  read into gauges whenever it is scraped.
+  """
+  def __init__(self, cap, vehicle_tracker, tracker, billing, queue_size=8, policy=BoundedQueue.BLOCK,
+               render=True, batch_size=1, max_wait=0.05, conf_threshold=0.5, history_writer=None,
+               lane_model=None, skip_policy=None, motion_gate=None, lane_cropper=None, metrics=None):
+    if render and hasattr(cap, 'read_roi'):
+      raise ValueError("A RoiCapture keeps no full frames to render, use it with render=False")
+    self._stop_event = threading.Event()
+
+    # Dropped or discarded packets give their frame buffers back
+    release = FramePacket.release
+    self.decoded_queue = BoundedQueue(queue_size, policy, name="decoded", on_drop=release)
+    self.inferred_queue = BoundedQueue(queue_size, BoundedQueue.BLOCK, name="inferred", on_drop=release)
+    self.render_queue = BoundedQueue(
+      queue_size, BoundedQueue.DROP_OLDEST, name="render", on_drop=release
+    ) if render else None
+
+    self.lane_model = lane_model
+    self.decode_stage = DecodeStage(
+      cap, self.decoded_queue, self._stop_event, lane_model=lane_model, on_error=self._on_stage_error
+    )
+    self.inference_stage = InferenceStage(
+      vehicle_tracker, self.decoded_queue, self.inferred_queue,
+      batch_size=batch_size, max_wait=max_wait, conf_threshold=conf_threshold, skip_policy=skip_policy,
+      motion_gate=motion_gate, lane_cropper=lane_cropper, on_error=self._on_stage_error
+    )
+    self.tracking_stage = TrackingStage(
+      tracker, billing, self.inferred_queue, self.render_queue,
+      history_writer=history_writer, skip_policy=skip_policy, motion_gate=motion_gate,
+      lane_cropper=lane_cropper, metrics=metrics, on_error=self._on_stage_error
+    )
+    self.skip_policy = skip_policy
+    self.motion_gate = motion_gate
+    self.lane_cropper = lane_cropper
+    self.render_stats = StageStats("render")
+
+    self.stages = [self.decode_stage, self.inference_stage, self.tracking_stage]
+    self.queues = [q for q in (self.decoded_queue, self.inferred_queue, self.render_queue) if q is not None]
+
+    self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+    for stats in [stage.stats for stage in self.stages] + [self.tracking_stage.latency]:
+      self.metrics.attach(stats)
+    if render:
+      self.metrics.attach(self.render_stats)
+    if self.metrics.enabled:
+      self.metrics.add_collector(self._collect_queue_metrics)
+
+  def start(self):
+    for stage in self.stages:
+      stage.start()
+
+  def stop(self):
+    """Stop all stages as soon as possible, discarding queued frames."""
+    self._stop_event.set()
+    for q in self.queues:
+      q.close(discard=True)
+
+  def join(self):
+    """Wait for every stage to finish and re-raise the first stage error, if any."""
+    for stage in self.stages:
+      stage.join()
+    for stage in self.stages:
+      if stage.error is not None:
+        raise stage.error
+
+  def frames(self):
+    """Yield tracked frames for rendering; time spent in the caller's loop body counts as render time."""
+    if self.render_queue is None:
+      return
+
+    for packet in self.render_queue:
+      start = time.monotonic()
+      try:
+        yield packet
+      finally:
+        packet.release()
+      self.render_stats.record(time.monotonic() - start)
+
+  def stats(self):
+    stage_stats = {stage.name: stage.stats.as_dict() for stage in self.stages}
+    if self.render_queue is not None:
+      stage_stats['render'] = self.render_stats.as_dict()
+    stage_stats['end_to_end'] = self.tracking_stage.latency.as_dict()
+
+    stats = {
+      'stages': stage_stats,
+      'queues': {q.name: q.stats() for q in self.queues},
+    }
+    if self.lane_model is not None:
+      stats['lanes'] = self.lane_model.stats()
+    if self.skip_policy is not None:
+      stats['detector'] = self.skip_policy.stats()
+    if self.motion_gate is not None:
+      stats['motion_gate'] = self.motion_gate.stats()
+    if self.lane_cropper is not None:
+      stats['lane_crops'] = self.lane_cropper.stats()
+    return stats
+
+  def format_stats(self):
+    stats = self.stats()
+    lines = ["Stage          frames   mean ms    max ms"]
+    for name, s in stats['stages'].items():
+      lines.append(f"{name:<12} {s['count']:>8} {s['mean_ms']:>9.1f} {s['max_ms']:>9.1f}")
+    lines.append("Queue          depth  max depth  dropped")
+    for name, q in stats['queues'].items():
+      lines.append(f"{name:<12} {q['depth']:>7} {q['max_depth']:>10} {q['dropped']:>8}")
+    if self.lane_model is not None:
+      lines.append(self.lane_model.format_stats())
+    if self.skip_policy is not None:
+      lines.append(self.skip_policy.format_stats())
+    if self.motion_gate is not None:
+      lines.append(self.motion_gate.format_stats())
+    if self.lane_cropper is not None:
+      lines.append(self.lane_cropper.format_stats())
+    return "\n".join(lines)
+
+  def _collect_queue_metrics(self, metrics):
+    for q in self.queues:
+      stats = q.stats()
+      metrics.gauge(f"queue_{q.name}_depth", stats['depth'])
+      metrics.gauge(f"queue_{q.name}_dropped", stats['dropped'])
+
+  def _on_stage_error(self, stage, error):
+    print(f"Pipeline stage '{stage.name}' failed: {error!r}")
+    self.stop()
@@ -0,0 +1,207 @@
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+
+class SharedFrameRing:
+  """
+  Fixed set of frame-sized slots in shared memory, so decoded frames can be
+  handed between processes as NumPy views instead of pickled copies.
+
+  Every slot has an owner state kept in the same shared block:
+      FREE    -> acquire()  -> WRITING (a decoder fills it)
+      WRITING -> publish()  -> READY   (waiting for a consumer)
+      READY   -> claim()    -> IN_USE  (a consumer reads the view)
+      any     -> release()  -> FREE    (recycled for the next frame)
+
+  The ring can be passed to a child process when it is started; the child
+  attaches to the same memory and lock.
+  """
+  FREE, WRITING, READY, IN_USE = 0, 1, 2, 3
+
+  def __init__(self, n_slots, shape, dtype=np.uint8, context=None):
+    if n_slots < 1:
+      raise ValueError("n_slots must be at least 1")
+    self.n_slots = n_slots
+    self.shape = tuple(shape)
+    self.dtype = np.dtype(dtype)
+    self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+    context = context or multiprocessing.get_context("spawn")
+    self._condition = context.Condition()
+    self._shm = shared_memory.SharedMemory(create=True, size=n_slots * self.frame_bytes + n_slots)
+    self._owner = True
+    self._cursor = 0
+    self._attach()
+    self._states[:] = self.FREE
+
+  def __getstate__(self):
+    return {
+      'n_slots': self.n_slots, 'shape': self.shape, 'dtype': self.dtype.str,
+      'name': self._shm.name, 'condition': self._condition,
+    }
+
+  def __setstate__(self, state):
+    self.n_slots = state['n_slots']
+    self.shape = state['shape']
+    self.dtype = np.dtype(state['dtype'])
+    self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+    self._condition = state['condition']
+    self._shm = shared_memory.SharedMemory(name=state['name'])
+    self._owner = False
+    self._cursor = 0
+    self._attach()
+
+  def _attach(self):
+    buffer = self._shm.buf
+    self._frames = np.ndarray((self.n_slots,) + self.shape, dtype=self.dtype, buffer=buffer)
+    self._states = np.ndarray((self.n_slots,), dtype=np.uint8, buffer=buffer, offset=self.n_slots * self.frame_bytes)
+
+  def frame(self, slot):
+    """The frame stored in `slot`, as a view into shared memory (no copy)."""
+    return self._frames[slot]
+
+  def state(self, slot):
+    return int(self._states[slot])
+
+  def free_slots(self):
+    with self._condition:
+      return int((self._states == self.FREE).sum())
+
+  def acquire(self, timeout=None):
+    """Take a free slot for writing, waiting up to `timeout` seconds. Returns its index, or None."""
+    with self._condition:
+      if not self._condition.wait_for(lambda: (self._states == self.FREE).any(), timeout):
+        return None
+      # Hand slots out round-robin so a slot just released is reused last
+      free = np.nonzero(self._states == self.FREE)[0]
+      slot = int(free[np.searchsorted(free, self._cursor) % len(free)])
+      self._cursor = (slot + 1) % self.n_slots
+      self._states[slot] = self.WRITING
+      return slot
+
+  def publish(self, slot):
+    self._transition(slot, self.WRITING, self.READY)
+
+  def claim(self, slot):
+    self._transition(slot, self.READY, self.IN_USE)
+
+  def release(self, slot):
+    with self._condition:
+      if self._states is None:
+        return  # already closed
+      self._states[slot] = self.FREE
+      self._condition.notify_all()
+
+  def close(self):
+    """Detach from the shared memory; the creating process also frees it."""
+    self._frames = None
+    self._states = None
+    try:
+      self._shm.close()
+    except BufferError:
+      pass  # frame views are still referenced; the mapping goes away with them
+    if self._owner:
+      self._shm.unlink()
+
+  def _transition(self, slot, expected, new):
+    with self._condition:
+      if self._states[slot] != expected:
+        raise RuntimeError(f"Frame slot {slot} is in state {int(self._states[slot])}, expected {expected}")
+      self._states[slot] = new
+      self._condition.notify_all()
+
+
+def _decode_frames(source, ring, messages, stop_event):
+  """Child process loop: decode `source` straight into ring slots and announce each one."""
+  cap = cv2.VideoCapture(source)
+  index = 0
+  try:
+    while cap.isOpened() and not stop_event.is_set():
+      slot = ring.acquire(timeout=0.5)
+      if slot is None:
+        continue
+
+      frame = ring.frame(slot)
+      status, image = cap.read(frame)
+      if not status:
+        ring.release(slot)
+        break
+      if not np.shares_memory(image, frame):
+        # The capture could not decode in place (e.g. the stream changed resolution)
+        if image.shape != frame.shape:
+          image = cv2.resize(image, (frame.shape[1], frame.shape[0]))
+        frame[...] = image
+
+      ring.publish(slot)
+      messages.put((slot, index, time.time()))
+      index += 1
+  finally:
+    frame = image = None  # drop the views before detaching
+    messages.put(None)
+    cap.release()
+    ring.close()
+
+
+class SharedFrameCapture:
+  """
+  A cv2.VideoCapture stand-in that decodes in a separate process.
+
+  The child process writes frames into a SharedFrameRing sized from the
+  capture resolution and only sends slot numbers back. read_owned() returns
+  each frame as a view of its slot together with a callback that recycles
+  the slot once the frame is no longer needed. read() is there for code
+  that expects a plain capture and copies the frame out.
+  """
+  def __init__(self, source, frame_shape, n_slots=16):
+    context = multiprocessing.get_context("spawn")
+    self.ring = SharedFrameRing(n_slots, frame_shape, context=context)
+    self._messages = context.Queue()
+    self._stop_event = context.Event()
+    self._finished = False
+    self._process = context.Process(
+      target=_decode_frames, args=(source, self.ring, self._messages, self._stop_event),
+      name="decode", daemon=True
+    )
+    self._process.start()
+
+  def isOpened(self):
+    return not self._finished
+
+  def read_owned(self):
+    """Next frame as (status, frame view, release callback); the callback must be called exactly once."""
+    while not self._finished:
+      try:
+        message = self._messages.get(timeout=0.5)
+      except queue.Empty:
+        if not self._process.is_alive():
+          self._finished = True
+        continue
+
+      if message is None:
+        self._finished = True
+        break
+
+      slot = message[0]
+      self.ring.claim(slot)
+      return True, self.ring.frame(slot), lambda: self.ring.release(slot)
+    return False, None, None
+
+  def read(self):
+    status, frame, release = self.read_owned()
+    if not status:
+      return False, None
+    frame = frame.copy()
+    release()
+    return True, frame
+
+  def release(self):
+    self._finished = True
+    self._stop_event.set()
+    self._process.join(timeout=5)
+    if self._process.is_alive():
+      self._process.terminate()
+    self.ring.close()
@@ -0,0 +1,95 @@
+import threading
+import numpy as np
+
+
+class FrameSkipPolicy:
+  """
+  Decides on which frames the vehicle detector runs.
+
+  With a fixed policy the detector runs on every `interval`-th frame. With
+  `adaptive` set, `interval` is the longest gap allowed and the gap is
+  chosen after every detection from what the tracker reports:
+      - the fastest track may move at most `max_displacement` pixels
+        between detections, so IOU matching keeps working;
+      - a new track runs the detector on the next frame, so it is
+        confirmed (min_hits) as quickly as without skipping;
+      - with `busy_tracks` or more tracks the gap is halved.
+  On skipped frames the tracker is only advanced (Sort.advance), so tracks
+  keep moving and billing still sees them leave.
+
+  should_detect() is called by the inference stage and observe() by the
+  tracking stage; the decision lags the tracker by the frames queued
+  between them.
+  """
+  def __init__(self, interval=1, adaptive=False, max_displacement=20.0, busy_tracks=8):
+    if interval < 1:
+      raise ValueError("interval must be at least 1")
+    self.interval = interval
+    self.adaptive = adaptive
+    self.max_displacement = max_displacement
+    self.busy_tracks = busy_tracks
+
+    self.current_interval = 1 if adaptive else interval
+    self.detected = 0
+    self.skipped = 0
+    self._since_detect = None
+    self._positions = {}  # {track id: (frame index, centre x, centre y)} at the last detection
+    self._lock = threading.Lock()
+
+  def should_detect(self):
+    with self._lock:
+      if self._since_detect is None or self._since_detect + 1 >= self.current_interval:
+        self._since_detect = 0
+        self.detected += 1
+        return True
+      self._since_detect += 1
+      self.skipped += 1
+      return False
+
+  def observe(self, frame_index, tracks, detected):
+    """Update the gap from the tracks of a frame the detector ran on (skipped frames are ignored)."""
+    if not detected:
+      return
+
+    ids = tracks[:, 4].astype(int)
+    centres = np.stack([(tracks[:, 0] + tracks[:, 2]) / 2, (tracks[:, 1] + tracks[:, 3]) / 2], axis=1)
+
+    # Pixels per frame of every track seen at the previous detection too
+    speeds = []
+    for id, centre in zip(ids, centres):
+      previous = self._positions.get(id)
+      if previous is not None and frame_index > previous[0]:
+        speeds.append(np.hypot(*(centre - previous[1:])) / (frame_index - previous[0]))
+    new_tracks = any(id not in self._positions for id in ids)
+    self._positions = {id: (frame_index, centre[0], centre[1]) for id, centre in zip(ids, centres)}
+
+    if not self.adaptive:
+      return
+
+    if new_tracks:
+      interval = 1
+    elif speeds and max(speeds) > 0:
+      interval = int(np.clip(self.max_displacement // max(speeds), 1, self.interval))
+    else:
+      interval = self.interval
+    if len(ids) >= self.busy_tracks:
+      interval = max(1, interval // 2)
+
+    with self._lock:
+      self.current_interval = interval
+
+  def stats(self):
+    with self._lock:
+      frames = self.detected + self.skipped
+      return {
+        'detected': self.detected,
+        'skipped': self.skipped,
+        'skip_ratio': self.skipped / frames if frames else 0.0,
+        'interval': self.current_interval,
+      }
+
+  def format_stats(self):
+    s = self.stats()
+    mode = f"adaptive up to every {self.interval}" if self.adaptive else f"every {self.interval}"
+    return (f"Detector ({mode} frames): {s['detected']} frames detected, {s['skipped']} skipped "
+            f"({s['skip_ratio'] * 100:.1f}% of detector calls saved)")
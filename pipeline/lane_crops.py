@@ -0,0 +1,250 @@
+import math
+import threading
+import numpy as np
+from detectors import lane_spaces_key
+from trackers import results_to_detections
+from trackers.sort import iou_batch
+
+
+class LaneCropper:
+  """
+  Runs the detector on a few lane-shaped crops of the ROI instead of the
+  whole ROI when traffic is sparse.
+
+  Every lane is a band of ROI columns, from the leftmost point of its left
+  line to the rightmost point of its right line over the ROI rows, widened
+  by `margin` frame pixels on both sides. A lane is cropped when it holds a
+  live track or a box from the last detection, or when the motion gate saw
+  it move on this frame. Bands are also widened to cover those boxes, so a
+  vehicle that straddles two lanes is seen whole. All crops of a frame go
+  to the model in one call at the pixel scale the full ROI would get
+  (`imgsz` is the model input size used for the full ROI), so a narrow
+  crop costs less instead of being upscaled.
+
+  Neighbouring bands overlap, and a vehicle seen by two crops is kept once:
+  whole boxes win over boxes cut by an inner crop edge, then the higher
+  confidence wins.
+
+  The whole ROI is used every `full_every` frames, so vehicles entering a
+  lane nobody watches are still found, when the crops would cover more
+  than `max_coverage` of the ROI width, and when no lanes are known.
+
+  plan() and detect() are called by the inference stage, observe() by the
+  tracking stage.
+  """
+  def __init__(self, lanes_detector, motion_gate=None, margin=32, full_every=10, max_coverage=0.6,
+               imgsz=640, dedup_iou=0.5, dedup_containment=0.8):
+    if full_every < 1:
+      raise ValueError("full_every must be at least 1")
+    self.lanes_detector = lanes_detector
+    self.motion_gate = motion_gate
+    self.margin = margin
+    self.full_every = full_every
+    self.max_coverage = max_coverage
+    self.imgsz = imgsz
+    self.dedup_iou = dedup_iou
+    self.dedup_containment = dedup_containment
+
+    self.live_tracks = np.empty((0, 6))
+    self.frames_cropped = 0
+    self.frames_full = 0
+    self.frames_empty = 0
+    self.crops = 0
+    self.covered = 0.0  # summed share of the ROI width sent as crops
+    self.duplicates = 0
+
+    self._recent = np.empty((0, 5))  # boxes of the last frame the detector ran on
+    self._since_full = None
+    self._bands = None
+    self._bands_key = None
+    self._lock = threading.Lock()
+
+  def plan(self, packet):
+    """
+    Column spans [(x0, x1), ...] of packet.roi to run the detector on, [] if
+    no lane needs it, or None to run it on the whole ROI.
+    """
+    if self._since_full is None or self._since_full + 1 >= self.full_every:
+      self._since_full = 0
+      return self._full()
+    self._since_full += 1
+
+    bands = self._lane_bands(packet.roi.shape, packet.roi_start, packet.roi_scale)
+    if not bands:
+      return self._full()
+
+    # Bottom-centre lane of every box we expect to see again
+    boxes = np.vstack([self.live_tracks[:, :4], self._recent[:, :4]])
+    lanes = self.lanes_detector.get_lane_numbers(
+      np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+    )
+
+    active = set(int(lane) for lane in lanes)
+    if self.motion_gate is not None:
+      active.update(lane for lane, share in self.motion_gate.lane_motion.items()
+                    if share > self.motion_gate.min_changed)
+
+    width = packet.roi.shape[1]
+    margin = self.margin * packet.roi_scale
+    spans = []
+    for lane in sorted(active):
+      if lane in bands:
+        x0, x1 = bands[lane]
+      else:
+        x0, x1 = width, 0  # outside every lane: only its boxes
+      for box in boxes[lanes == lane]:
+        x0 = min(x0, box[0] * packet.roi_scale - margin)
+        x1 = max(x1, box[2] * packet.roi_scale + margin)
+      x0, x1 = max(0, int(x0)), min(width, int(math.ceil(x1)))
+      if x1 > x0:
+        spans.append((x0, x1))
+    spans = self._merge_spans(spans)
+
+    covered = sum(x1 - x0 for x0, x1 in spans) / width
+    if covered > self.max_coverage:
+      return self._full()
+
+    with self._lock:
+      if spans:
+        self.frames_cropped += 1
+        self.crops += len(spans)
+        self.covered += covered
+      else:
+        self.frames_empty += 1
+    return spans
+
+  def detect(self, vehicle_tracker, packet, spans, conf_threshold=0.5):
+    """Run the detector on the crops of `packet` in one call; returns (detections, classes) in frame coordinates."""
+    roi = packet.roi
+    height, width = roi.shape[:2]
+    crops = [roi[:, x0:x1] for x0, x1 in spans]
+
+    # Same pixel scale as the whole ROI, rounded up to the model stride
+    ratio = self.imgsz / max(height, width)
+    crop_width = max(x1 - x0 for x0, x1 in spans)
+    imgsz = [int(math.ceil(height * ratio / 32) * 32), int(math.ceil(crop_width * ratio / 32) * 32)]
+    results = vehicle_tracker.track_batch(crops, imgsz=imgsz)
+
+    parts = []
+    for (x0, x1), result in zip(spans, results):
+      detections, classes = results_to_detections(
+        result, offset=(x0 / packet.roi_scale, packet.roi_start), conf_threshold=conf_threshold,
+        scale=packet.roi_scale
+      )
+      # A box reaching a crop edge that is not an ROI edge shows only part of a vehicle
+      cut = np.zeros(len(detections), dtype=bool)
+      if x0 > 0:
+        cut |= detections[:, 0] <= x0 / packet.roi_scale + 2
+      if x1 < width:
+        cut |= detections[:, 2] >= x1 / packet.roi_scale - 2
+      parts.append((detections, classes, cut))
+
+    detections, classes = self._deduplicate(parts)
+    self.observe_detections(detections)
+    return detections, classes
+
+  def observe(self, tracks):
+    """Tell the cropper where the tracker last saw its vehicles."""
+    self.live_tracks = tracks
+
+  def observe_detections(self, detections):
+    """Boxes from the latest frame the detector ran on, cropped or whole."""
+    self._recent = detections
+
+  def stats(self):
+    with self._lock:
+      frames = self.frames_cropped + self.frames_full + self.frames_empty
+      return {
+        'frames_cropped': self.frames_cropped,
+        'frames_full': self.frames_full,
+        'frames_empty': self.frames_empty,
+        'cropped_ratio': self.frames_cropped / frames if frames else 0.0,
+        'mean_crops': self.crops / self.frames_cropped if self.frames_cropped else 0.0,
+        'mean_coverage': self.covered / self.frames_cropped if self.frames_cropped else 0.0,
+        'duplicates': self.duplicates,
+      }
+
+  def format_stats(self):
+    s = self.stats()
+    return (f"Lane crops: {s['frames_cropped']} frames on {s['mean_crops']:.1f} crops "
+            f"({s['mean_coverage'] * 100:.0f}% of the ROI width), {s['frames_full']} on the full ROI, "
+            f"{s['frames_empty']} with no lane active, {s['duplicates']} duplicate boxes removed")
+
+  def _full(self):
+    with self._lock:
+      self.frames_full += 1
+    return None
+
+  def _lane_bands(self, shape, roi_start, roi_scale):
+    """{lane: (x0, x1)} ROI columns of every lane, recomputed when the lanes or the ROI change."""
+    lane_spaces = self.lanes_detector.lane_spaces
+    key = (shape, roi_start, roi_scale, lane_spaces_key(lane_spaces))
+    if key != self._bands_key:
+      height, width = shape[:2]
+      frame_width = width / roi_scale
+      rows = np.array([roi_start, roi_start + height / roi_scale])
+      margin = self.margin * roi_scale
+
+      def line_x(lane, default):
+        if lane is None:
+          return np.full(len(rows), default)
+        x1, y1, x2, y2 = lane[0]
+        slope = (x2 - x1) / (y2 - y1) if y2 != y1 else 0.0
+        return x1 + (rows - y1) * slope
+
+      self._bands = {}
+      for space in lane_spaces:
+        left = line_x(space['left_line'], 0).min() * roi_scale - margin
+        right = line_x(space['right_line'], frame_width).max() * roi_scale + margin
+        self._bands[space['lane_number']] = (max(0.0, left), min(float(width), right))
+      self._bands_key = key
+    return self._bands
+
+  @staticmethod
+  def _merge_spans(spans):
+    """Merge spans that mostly overlap, so the same pixels are not sent twice."""
+    merged = []
+    for x0, x1 in sorted(spans):
+      if merged:
+        m0, m1 = merged[-1]
+        overlap = min(m1, x1) - max(m0, x0)
+        if overlap > 0.5 * min(m1 - m0, x1 - x0):
+          merged[-1] = (m0, max(m1, x1))
+          continue
+      merged.append((x0, x1))
+    return merged
+
+  def _deduplicate(self, parts):
+    if not parts:
+      return np.empty((0, 5)), np.empty((0,), dtype=int)
+    detections = np.vstack([p[0] for p in parts])
+    classes = np.concatenate([p[1] for p in parts])
+    if len(parts) == 1 or len(detections) < 2:
+      return detections, classes
+
+    cut = np.concatenate([p[2] for p in parts])
+    crop = np.concatenate([np.full(len(p[0]), i) for i, p in enumerate(parts)])
+    boxes = detections[:, :4]
+
+    # A cut box is mostly inside the whole one, so IOU alone misses it
+    iou = iou_batch(boxes, boxes)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    inter_w = np.maximum(0, np.minimum(boxes[:, None, 2], boxes[None, :, 2]) - np.maximum(boxes[:, None, 0], boxes[None, :, 0]))
+    inter_h = np.maximum(0, np.minimum(boxes[:, None, 3], boxes[None, :, 3]) - np.maximum(boxes[:, None, 1], boxes[None, :, 1]))
+    containment = inter_w * inter_h / np.maximum(np.minimum(area[:, None], area[None, :]), 1)
+    duplicate = ((iou > self.dedup_iou) | (containment > self.dedup_containment)) & (crop[:, None] != crop[None, :])
+
+    # Whole boxes first, then the most confident
+    order = np.lexsort((-detections[:, 4], cut))
+    suppressed = np.zeros(len(detections), dtype=bool)
+    keep = []
+    for i in order:
+      if suppressed[i]:
+        continue
+      keep.append(i)
+      suppressed |= duplicate[i]
+    keep = np.sort(keep)
+
+    with self._lock:
+      self.duplicates += len(detections) - len(keep)
+    return detections[keep], classes[keep]
@@ -0,0 +1,240 @@
+import bisect
+import http.server
+import json
+import threading
+import time
+import numpy as np
+
+# Upper bounds in seconds of the latency histogram buckets (Prometheus "le"), 50 us to 5 s
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+  """
+  Latency histogram of one timed stage: cumulative bucket counts since the
+  start, plus the last `window` samples for rolling percentiles.
+  """
+  def __init__(self, name, window=1024):
+    self.name = name
+    self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+    self.count = 0
+    self.sum = 0.0
+    self.max = 0.0
+    self._recent = np.zeros(window)
+    self._next = 0
+    self._lock = threading.Lock()
+
+  def observe(self, seconds, items=1):
+    """Record `items` samples that took `seconds` each."""
+    with self._lock:
+      self.buckets[bisect.bisect_left(BUCKETS, seconds)] += items
+      self.count += items
+      self.sum += seconds * items
+      self.max = max(self.max, seconds)
+      self._recent[self._next % len(self._recent)] = seconds
+      self._next += 1
+
+  def snapshot(self):
+    with self._lock:
+      recent = self._recent[:min(self._next, len(self._recent))]
+      p50, p95, p99 = np.percentile(recent, [50, 95, 99]) if len(recent) else (0.0, 0.0, 0.0)
+      return {
+        'count': self.count,
+        'sum': self.sum,
+        'buckets': [int(count) for count in np.cumsum(self.buckets)],
+        'mean_ms': 1000 * self.sum / self.count if self.count else 0.0,
+        'p50_ms': 1000 * p50,
+        'p95_ms': 1000 * p95,
+        'p99_ms': 1000 * p99,
+        'max_ms': 1000 * self.max,
+      }
+
+
+class _Timer:
+  __slots__ = ('histogram', 'start')
+
+  def __init__(self, histogram):
+    self.histogram = histogram
+
+  def __enter__(self):
+    self.start = time.monotonic()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.histogram.observe(time.monotonic() - self.start)
+
+
+class _NullTimer:
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+  """
+  Timers, counters and gauges for sizing a site's hardware.
+
+  Stages are timed with `with metrics.timer("sort"):` or by attaching a
+  StageStats, which then also feeds a histogram of the same name. Counters
+  (frames, detections, billing events) only go up; gauges (active tracks,
+  queue depths) hold the last value. Collectors are called just before a
+  snapshot to fill in gauges that are cheaper to read than to push.
+
+  A disabled Metrics hands out a shared no-op timer and returns straight
+  away from every update, so instrumented code pays one method call.
+  """
+  def __init__(self, enabled=True, window=1024, prefix="tollway"):
+    self.enabled = enabled
+    self.window = window
+    self.prefix = prefix
+    self.started = time.time()
+    self.histograms = {}
+    self.counters = {}
+    self.gauges = {}
+    self._collectors = []
+    self._lock = threading.Lock()
+
+  def histogram(self, name):
+    histogram = self.histograms.get(name)
+    if histogram is None:
+      with self._lock:
+        histogram = self.histograms.setdefault(name, Histogram(name, self.window))
+    return histogram
+
+  def timer(self, name):
+    if not self.enabled:
+      return _NULL_TIMER
+    return _Timer(self.histogram(name))
+
+  def observe(self, name, seconds, items=1):
+    if self.enabled:
+      self.histogram(name).observe(seconds, items)
+
+  def count(self, name, value=1):
+    if self.enabled:
+      with self._lock:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+  def gauge(self, name, value):
+    if self.enabled:
+      self.gauges[name] = value
+
+  def attach(self, stage_stats):
+    """Feed every StageStats.record() into the histogram named after the stage."""
+    if self.enabled:
+      stage_stats.observer = self.histogram(stage_stats.name)
+
+  def add_collector(self, collector):
+    """Call `collector(metrics)` before every snapshot, e.g. to set queue depth gauges."""
+    self._collectors.append(collector)
+
+  def snapshot(self):
+    for collector in self._collectors:
+      collector(self)
+    with self._lock:
+      counters = dict(self.counters)
+    return {
+      'time': time.time(),
+      'uptime_s': time.time() - self.started,
+      'stages': {name: h.snapshot() for name, h in list(self.histograms.items())},
+      'counters': counters,
+      'gauges': dict(self.gauges),
+    }
+
+  def to_json(self):
+    """One JSON line with rolling percentiles, without the raw buckets."""
+    snapshot = self.snapshot()
+    for stage in snapshot['stages'].values():
+      del stage['buckets'], stage['sum']
+      for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'):
+        stage[key] = round(stage[key], 3)
+    return json.dumps(snapshot, separators=(",", ":"))
+
+  def to_prometheus(self):
+    """The Prometheus text exposition format."""
+    snapshot = self.snapshot()
+    p = self.prefix
+    lines = [f"# HELP {p}_stage_seconds Time spent per item in each stage",
+             f"# TYPE {p}_stage_seconds histogram"]
+    for name, s in snapshot['stages'].items():
+      for bound, count in zip(BUCKETS + ("+Inf",), s['buckets']):
+        lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+      lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+      lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+
+    lines.append(f"# HELP {p}_stage_recent_seconds Percentiles over each stage's last {self.window} items")
+    lines.append(f"# TYPE {p}_stage_recent_seconds gauge")
+    for name, s in snapshot['stages'].items():
+      for quantile, key in (("0.5", 'p50_ms'), ("0.95", 'p95_ms'), ("0.99", 'p99_ms')):
+        lines.append(f'{p}_stage_recent_seconds{{stage="{name}",quantile="{quantile}"}} {s[key] / 1000:.6f}')
+
+    for name, value in snapshot['counters'].items():
+      lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {value}"]
+    for name, value in snapshot['gauges'].items():
+      lines += [f"# TYPE {p}_{name} gauge", f"{p}_{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+  """Serves metrics.to_prometheus() on http://host:port/metrics from a daemon thread."""
+  def __init__(self, metrics, port=9108, host="127.0.0.1"):
+    class Handler(http.server.BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+          self.send_error(404)
+          return
+        body = metrics.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass  # one line per scrape would drown the run's own output
+
+    self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+    self.port = self.server.server_address[1]
+    self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+
+  def start(self):
+    self._thread.start()
+    return self
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class MetricsLogger:
+  """Appends metrics.to_json() to `path` every `interval` seconds, and once more on close()."""
+  def __init__(self, metrics, path, interval=10.0):
+    self.metrics = metrics
+    self.path = path
+    self.interval = interval
+    self._stop_event = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="metrics-log", daemon=True)
+
+  def start(self):
+    self._thread.start()
+    return self
+
+  def close(self):
+    self._stop_event.set()
+    self._thread.join()
+    self._write()
+
+  def _run(self):
+    while not self._stop_event.wait(self.interval):
+      self._write()
+
+  def _write(self):
+    with open(self.path, 'a') as file:
+      file.write(self.metrics.to_json() + "\n")
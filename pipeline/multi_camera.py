@@ -0,0 +1,213 @@
+import csv
+import multiprocessing
+import os
+import queue
+import re
+import time
+import cv2
+from detectors import LaneCalibrationCache
+from trackers import VehicleTracker, Sort, BatchSort
+from utils import DetectionHistory, DetectionHistoryWriter
+from .billing import TollBilling
+from .frame_pipeline import FramePipeline
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker = {}
+
+
+def parse_camera(spec):
+  """
+  "camera_id=source" -> (camera_id, source). A bare source gets its file
+  name (without extension) as the camera ID.
+  """
+  if "=" in spec and not re.match(r'^[a-z]+://', spec):
+    camera_id, source = spec.split("=", 1)
+    return camera_id, source
+  return os.path.splitext(os.path.basename(spec.rstrip("/")))[0] or spec, spec
+
+
+def parse_cpu_sets(text):
+  """
+  "0-3;4-7" -> [{0, 1, 2, 3}, {4, 5, 6, 7}]: one CPU set per worker, taken
+  in turn. Sets may also list single CPUs ("0,2;1,3").
+  """
+  cpu_sets = []
+  for group in text.split(";"):
+    cpus = set()
+    for part in group.split(","):
+      if "-" in part:
+        first, last = part.split("-")
+        cpus.update(range(int(first), int(last) + 1))
+      elif part.strip():
+        cpus.add(int(part))
+    if cpus:
+      cpu_sets.append(cpus)
+  return cpu_sets
+
+
+class RecordForwarder:
+  """
+  History writer for one camera in a worker process: keeps the usual
+  per-camera CSV and counts, and forwards each batch of billing records to
+  the parent process tagged with the camera ID.
+  """
+  def __init__(self, camera_id, record_queue, output_dir, window=5000):
+    self.camera_id = camera_id
+    self.record_queue = record_queue
+    self.writer = DetectionHistoryWriter(
+      filename=f"{camera_id}_vehicle_detection_data.csv", output_dir=output_dir,
+      summary_filename=f"{camera_id}_lane_vehicle_counts.csv", window=window
+    )
+
+  def write(self, records):
+    self.writer.write(records)
+    if records:
+      self.record_queue.put(("records", self.camera_id, [record.to_dict() for record in records]))
+
+  def close(self):
+    self.writer.close()
+
+
+def _init_worker(model_path, cpu_sets, worker_counter, record_queue):
+  with worker_counter.get_lock():
+    index = worker_counter.value
+    worker_counter.value += 1
+
+  # Pin the worker before loading the model so its threads start on the right cores
+  if cpu_sets and hasattr(os, "sched_setaffinity"):
+    cpus = cpu_sets[index % len(cpu_sets)]
+    os.sched_setaffinity(0, cpus)
+    cv2.setNumThreads(len(cpus))
+    try:
+      import torch
+      torch.set_num_threads(len(cpus))
+    except ImportError:
+      pass
+
+  _worker['index'] = index
+  _worker['record_queue'] = record_queue
+  _worker['vehicle_tracker'] = VehicleTracker(model_path=model_path)  # loaded once, reused for every camera
+
+
+def _run_camera(camera_id, source, options):
+  """Run the full detect -> track -> bill pipeline for one camera in a pool worker."""
+  record_queue = _worker['record_queue']
+  cap = cv2.VideoCapture(source)
+  status, first_frame = cap.read()
+  if not status:
+    cap.release()
+    raise RuntimeError(f"Camera '{camera_id}': could not read from {source}")
+
+  calibration = LaneCalibrationCache(options.get('calibration_dir', "outputs/lane_calibration"))
+  lanes_detector, _, _ = calibration.load_or_detect(camera_id, first_frame)
+
+  tracker_class = BatchSort if options.get('tracker') == "batch" else Sort
+  tracker = tracker_class(class_votes=options.get('class_votes', False))
+
+  output_dir = options.get('output_dir', "outputs/cameras")
+  detection_history = DetectionHistory(
+    max_records=options.get('history_window', 5000),
+    spill_path=os.path.join(output_dir, f"{camera_id}_detection_history_spill.csv")
+  )
+  billing = TollBilling(lanes_detector, detection_history)
+  forwarder = RecordForwarder(camera_id, record_queue, output_dir, window=options.get('history_window', 5000))
+
+  pipeline = FramePipeline(
+    cap, _worker['vehicle_tracker'], tracker, billing,
+    queue_size=options.get('queue_size', 8), policy=options.get('policy', "block"), render=False,
+    batch_size=options.get('batch_size', 1), max_wait=options.get('max_wait', 0.05),
+    conf_threshold=options.get('conf', 0.5), history_writer=forwarder
+  )
+  start_time = time.monotonic()
+  pipeline.start()
+  try:
+    pipeline.join()
+  finally:
+    forwarder.close()
+    detection_history.close()
+    cap.release()
+
+  summary = {
+    'worker': _worker['index'],
+    'frames': pipeline.tracking_stage.stats.count,
+    'elapsed': time.monotonic() - start_time,
+    'vehicle_counts': dict(forwarder.writer.vehicle_counts),
+    'stats': pipeline.stats(),
+  }
+  # Queued after all of this camera's records, so the parent sees them first
+  record_queue.put(("done", camera_id, summary))
+  return summary
+
+
+class MultiCameraRunner:
+  """
+  Runs an independent detect -> track -> bill pipeline per camera on a
+  pool of worker processes, so one server uses all its cores.
+
+  Each worker loads the YOLO model once and runs one camera at a time; use
+  at least as many workers as cameras for live streams. Workers can be
+  pinned to CPU sets (`cpu_sets`, handed out in turn). Billing records of
+  all cameras come back as one stream of (camera_id, record) pairs from
+  `records()`, and are also written per camera under `output_dir`.
+  """
+  def __init__(self, cameras, model_path, workers=None, cpu_sets=None, options=None):
+    self.cameras = list(cameras)  # [(camera_id, source), ...]
+    self.model_path = model_path
+    self.workers = min(workers or os.cpu_count() or 1, len(self.cameras)) or 1
+    self.cpu_sets = cpu_sets or []
+    self.options = dict(options or {})
+    self.summaries = {}  # {camera_id: summary returned by the worker}
+    self.errors = {}  # {camera_id: exception}
+
+    camera_ids = [camera_id for camera_id, _ in self.cameras]
+    if len(set(camera_ids)) != len(camera_ids):
+      raise ValueError("camera IDs must be unique")
+
+  def records(self):
+    """Run every camera and yield (camera_id, record dict) as billing records arrive."""
+    context = multiprocessing.get_context("spawn")
+    record_queue = context.Queue()
+    worker_counter = context.Value('i', 0)
+
+    with context.Pool(self.workers, initializer=_init_worker,
+                      initargs=(self.model_path, self.cpu_sets, worker_counter, record_queue)) as pool:
+      pending = {
+        camera_id: pool.apply_async(_run_camera, (camera_id, source, self.options))
+        for camera_id, source in self.cameras
+      }
+
+      while pending:
+        try:
+          kind, camera_id, payload = record_queue.get(timeout=0.5)
+        except queue.Empty:
+          self._collect_failures(pending)
+          continue
+
+        if kind == "records":
+          for record in payload:
+            yield camera_id, record
+        elif kind == "done":
+          self.summaries[camera_id] = payload
+          pending.pop(camera_id, None)
+
+  def run(self, merged_path="outputs/all_cameras_detection_data.csv"):
+    """Run every camera, appending the merged record stream to `merged_path` with a camera_id column."""
+    os.makedirs(os.path.dirname(merged_path) or ".", exist_ok=True)
+    fieldnames = ['camera_id'] + DetectionHistoryWriter.FIELDNAMES
+    with open(merged_path, 'w', newline='') as csvfile:
+      writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+      writer.writeheader()
+      for camera_id, record in self.records():
+        writer.writerow(dict(record, camera_id=camera_id))
+        csvfile.flush()
+    return self.summaries
+
+  def _collect_failures(self, pending):
+    for camera_id, result in list(pending.items()):
+      if result.ready() and not result.successful():
+        try:
+          result.get()
+        except Exception as error:
+          print(f"Camera '{camera_id}' failed: {error!r}")
+          self.errors[camera_id] = error
+        pending.pop(camera_id)
@@ -0,0 +1,135 @@
+import collections
+import queue
+import threading
+
+
+class QueueClosed(Exception):
+  """Raised when putting to a closed queue, or getting from one that is closed and drained."""
+
+
+class BoundedQueue:
+  """
+  Thread-safe FIFO with a fixed capacity and a backpressure policy.
+
+  Policies:
+      "block":       put() waits for a free slot (file playback, nothing is lost)
+      "drop_oldest": put() evicts the oldest queued item (live feeds, stay current)
+
+  The queue keeps counters for its current and peak depth and for the
+  number of items dropped, which the pipeline reports per stage.
+  `on_drop` is called with every item that is dropped or discarded, so
+  items holding resources (such as shared frame slots) can give them back.
+  """
+  BLOCK = "block"
+  DROP_OLDEST = "drop_oldest"
+
+  def __init__(self, maxsize, policy=BLOCK, name="queue", on_drop=None):
+    if maxsize < 1:
+      raise ValueError("maxsize must be at least 1")
+    if policy not in (self.BLOCK, self.DROP_OLDEST):
+      raise ValueError(f"Unknown backpressure policy: {policy}")
+
+    self.name = name
+    self.maxsize = maxsize
+    self.policy = policy
+    self.on_drop = on_drop
+    self._items = collections.deque()
+    self._lock = threading.Lock()
+    self._not_empty = threading.Condition(self._lock)
+    self._not_full = threading.Condition(self._lock)
+    self._closed = False
+
+    self.put_count = 0
+    self.dropped = 0
+    self.max_depth = 0
+
+  def __len__(self):
+    with self._lock:
+      return len(self._items)
+
+  def __iter__(self):
+    """Yield items until the queue is closed and drained."""
+    while True:
+      try:
+        yield self.get()
+      except QueueClosed:
+        return
+
+  @property
+  def closed(self):
+    return self._closed
+
+  def put(self, item, timeout=None):
+    """
+    Add an item, applying the backpressure policy when the queue is full.
+
+    Returns False if a blocking put timed out, True otherwise.
+    """
+    dropped = None
+    with self._not_full:
+      if self._closed:
+        raise QueueClosed(self.name)
+
+      if len(self._items) >= self.maxsize:
+        if self.policy == self.DROP_OLDEST:
+          dropped = self._items.popleft()
+          self.dropped += 1
+        else:
+          if not self._not_full.wait_for(lambda: self._closed or len(self._items) < self.maxsize, timeout):
+            return False
+          if self._closed:
+            raise QueueClosed(self.name)
+
+      self._items.append(item)
+      self.put_count += 1
+      self.max_depth = max(self.max_depth, len(self._items))
+      self._not_empty.notify()
+
+    if dropped is not None and self.on_drop is not None:
+      self.on_drop(dropped)
+    return True
+
+  def get(self, timeout=None):
+    """
+    Remove and return the oldest item.
+
+    Raises queue.Empty if `timeout` expires, and QueueClosed once the queue
+    is closed and nothing is left in it.
+    """
+    with self._not_empty:
+      if not self._not_empty.wait_for(lambda: self._closed or self._items, timeout):
+        raise queue.Empty
+      if not self._items:
+        raise QueueClosed(self.name)
+
+      item = self._items.popleft()
+      self._not_full.notify()
+      return item
+
+  def close(self, discard=False):
+    """
+    Mark the end of the stream. Consumers still drain what is queued unless
+    `discard` is set, which is used when the whole pipeline is stopped.
+    """
+    discarded = []
+    with self._lock:
+      self._closed = True
+      if discard:
+        discarded = list(self._items)
+        self._items.clear()
+      self._not_empty.notify_all()
+      self._not_full.notify_all()
+
+    if self.on_drop is not None:
+      for item in discarded:
+        self.on_drop(item)
+
+  def stats(self):
+    with self._lock:
+      return {
+        'depth': len(self._items),
+        'max_depth': self.max_depth,
+        'capacity': self.maxsize,
+        'put': self.put_count,
+        'dropped': self.dropped,
+      }
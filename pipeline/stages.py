@@ -0,0 +1,85 @@
+import threading
+import time
+from .queues import QueueClosed
+
+
+class StageStats:
+  """
+  Running latency counters for one pipeline stage. With an `observer`
+  (a metrics Histogram, see Metrics.attach) every record also goes there.
+  """
+  def __init__(self, name):
+    self.name = name
+    self.observer = None
+    self.count = 0
+    self.total_time = 0.0
+    self.max_time = 0.0
+    self.last_time = 0.0
+    self._lock = threading.Lock()
+
+  def record(self, elapsed, items=1):
+    """Record `elapsed` seconds spent on `items` items (a batch counts once per item)."""
+    with self._lock:
+      self.count += items
+      self.total_time += elapsed
+      self.last_time = elapsed / items if items else elapsed
+      self.max_time = max(self.max_time, self.last_time)
+    if self.observer is not None:
+      self.observer.observe(elapsed / items if items else elapsed, items)
+
+  def as_dict(self):
+    with self._lock:
+      return {
+        'count': self.count,
+        'mean_ms': 1000 * self.total_time / self.count if self.count else 0.0,
+        'max_ms': 1000 * self.max_time,
+        'last_ms': 1000 * self.last_time,
+      }
+
+
+class Stage(threading.Thread):
+  """
+  Worker thread that takes items from `input_queue`, passes them through
+  `process` and puts the non-None results on `output_queue`.
+
+  The output queue is closed when the stage finishes, so the end of the
+  stream propagates downstream. An exception inside the stage is stored
+  on `error` and reported through `on_error` so the pipeline can stop.
+  """
+  def __init__(self, name, input_queue=None, output_queue=None, on_error=None):
+    super().__init__(name=name, daemon=True)
+    self.input_queue = input_queue
+    self.output_queue = output_queue
+    self.on_error = on_error
+    self.stats = StageStats(name)
+    self.error = None
+
+  def run(self):
+    try:
+      self.loop()
+    except QueueClosed:
+      # A downstream queue was closed because the pipeline is stopping
+      pass
+    except Exception as error:
+      self.error = error
+      if self.on_error is not None:
+        self.on_error(self, error)
+    finally:
+      if self.output_queue is not None:
+        self.output_queue.close()
+
+  def loop(self):
+    for item in self.input_queue:
+      start = time.monotonic()
+      result = self.process(item)
+      self.stats.record(time.monotonic() - start)
+
+      if result is not None:
+        self.emit(result)
+
+  def emit(self, item):
+    if self.output_queue is not None:
+      self.output_queue.put(item)
+
+  def process(self, item):
+    raise NotImplementedError
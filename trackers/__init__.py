@@ -1,2 +1,3 @@
-from .vehicle_tracker import VehicleTracker
-from .sort import Sort
\ No newline at end of file
+from .vehicle_tracker import VehicleTracker, FrameBatcher, results_to_detections
+from .sort import Sort
+from .batch_sort import BatchSort
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""
+    Vectorized SORT engine.
+
+    Same constant-velocity Kalman model, association and track management as
+    `Sort` in sort.py, but the state of every track is kept in stacked NumPy
+    arrays and predict/update run for all tracks at once instead of one
+    filterpy.KalmanFilter per track.
+"""
+import numpy as np
+
+from .sort import KalmanBoxTracker, associate_detections_to_trackers
+
+# State is [x, y, s, r, vx, vy, vs], measurement is [x, y, s, r] (see KalmanBoxTracker)
+DIM_X = 7
+DIM_Z = 4
+
+F = np.array(
+    [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
+     [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+H = np.eye(DIM_Z, DIM_X)
+
+R = np.eye(DIM_Z)
+R[2:, 2:] *= 10.
+
+P0 = np.eye(DIM_X)
+P0[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
+P0 *= 10.
+
+Q = np.eye(DIM_X)
+Q[-1, -1] *= 0.01
+Q[4:, 4:] *= 0.01
+
+
+def convert_bboxes_to_z(bboxes):
+    """
+    Vectorized convert_bbox_to_z: takes an (N, 4+) array of [x1,y1,x2,y2,...] boxes
+      and returns an (N, 4) array of [x,y,s,r] measurements
+    """
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    z = np.empty((len(bboxes), DIM_Z))
+    z[:, 0] = bboxes[:, 0] + w / 2.
+    z[:, 1] = bboxes[:, 1] + h / 2.
+    z[:, 2] = w * h  # scale is just area
+    z[:, 3] = w / h.astype(float)
+    return z
+
+
+def convert_states_to_bboxes(x):
+    """
+    Vectorized convert_x_to_bbox: takes an (N, 7) array of states and returns
+      an (N, 4) array of [x1,y1,x2,y2] boxes
+    """
+    with np.errstate(invalid='ignore'):
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+    return np.stack([x[:, 0] - w / 2., x[:, 1] - h / 2., x[:, 0] + w / 2., x[:, 1] + h / 2.], axis=1)
+
+
+class BatchSort(object):
+    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, gate=False, class_votes=False):
+        """
+        Sets key parameters for SORT
+        """
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.gate = gate
+        self.class_votes = class_votes
+        self.frame_count = 0
+
+        # One row per track, in the same order Sort keeps its trackers list
+        self.x = np.empty((0, DIM_X))
+        self.P = np.empty((0, DIM_X, DIM_X))
+        self.ids = np.empty((0,), dtype=int)
+        self.time_since_update = np.empty((0,), dtype=int)
+        self.hits = np.empty((0,), dtype=int)
+        self.hit_streak = np.empty((0,), dtype=int)
+        self.age = np.empty((0,), dtype=int)
+        self.cls = np.empty((0,), dtype=int)
+        self.votes = np.empty((0, 0))  # summed detection score per track (rows) and class (columns)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predict(self, count_miss=True):
+        """
+        Advances every track one frame and returns the predicted boxes as an (N, 4) array.
+          With count_miss unset the frame is not counted as a miss (the detector did not run on it).
+        """
+        reset = (self.x[:, 6] + self.x[:, 2]) <= 0
+        self.x[reset, 6] = 0.
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+
+        self.age += 1
+        if not count_miss:
+            return convert_states_to_bboxes(self.x)
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += 1
+        return convert_states_to_bboxes(self.x)
+
+    def correct(self, track_indices, dets):
+        """
+        Updates the given tracks with their observed detections in one batch.
+        """
+        x = self.x[track_indices]
+        P = self.P[track_indices]
+        z = convert_bboxes_to_z(dets)
+
+        y = z - x[:, :DIM_Z]
+        PHT = P[:, :, :DIM_Z]
+        S = PHT[:, :DIM_Z, :] + R
+        K = PHT @ np.linalg.inv(S)
+        x = x + (K @ y[:, :, None])[:, :, 0]
+
+        # Joseph form, as in filterpy, to keep P symmetric positive definite
+        I_KH = np.eye(DIM_X) - K @ H
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ R @ K.transpose(0, 2, 1)
+
+        self.x[track_indices] = x
+        self.P[track_indices] = P
+        self.time_since_update[track_indices] = 0
+        self.hits[track_indices] += 1
+        self.hit_streak[track_indices] += 1
+        self._add_class_votes(track_indices, dets)
+
+    def get_class(self):
+        """
+        Returns each track's class: the class of its last matched detection, or with class_votes
+          set the class with the highest summed score (lowest class index on ties).
+        """
+        if self.class_votes and self.votes.shape[1] > 0:
+            return self.votes.argmax(axis=1)
+        return self.cls
+
+    def get_state(self):
+        """
+        Returns the current bounding box estimate of every track as an (N, 4) array.
+        """
+        return convert_states_to_bboxes(self.x)
+
+    def update(self, dets=np.empty((0, 5))):
+        """
+        Params:
+          dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+        Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
+        Returns the a similar array, where the fifth column is the object ID, in the same order as Sort.update.
+          As with Sort, detections with a sixth class column add a sixth column with each track's class.
+
+        NOTE: The number of objects returned may differ from the number of detections provided.
+        """
+        self.frame_count += 1
+        with_class = dets.shape[1] > 5
+        # get predicted locations from existing trackers.
+        predicted = self.predict()
+        valid = ~np.any(np.isnan(predicted), axis=1)
+        if not valid.all():
+            self._keep(valid)
+            predicted = predicted[valid]
+        trks = np.hstack([predicted, np.zeros((len(predicted), 1))])
+
+        matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold, self.gate)
+
+        # update matched trackers with assigned detections
+        if len(matched) > 0:
+            matched = matched.astype(int)
+            self.correct(matched[:, 1], dets[matched[:, 0]])
+
+        # create and initialise new trackers for unmatched detections
+        if len(unmatched_dets) > 0:
+            self._add(dets[unmatched_dets.astype(int)])
+
+        # report confirmed tracks, newest first like Sort
+        reported = (self.time_since_update < 1) & ((self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+        reported = np.nonzero(reported)[0][::-1]
+        columns = [self.get_state()[reported], (self.ids[reported] + 1)[:, None]]  # +1 as MOT benchmark requires positive
+        if with_class:
+            columns.append(self.get_class()[reported][:, None])
+        ret = np.hstack(columns)
+
+        # remove dead tracklets
+        alive = self.time_since_update <= self.max_age
+        if not alive.all():
+            self._keep(alive)
+
+        if len(ret) > 0:
+            return ret
+        return np.empty((0, 6 if with_class else 5))
+
+    def advance(self, with_class=False):
+        """
+        Moves every track one frame along its motion model, for frames the detector skipped,
+          without counting a miss. Returns the tracks reported by the last update at their
+          predicted positions, in the same order and format as Sort.advance.
+        """
+        predicted = self.predict(count_miss=False)
+        reported = (self.time_since_update < 1) & ((self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+        reported &= ~np.any(np.isnan(predicted), axis=1)
+        reported = np.nonzero(reported)[0][::-1]
+        columns = [predicted[reported], (self.ids[reported] + 1)[:, None]]
+        if with_class:
+            columns.append(self.get_class()[reported][:, None])
+        ret = np.hstack(columns)
+
+        if len(ret) > 0:
+            return ret
+        return np.empty((0, 6 if with_class else 5))
+
+    def _add(self, dets):
+        n = len(dets)
+        x = np.zeros((n, DIM_X))
+        x[:, :DIM_Z] = convert_bboxes_to_z(dets)
+
+        # Share the id sequence with KalmanBoxTracker so both engines hand out the same ids
+        ids = np.arange(KalmanBoxTracker.count, KalmanBoxTracker.count + n)
+        KalmanBoxTracker.count += n
+
+        zeros = np.zeros((n,), dtype=int)
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, np.broadcast_to(P0, (n, DIM_X, DIM_X))])
+        self.ids = np.concatenate([self.ids, ids])
+        self.time_since_update = np.concatenate([self.time_since_update, zeros])
+        self.hits = np.concatenate([self.hits, zeros])
+        self.hit_streak = np.concatenate([self.hit_streak, zeros])
+        self.age = np.concatenate([self.age, zeros])
+        self.cls = np.concatenate([self.cls, np.full((n,), -1)])
+        self.votes = np.concatenate([self.votes, np.zeros((n, self.votes.shape[1]))])
+        self._add_class_votes(np.arange(len(self.ids) - n, len(self.ids)), dets)
+
+    def _add_class_votes(self, track_indices, dets):
+        if dets.shape[1] <= 5:
+            return
+        cls = dets[:, 5].astype(int)
+        if len(cls) > 0 and cls.max() >= self.votes.shape[1]:
+            grow = cls.max() + 1 - self.votes.shape[1]
+            self.votes = np.hstack([self.votes, np.zeros((len(self.votes), grow))])
+        self.cls[track_indices] = cls
+        self.votes[track_indices, cls] += dets[:, 4]
+
+    def _keep(self, mask):
+        self.x = self.x[mask]
+        self.P = self.P[mask]
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+        self.hits = self.hits[mask]
+        self.hit_streak = self.hit_streak[mask]
+        self.age = self.age[mask]
+        self.cls = self.cls[mask]
+        self.votes = self.votes[mask]
@@ -20,19 +20,70 @@ from __future__ import print_function
 import os
 import numpy as np
 from filterpy.kalman import KalmanFilter
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 np.random.seed(0)
 
 
+# Pick the assignment solver once, preferring lap's LAPJV over scipy's Hungarian
+try:
+    import lap
+except ImportError:
+    lap = None
+    from scipy.optimize import linear_sum_assignment
+
+
 def linear_assignment(cost_matrix):
-    try:
-        import lap
+    if lap is not None:
         _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
-        return np.array([[y[i], i] for i in x if i >= 0])  #
-    except ImportError:
-        from scipy.optimize import linear_sum_assignment
-        x, y = linear_sum_assignment(cost_matrix)
-        return np.array(list(zip(x, y)))
+        return np.array([[y[i], i] for i in x if i >= 0], dtype=int).reshape(-1, 2)
+    x, y = linear_sum_assignment(cost_matrix)
+    return np.stack([x, y], axis=1)
+
+
+def gated_linear_assignment(iou_matrix):
+    """
+    Solves the assignment separately for each connected component of the
+    graph linking detections and trackers whose boxes overlap (IOU > 0).
+    Pairs that do not overlap can never be kept as matches, so this gives
+    the same matches as one assignment over the full matrix, but on many
+    small problems instead of one large one. Finding the components has a
+    fixed cost, so this is slower than one assignment on toll plaza scenes
+    (see benchmarks.association); it only pays off on large scenes that
+    split into many small groups.
+    """
+    n_dets, n_trks = iou_matrix.shape
+    rows, cols = np.nonzero(iou_matrix > 0)
+    if len(rows) == 0:
+        return np.empty((0, 2), dtype=int)
+
+    graph = coo_matrix((np.ones(len(rows)), (rows, cols + n_dets)), shape=(n_dets + n_trks, n_dets + n_trks))
+    _, labels = connected_components(graph, directed=False)
+    det_labels = labels[:n_dets]
+    trk_labels = labels[n_dets:]
+
+    # Group detection and tracker indices by component
+    det_order = np.argsort(det_labels, kind='stable')
+    trk_order = np.argsort(trk_labels, kind='stable')
+    components = np.unique(det_labels[rows])
+    det_bounds = np.searchsorted(det_labels[det_order], [components, components + 1])
+    trk_bounds = np.searchsorted(trk_labels[trk_order], [components, components + 1])
+    det_counts = det_bounds[1] - det_bounds[0]
+    trk_counts = trk_bounds[1] - trk_bounds[0]
+
+    # One detection overlapping one tracker is a match without solving anything
+    single = (det_counts == 1) & (trk_counts == 1)
+    matches = [np.stack([det_order[det_bounds[0, single]], trk_order[trk_bounds[0, single]]], axis=1)]
+
+    for c in np.nonzero(~single)[0]:
+        det_idx = det_order[det_bounds[0, c]:det_bounds[1, c]]
+        trk_idx = trk_order[trk_bounds[0, c]:trk_bounds[1, c]]
+        sub = linear_assignment(-iou_matrix[np.ix_(det_idx, trk_idx)])
+        matches.append(np.stack([det_idx[sub[:, 0]], trk_idx[sub[:, 1]]], axis=1))
+
+    matches = np.concatenate(matches, axis=0)
+    return matches[np.argsort(matches[:, 0], kind='stable')]
 
 
 def iou_batch(bb_test, bb_gt):
@@ -114,6 +165,9 @@ class KalmanBoxTracker(object):
         self.hits = 0
         self.hit_streak = 0
         self.age = 0
+        self.cls = None
+        self.class_votes = {}  # {class: summed detection confidence}
+        self.add_class_vote(bbox)
 
     def update(self, bbox):
         """
@@ -124,15 +178,37 @@ class KalmanBoxTracker(object):
         self.hits += 1
         self.hit_streak += 1
         self.kf.update(convert_bbox_to_z(bbox))
+        self.add_class_vote(bbox)
+
+    def add_class_vote(self, bbox):
+        """
+        Records the class of a detection in the form [x1,y1,x2,y2,score,class], weighted by its score.
+        """
+        if len(bbox) > 5:
+            self.cls = int(bbox[5])
+            self.class_votes[self.cls] = self.class_votes.get(self.cls, 0.) + bbox[4]
+
+    def get_class(self, vote=False):
+        """
+        Returns the class of the last matched detection, or with vote set the class with the
+          highest summed score (lowest class index on ties).
+        """
+        if vote and self.class_votes:
+            return max(sorted(self.class_votes.items()), key=lambda item: item[1])[0]
+        return self.cls
 
-    def predict(self):
+    def predict(self, count_miss=True):
         """
         Advances the state vector and returns the predicted bounding box estimate.
+          With count_miss unset the frame is not counted as a miss (the detector did not run on it).
         """
         if ((self.kf.x[6] + self.kf.x[2]) <= 0):
             self.kf.x[6] *= 0.0
         self.kf.predict()
         self.age += 1
+        if not count_miss:
+            self.history.append(convert_x_to_bbox(self.kf.x))
+            return self.history[-1]
         if (self.time_since_update > 0):
             self.hit_streak = 0
         self.time_since_update += 1
@@ -146,10 +222,15 @@ class KalmanBoxTracker(object):
         return convert_x_to_bbox(self.kf.x)
 
 
-def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
+def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3, gate=False):
     """
     Assigns detections to tracked object (both represented as bounding boxes)
 
+    If gate is set, the assignment is solved per group of overlapping boxes
+    (see gated_linear_assignment) instead of over the whole cost matrix.
+    Leave it off unless scenes are large and split into many small groups:
+    on 10 to 400 boxes it is slower than the default, not faster.
+
     Returns 3 lists of matches, unmatched_detections and unmatched_trackers
     """
     if (len(trackers) == 0):
@@ -161,44 +242,37 @@ def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
         a = (iou_matrix > iou_threshold).astype(np.int32)
         if a.sum(1).max() == 1 and a.sum(0).max() == 1:
             matched_indices = np.stack(np.where(a), axis=1)
+        elif gate:
+            matched_indices = gated_linear_assignment(iou_matrix)
         else:
             matched_indices = linear_assignment(-iou_matrix)
     else:
-        matched_indices = np.empty(shape=(0, 2))
+        matched_indices = np.empty(shape=(0, 2), dtype=int)
 
-    unmatched_detections = []
-    for d, det in enumerate(detections):
-        if (d not in matched_indices[:, 0]):
-            unmatched_detections.append(d)
-    unmatched_trackers = []
-    for t, trk in enumerate(trackers):
-        if (t not in matched_indices[:, 1]):
-            unmatched_trackers.append(t)
+    detection_matched = np.zeros(len(detections), dtype=bool)
+    detection_matched[matched_indices[:, 0]] = True
+    tracker_matched = np.zeros(len(trackers), dtype=bool)
+    tracker_matched[matched_indices[:, 1]] = True
 
     # filter out matched with low IOU
-    matches = []
-    for m in matched_indices:
-        if (iou_matrix[m[0], m[1]] < iou_threshold):
-            unmatched_detections.append(m[0])
-            unmatched_trackers.append(m[1])
-        else:
-            matches.append(m.reshape(1, 2))
-    if (len(matches) == 0):
-        matches = np.empty((0, 2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
+    low_iou = iou_matrix[matched_indices[:, 0], matched_indices[:, 1]] < iou_threshold
+    matches = matched_indices[~low_iou]
+    unmatched_detections = np.concatenate([np.nonzero(~detection_matched)[0], matched_indices[low_iou, 0]])
+    unmatched_trackers = np.concatenate([np.nonzero(~tracker_matched)[0], matched_indices[low_iou, 1]])
 
-    return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+    return matches, unmatched_detections, unmatched_trackers
 
 
 class Sort(object):
-    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, gate=False, class_votes=False):
         """
         Sets key parameters for SORT
         """
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
+        self.gate = gate
+        self.class_votes = class_votes
         self.trackers = []
         self.frame_count = 0
 
@@ -206,12 +280,15 @@ class Sort(object):
         """
         Params:
           dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+            or [[x1,y1,x2,y2,score,class],...] to carry the detector class through tracking
         Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
-        Returns the a similar array, where the last column is the object ID.
+        Returns the a similar array, where the fifth column is the object ID. If dets has a class column, a sixth
+          column holds each track's class (the voted class if class_votes is set).
 
         NOTE: The number of objects returned may differ from the number of detections provided.
         """
         self.frame_count += 1
+        with_class = dets.shape[1] > 5
         # get predicted locations from existing trackers.
         trks = np.zeros((len(self.trackers), 5))
         to_del = []
@@ -224,7 +301,7 @@ class Sort(object):
         trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
         for t in reversed(to_del):
             self.trackers.pop(t)
-        matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold)
+        matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold, self.gate)
 
         # update matched trackers with assigned detections
         for m in matched:
@@ -238,11 +315,36 @@ class Sort(object):
         for trk in reversed(self.trackers):
             d = trk.get_state()[0]
             if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
-                ret.append(np.concatenate((d, [trk.id + 1])).reshape(1, -1))  # +1 as MOT benchmark requires positive
+                row = [trk.id + 1]  # +1 as MOT benchmark requires positive
+                if with_class:
+                    row.append(trk.get_class(self.class_votes))
+                ret.append(np.concatenate((d, row)).reshape(1, -1))
             i -= 1
             # remove dead tracklet
             if (trk.time_since_update > self.max_age):
                 self.trackers.pop(i)
         if (len(ret) > 0):
             return np.concatenate(ret)
-        return np.empty((0, 5))
\ No newline at end of file
+        return np.empty((0, 6 if with_class else 5))
+
+    def advance(self, with_class=False):
+        """
+        Moves every track one frame along its motion model, for frames the detector skipped.
+          Unlike update with no detections this is not counted as a miss, so tracks keep their
+          hit streaks and are not aged out; the next update matches against the advanced boxes.
+        Returns the tracks reported by the last update at their predicted positions, in the
+          same format as update (with a class column if with_class is set).
+        """
+        ret = []
+        for trk in reversed(self.trackers):
+            d = trk.predict(count_miss=False)[0]
+            if np.any(np.isnan(d)):
+                continue
+            if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
+                row = [trk.id + 1]  # +1 as MOT benchmark requires positive
+                if with_class:
+                    row.append(trk.get_class(self.class_votes))
+                ret.append(np.concatenate((d, row)).reshape(1, -1))
+        if (len(ret) > 0):
+            return np.concatenate(ret)
+        return np.empty((0, 6 if with_class else 5))
\ No newline at end of file
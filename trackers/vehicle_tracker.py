@@ -1,8 +1,130 @@
+import time
+import numpy as np
 from ultralytics import YOLO
 
 class VehicleTracker:
   def __init__(self, model_path):
     self.model = YOLO(model_path)
-    
+
   def track(self, image):
-    return self.model(image, stream=True)
\ No newline at end of file
+    return self.model(image, stream=True)
+
+  def track_batch(self, images, imgsz=None):
+    """
+    Run the model once on a list of ROI crops.
+
+    Crops of the same shape are letterboxed together and stacked into a
+    single input tensor, so the per-call overhead is paid once per batch.
+
+    Args:
+        images: List of BGR images (normally the ROI of consecutive frames)
+        imgsz: Model input size as an int or [height, width] (default: the model's own)
+
+    Returns:
+        A list with one result per image, in the same order as `images`
+    """
+    if len(images) == 0:
+      return []
+    if imgsz is not None:
+      return self.model(list(images), stream=False, verbose=False, imgsz=imgsz)
+    return self.model(list(images), stream=False, verbose=False)
+
+
+def results_to_detections(result, offset=(0, 0), conf_threshold=0.5, scale=1.0):
+  """
+  Convert one ultralytics result into SORT input with whole-array operations.
+
+  Box corners are truncated to integer pixels and shifted by `offset`
+  (the crop's top-left corner in the frame), confidences are rounded up
+  to two decimals, and boxes at or below `conf_threshold` are dropped,
+  the same as the old per-box loop in main.py.
+
+  Args:
+      result: A single ultralytics Results object
+      offset: (x, y) position of the inferred image inside the full frame
+      conf_threshold: Minimum confidence (exclusive) for a box to be kept
+      scale: How much the inferred image was resized from the frame; boxes
+          are divided by it before the offset is added
+
+  Returns:
+      detections: (N, 5) array of [x1, y1, x2, y2, conf] in frame coordinates
+      classes: (N,) int array with the class index of each detection row
+  """
+  boxes = result.boxes
+  if len(boxes) == 0:
+    return np.empty((0, 5)), np.empty((0,), dtype=int)
+
+  if hasattr(boxes, 'cpu'):
+    boxes = boxes.cpu().numpy()
+  xyxy = np.asarray(boxes.xyxy)
+  conf = np.asarray(boxes.conf, dtype=np.float32)
+  cls = np.asarray(boxes.cls)
+
+  # Round up to two decimals in float32, like math.ceil(box.conf[0] * 100) / 100 on the tensor
+  conf = np.ceil(conf * np.float32(100)).astype(float) / 100
+  keep = conf > conf_threshold
+
+  detections = np.empty((int(keep.sum()), 5))
+  detections[:, :4] = (xyxy[keep] / scale if scale != 1.0 else xyxy[keep]).astype(int)
+  detections[:, [0, 2]] += offset[0]
+  detections[:, [1, 3]] += offset[1]
+  detections[:, 4] = conf[keep]
+  return detections, cls[keep].astype(int)
+
+
+class FrameBatcher:
+  """
+  Collect ROI crops from consecutive frames and run them through a
+  VehicleTracker as one batch.
+
+  A batch is run when `batch_size` crops are pending or when the oldest
+  pending crop has waited `max_wait` seconds, whichever comes first.
+  Results are returned as (key, result) pairs in the order the crops
+  were added, so the caller can hand them to SORT frame by frame.
+  """
+  def __init__(self, vehicle_tracker, batch_size=8, max_wait=0.1):
+    if batch_size < 1:
+      raise ValueError("batch_size must be at least 1")
+    self.vehicle_tracker = vehicle_tracker
+    self.batch_size = batch_size
+    self.max_wait = max_wait
+    self._keys = []
+    self._images = []
+    self._first_added = None
+
+  def __len__(self):
+    return len(self._images)
+
+  def add(self, key, image):
+    """Queue a crop; returns the finished batch if this crop completed one, else []."""
+    if not self._images:
+      self._first_added = time.monotonic()
+    self._keys.append(key)
+    self._images.append(image)
+
+    if self.ready():
+      return self.flush()
+    return []
+
+  def remaining_wait(self):
+    """Seconds left before the pending batch must be run (None if nothing is pending)."""
+    if not self._images:
+      return None
+    return max(0.0, self.max_wait - (time.monotonic() - self._first_added))
+
+  def ready(self):
+    if not self._images:
+      return False
+    return len(self._images) >= self.batch_size or self.remaining_wait() == 0.0
+
+  def flush(self):
+    """Run whatever is pending, even a partial batch."""
+    if not self._images:
+      return []
+
+    keys, images = self._keys, self._images
+    self._keys, self._images = [], []
+    self._first_added = None
+
+    results = self.vehicle_tracker.track_batch(images)
+    return list(zip(keys, results))
@@ -1,7 +1,13 @@
-from .bbox_utils import get_center_of_bbox
+from .bbox_utils import get_center_of_bbox, get_roi_start
+from .detection_history import DetectionHistory, DetectionRecord
+from .detection_store import DetectionStore
 from .display_utils import (
     draw_detection_boundary,
+    draw_tracking_overlay,
     display_detection_history_window
 )
 from .calculate_toll_fee import calculate_toll_fee
-from .save_detect_history import save_detection_history_to_csv
\ No newline at end of file
+from .save_detect_history import save_detection_history_to_csv, DetectionHistoryWriter, load_lane_vehicle_counts
+from .evaluation import (
+    billable_passed, billed_counts, count_errors, count_error_table, fee_errors, pareto_front, truth_from_passed
+)
\ No newline at end of file
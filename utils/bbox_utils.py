@@ -1,3 +1,7 @@
 def get_center_of_bbox(bbox):
     x, _, w, _ = bbox
-    return (x + w / 2, 0)
\ No newline at end of file
+    return (x + w / 2, 0)
+
+def get_roi_start(height):
+    """Return the first row of the detection region of interest for a frame of the given height."""
+    return (height // 2) + 50
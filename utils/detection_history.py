@@ -0,0 +1,185 @@
+import bisect
+import csv
+import os
+import threading
+
+
+class DetectionRecord:
+    """
+    One billed vehicle. Slotted to keep long histories compact, but it can
+    also be read like the dicts the rest of the code uses (record['lane'],
+    record.get('toll_fee', 0)).
+    """
+    FIELDS = ('id', 'vehicle_type', 'lane', 'time', 'payment_status', 'toll_fee')
+    __slots__ = FIELDS
+
+    def __init__(self, id, vehicle_type, lane, time, payment_status, toll_fee):
+        self.id = id
+        self.vehicle_type = vehicle_type
+        self.lane = lane
+        self.time = time
+        self.payment_status = payment_status
+        self.toll_fee = toll_fee
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.FIELDS else default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"DetectionRecord({self.to_dict()})"
+
+
+class DetectionHistory:
+    """
+    In-memory store of billed vehicles with O(1) lookup by track id and
+    secondary indexes by lane and by vehicle type.
+
+    At most `max_records` records are kept in memory. When the window is
+    full the oldest record is appended to `spill_path` (if set) and dropped
+    from memory and the indexes. If a spilled id is billed again it is
+    added back as a new record.
+
+    All methods are thread-safe, so the tracking stage can write while the
+    render thread reads. `version` increases on every change and can be
+    used to tell whether anything changed since it was last read.
+    """
+    def __init__(self, max_records=5000, spill_path=None):
+        self.max_records = max_records
+        self.spill_path = spill_path
+        self.spilled_count = 0
+        self.version = 0
+
+        self._records = {}  # {id: record}, oldest first
+        self._by_lane = {}  # {lane: {id: record}}
+        self._by_type = {}  # {vehicle_type: {id: record}}
+        self._order = {}  # {id: insertion number}, which keeps the indexes in the order records were added
+        self._sequence = 0
+        self._lock = threading.RLock()
+        self._spill_file = None
+        self._spill_writer = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, id):
+        return id in self._records
+
+    def __iter__(self):
+        """Iterate over a snapshot of the in-memory records, oldest first."""
+        with self._lock:
+            return iter(list(self._records.values()))
+
+    def get(self, id, default=None):
+        return self._records.get(id, default)
+
+    def upsert(self, id, vehicle_type, lane, time, payment_status, toll_fee):
+        """Add a record for `id`, or update the existing one in place. Returns the record."""
+        with self._lock:
+            record = self._records.get(id)
+
+            if record is None:
+                record = DetectionRecord(id, vehicle_type, lane, time, payment_status, toll_fee)
+                self._records[id] = record
+                self._sequence += 1
+                self._order[id] = self._sequence
+                self._index(record)
+                if len(self._records) > self.max_records:
+                    self._spill_oldest()
+            else:
+                if record.lane != lane or record.vehicle_type != vehicle_type:
+                    self._unindex(record)
+                    record.lane = lane
+                    record.vehicle_type = vehicle_type
+                    self._index(record)
+                record.time = time
+                record.payment_status = payment_status
+                record.toll_fee = toll_fee
+
+            self.version += 1
+            return record
+
+    def by_lane(self, lane):
+        """Records in `lane`, oldest first (lane 0 means all lanes)."""
+        with self._lock:
+            if lane == 0:
+                return list(self._records.values())
+            return list(self._by_lane.get(lane, {}).values())
+
+    def by_type(self, vehicle_type):
+        """Records of `vehicle_type`, oldest first."""
+        with self._lock:
+            return list(self._by_type.get(vehicle_type, {}).values())
+
+    def count(self, lane=0):
+        with self._lock:
+            if lane == 0:
+                return len(self._records)
+            return len(self._by_lane.get(lane, {}))
+
+    def latest(self, n, lane=0):
+        """The newest `n` records in `lane` (0 for all lanes), oldest first."""
+        with self._lock:
+            records = self._records if lane == 0 else self._by_lane.get(lane, {})
+            latest = []
+            for record in reversed(records.values()):
+                if len(latest) >= n:
+                    break
+                latest.append(record)
+            latest.reverse()
+            return latest
+
+    def close(self):
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+                self._spill_writer = None
+
+    def _index(self, record):
+        for index, key in ((self._by_lane, record.lane), (self._by_type, record.vehicle_type)):
+            bucket = index.setdefault(key, {})
+            order = self._order[record.id]
+            if not bucket or self._order[next(reversed(bucket))] < order:
+                bucket[record.id] = record
+            else:
+                # A record moved to another lane or class goes back to its place by
+                # first insertion, not to the end
+                items = list(bucket.items())
+                position = bisect.bisect([self._order[id] for id, _ in items], order)
+                items.insert(position, (record.id, record))
+                index[key] = dict(items)
+
+    def _unindex(self, record):
+        for index, key in ((self._by_lane, record.lane), (self._by_type, record.vehicle_type)):
+            bucket = index[key]
+            del bucket[record.id]
+            if not bucket:
+                del index[key]
+
+    def _spill_oldest(self):
+        oldest_id = next(iter(self._records))
+        record = self._records.pop(oldest_id)
+        self._unindex(record)
+        del self._order[oldest_id]
+
+        if self.spill_path is not None:
+            if self._spill_writer is None:
+                os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+                new_file = not os.path.exists(self.spill_path)
+                self._spill_file = open(self.spill_path, 'a', newline='', buffering=64 * 1024)
+                self._spill_writer = csv.writer(self._spill_file)
+                if new_file:
+                    self._spill_writer.writerow(DetectionRecord.FIELDS)
+            self._spill_writer.writerow([getattr(record, field) for field in DetectionRecord.FIELDS])
+        self.spilled_count += 1
@@ -0,0 +1,231 @@
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from .detection_history import DetectionRecord
+
+_FLUSH = object()  # queue markers for the writer thread
+_STOP = object()
+
+
+class DetectionStore:
+    """
+    Billed vehicles in an embedded SQLite database, for histories that
+    outlive the process or grow past what should be kept in memory.
+
+    It offers the same upsert/latest/count interface as DetectionHistory, so
+    it can stand in for it in TollBilling and the history panel. upsert()
+    only queues the row. A writer thread commits queued rows in batches of
+    up to `batch_size`, at least every `flush_interval` seconds, one
+    transaction per batch. The database runs in WAL mode, so the panel's
+    reads never wait for a write. Reads see committed rows only, so they can
+    trail upsert() by up to `flush_interval` seconds; call flush() first
+    where that matters. `version` increases after every committed batch.
+
+    Records are kept in the order they were first added, as in
+    DetectionHistory: an update keeps the record's place. Track IDs start
+    over with every process, so each run gets its own `run_id` (its start
+    time unless given) and records are unique per (run, id). Queries cover
+    the current run unless `all_runs` is set. The lane and class indexes
+    lead with the run for the same reason.
+
+    With path ":memory:" nothing is saved; the writer thread and the
+    readers then share one connection, since each connection to ":memory:"
+    would open a separate, empty database.
+    """
+    COLUMNS = ('run',) + DetectionRecord.FIELDS
+
+    def __init__(self, path="outputs/detection_history.db", run_id=None, batch_size=200, flush_interval=1.0):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.version = 0
+        self.written = 0
+        self.batches = 0
+        self.last_error = None
+
+        self._queue = queue.Queue()
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.executescript(
+            # seq is the rowid, so it follows insertion order and an upsert keeps it
+            "CREATE TABLE IF NOT EXISTS detections ("
+            "seq INTEGER PRIMARY KEY, run TEXT NOT NULL, id INTEGER NOT NULL, vehicle_type TEXT, lane INTEGER, "
+            "time TEXT, payment_status TEXT, toll_fee INTEGER, UNIQUE (run, id));"
+            # With seq last, "latest N" and paging are read in index order and stop after N rows
+            "CREATE INDEX IF NOT EXISTS detections_lane ON detections (run, lane, seq);"
+            "CREATE INDEX IF NOT EXISTS detections_run ON detections (run, seq);"
+            "CREATE INDEX IF NOT EXISTS detections_vehicle_type ON detections (run, vehicle_type, seq);"
+        )
+        self._thread = threading.Thread(target=self._run, name="detection-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode this is still crash safe; a power cut can only lose the last commits
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def upsert(self, id, vehicle_type, lane, time, payment_status, toll_fee):
+        """Queue a new or updated record for `id` and return it; the row is written on the next batch."""
+        record = DetectionRecord(id, vehicle_type, lane, time, payment_status, toll_fee)
+        self._queue.put((self.run_id, id, vehicle_type, lane, time, payment_status, toll_fee))
+        return record
+
+    def flush(self):
+        """Commit queued records now and wait until they are written."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def latest(self, n, lane=0, all_runs=False):
+        """The newest `n` records in `lane` (0 for all lanes), oldest first."""
+        where, params = self._where(lane, all_runs)
+        rows = self._query(
+            f"SELECT {self._fields()} FROM detections {where} ORDER BY seq DESC LIMIT ?", params + [n]
+        )
+        return [DetectionRecord(*row) for row in reversed(rows)]
+
+    def count(self, lane=0, all_runs=False):
+        where, params = self._where(lane, all_runs)
+        return self._query(f"SELECT COUNT(*) FROM detections {where}", params)[0][0]
+
+    def by_lane(self, lane, all_runs=False):
+        """Records in `lane`, oldest first (lane 0 means all lanes)."""
+        where, params = self._where(lane, all_runs)
+        rows = self._query(f"SELECT {self._fields()} FROM detections {where} ORDER BY seq", params)
+        return [DetectionRecord(*row) for row in rows]
+
+    def by_type(self, vehicle_type, all_runs=False):
+        """Records of `vehicle_type`, oldest first."""
+        where, params = self._where(0, all_runs)
+        where += (" AND " if where else "WHERE ") + "vehicle_type = ?"
+        rows = self._query(f"SELECT {self._fields()} FROM detections {where} ORDER BY seq", params + [vehicle_type])
+        return [DetectionRecord(*row) for row in rows]
+
+    def get(self, id, default=None):
+        rows = self._query(f"SELECT {self._fields()} FROM detections WHERE run = ? AND id = ?", [self.run_id, id])
+        return DetectionRecord(*rows[0]) if rows else default
+
+    def lane_vehicle_counts(self, all_runs=False):
+        """{lane: {vehicle_type: count}}, the layout of load_lane_vehicle_counts."""
+        where, params = self._where(0, all_runs)
+        counts = {}
+        for lane, vehicle_type, count in self._query(
+            f"SELECT lane, vehicle_type, COUNT(*) FROM detections {where} GROUP BY lane, vehicle_type", params
+        ):
+            counts.setdefault(lane, {})[vehicle_type] = count
+        return counts
+
+    def vehicle_counts(self, lane=0, all_runs=False):
+        """{vehicle_type: count} in `lane` (0 for all lanes)."""
+        where, params = self._where(lane, all_runs)
+        return dict(self._query(f"SELECT vehicle_type, COUNT(*) FROM detections {where} GROUP BY vehicle_type", params))
+
+    def lane_fees(self, all_runs=False):
+        """{lane: total toll fee}."""
+        where, params = self._where(0, all_runs)
+        return dict(self._query(f"SELECT lane, SUM(toll_fee) FROM detections {where} GROUP BY lane", params))
+
+    def runs(self):
+        """[(run_id, records)] of every run in the database, oldest first."""
+        return self._query("SELECT run, COUNT(*) FROM detections GROUP BY run ORDER BY run")
+
+    def iter_records(self, all_runs=False, chunk_size=1000):
+        """Iterate over the records, oldest first, reading `chunk_size` rows at a time."""
+        where, params = self._where(0, all_runs)
+        where += " AND " if where else "WHERE "
+        after = 0
+        while True:
+            rows = self._query(
+                f"SELECT {self._fields()}, seq FROM detections {where}seq > ? ORDER BY seq LIMIT ?",
+                params + [after, chunk_size]
+            )
+            for row in rows:
+                yield DetectionRecord(*row[:-1])
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1][-1]
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def __len__(self):
+        return self.count()
+
+    def __contains__(self, id):
+        return self.get(id) is not None
+
+    def close(self):
+        """Commit what is queued, stop the writer thread and close the database."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def _fields(self):
+        return ", ".join(DetectionRecord.FIELDS)
+
+    def _where(self, lane, all_runs):
+        conditions, params = [], []
+        if not all_runs:
+            conditions.append("run = ?")
+            params.append(self.run_id)
+        if lane != 0:
+            conditions.append("lane = ?")
+            params.append(lane)
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def _run(self):
+        shared = self.path == ":memory:"
+        connection = self._reader if shared else self._connect()
+        # Readers only need the lock when they share the writer's connection
+        lock = self._read_lock if shared else contextlib.nullcontext()
+        insert = (f"INSERT INTO detections ({', '.join(self.COLUMNS)}) "
+                  f"VALUES ({', '.join('?' * len(self.COLUMNS))}) ON CONFLICT (run, id) DO UPDATE SET "
+                  + ", ".join(f"{column} = excluded.{column}" for column in DetectionRecord.FIELDS[1:]))
+        stopping = False
+        while not stopping:
+            batch = []
+            markers = 0
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP or item is _FLUSH:
+                    markers += 1
+                    stopping = item is _STOP
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    with lock, connection:
+                        connection.executemany(insert, batch)
+                    self.written += len(batch)
+                    self.batches += 1
+                    self.version += 1
+                except sqlite3.Error as error:
+                    self.last_error = error
+                    print(f"Detection store: {len(batch)} records not written to {self.path} ({error!r})")
+            for _ in range(len(batch) + markers):
+                self._queue.task_done()
+        if not shared:
+            connection.close()
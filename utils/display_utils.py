@@ -1,6 +1,10 @@
 import datetime
 import cv2
+import cvzone
 import numpy as np
+from constants import CLASS_NAMES
+from .detection_history import DetectionHistory
+from .detection_store import DetectionStore
 
 def draw_detection_boundary(frame, roi_start, width):
     """Draw a horizontal line showing the vehicle detection boundary."""
@@ -9,47 +13,76 @@ def draw_detection_boundary(frame, roi_start, width):
                 cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
     return frame
 
-def create_detection_history_image(detection_history, width=1200, height=800, selected_lane=0):
-    """
-    Create an image showing recent detection history with payment status.
-    Latest detections will appear at the bottom of the table.
-    
-    Args:
-        detection_history: List of detection records
-        width: Width of the history image (increased from 900 to 1200)
-        height: Height of the history image (increased from 600 to 800)
-        selected_lane: Lane to filter by (0 for all lanes)
-        
-    Returns:
-        An image containing the detection history
-    """
-    # Create a blank image with white background
-    history_image = np.ones((height, width, 3), dtype=np.uint8) * 255
-    
-    # Header dimensions with increased height to prevent overlap
-    header_height = 90
-    row_height = 50
-    
-    # Column widths - adjusted for larger window and adding toll fee column
+def draw_tracking_overlay(frame, detections, detection_classes, tracks):
+    """Label each detection with its class and draw an ID tag and corner box for each track."""
+    for det, cls in zip(detections, detection_classes):
+        x1, y2 = int(det[0]), int(det[3])
+        cvzone.putTextRect(frame, f"{CLASS_NAMES[int(cls)]}", (x1, y2+20), 1, 1, offset=5)
+
+    for track in tracks:
+        x1, y1, x2, y2, id = [int(v) for v in track[:5]]
+        w, h = x2 - x1, y2 - y1
+
+        # Display vehicle ID
+        cvzone.putTextRect(frame, f"ID: {id}", (x1, y1-20), 1, 1, offset=5)
+        cvzone.cornerRect(frame, (x1, y1, w, h), 10, rt=1)
+    return frame
+
+# Layout of the detection history panel
+HISTORY_HEADER_HEIGHT = 90  # Header height increased to prevent overlap
+HISTORY_ROW_HEIGHT = 50
+HISTORY_HEADERS = ["Detection Time", "Vehicle Type", "Lane", "ID", "Toll Fee", "Payment Status"]
+
+def _history_column_widths(width):
+    """Column widths - adjusted for larger window and adding toll fee column."""
     time_col_width = 240
     type_col_width = 180
     lane_col_width = 100
     id_col_width = 100
-    toll_fee_col_width = 100  # New column for toll fee
+    toll_fee_col_width = 100
     status_col_width = width - time_col_width - type_col_width - lane_col_width - id_col_width - toll_fee_col_width - 40
+    return [time_col_width, type_col_width, lane_col_width, id_col_width, toll_fee_col_width, status_col_width]
+
+def _history_visible_rows(height):
+    return (height - HISTORY_HEADER_HEIGHT - HISTORY_ROW_HEIGHT - 20) // HISTORY_ROW_HEIGHT
+
+def _gradient(steps, start, delta):
+    """Colours fading linearly from `start` by `delta` (per BGR channel) over `steps` steps."""
+    factor = np.arange(steps)[:, None] / steps
+    return (np.array(start) - factor * np.array(delta)).astype(np.uint8)
+
+def _blend_region(image, region, overlay, alpha):
+    """Alpha-blend `overlay` into image[region], the same as blending a full copy but touching only the region."""
+    image[region] = cv2.addWeighted(overlay, alpha, image[region], 1 - alpha, 0)
+
+def _latest_history_records(detection_history, n, selected_lane):
+    """Return the newest `n` records for the selected lane, oldest first."""
+    if isinstance(detection_history, (DetectionHistory, DetectionStore)):
+        return detection_history.latest(n, selected_lane)
+    if selected_lane == 0:
+        filtered_history = detection_history
+    else:
+        filtered_history = [record for record in detection_history if record['lane'] == selected_lane]
+    return list(filtered_history[max(0, len(filtered_history) - n):]) if n > 0 else []
+
+def create_history_chrome(width=1200, height=800, selected_lane=0):
+    """
+    Draw everything in the detection history panel that does not depend on
+    the records: background, lane filter buttons, column headers and
+    separators. Gradients are built as arrays instead of one cv2.line per
+    pixel row or column.
+    """
+    header_height = HISTORY_HEADER_HEIGHT
+    row_height = HISTORY_ROW_HEIGHT
+    col_widths = _history_column_widths(width)
     
-    # Draw a rounded rectangle for the main content area - lighter color for white theme
-    content_img = history_image.copy()
-    cv2.rectangle(content_img, 
-                 (15, header_height-10), 
-                 (width-15, height-15), 
-                 (240, 240, 245), -1)
+    # Create a blank image with white background
+    history_image = np.full((height, width, 3), 255, dtype=np.uint8)
     
-    # Apply rounded corners effect using alpha blending
-    alpha = 0.95
-    mask = np.zeros((height, width), dtype=np.uint8)
-    cv2.rectangle(mask, (20, header_height-5), (width-20, height-20), 255, -1, cv2.LINE_AA)
-    cv2.addWeighted(content_img, alpha, history_image, 1-alpha, 0, history_image)
+    # Draw the main content area - lighter color for white theme, blended over the background
+    content_region = (slice(header_height - 10, height - 14), slice(15, width - 14))
+    content_fill = np.full_like(history_image[content_region], (240, 240, 245))
+    _blend_region(history_image, content_region, content_fill, 0.95)
     
     # Lane selection buttons with modern styling - positioned lower to avoid overlap with title
     button_width = 80
@@ -64,46 +97,27 @@ def create_detection_history_image(detection_history, width=1200, height=800, se
                (button_x, button_y - 10),
                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 80), 1, cv2.LINE_AA)
     
-    # "All Lanes" button
-    button_color = (220, 240, 220) if selected_lane == 0 else (240, 240, 240)
-    button_border = (20, 120, 40) if selected_lane == 0 else (180, 180, 180)
-    button_text_color = (20, 80, 20) if selected_lane == 0 else (80, 80, 80)
-    
-    cv2.rectangle(history_image, 
-                 (button_x, button_y), 
-                 (button_x + 100, button_y + button_height), 
-                 button_color, -1, cv2.LINE_AA)
-    
-    # Button border
-    cv2.rectangle(history_image, 
-                 (button_x, button_y), 
-                 (button_x + 100, button_y + button_height), 
-                 button_border, 1, cv2.LINE_AA)
-    cv2.putText(history_image, "All Lanes", 
-               (button_x + 15, button_y + 22),
-               cv2.FONT_HERSHEY_SIMPLEX, 0.55, button_text_color, 1, cv2.LINE_AA)
-    button_x += 100 + button_margin
-    
-    # Lane-specific buttons
-    for lane in range(1, 6):
+    # "All Lanes" button followed by lane-specific buttons
+    buttons = [("All Lanes", 0, 100)] + [(f"Lane {lane}", lane, button_width) for lane in range(1, 6)]
+    for label, lane, this_button_width in buttons:
         button_color = (220, 240, 220) if selected_lane == lane else (240, 240, 240)
         button_border = (20, 120, 40) if selected_lane == lane else (180, 180, 180)
         button_text_color = (20, 80, 20) if selected_lane == lane else (80, 80, 80)
         
         cv2.rectangle(history_image, 
                      (button_x, button_y), 
-                     (button_x + button_width, button_y + button_height), 
+                     (button_x + this_button_width, button_y + button_height), 
                      button_color, -1, cv2.LINE_AA)
         
         # Button border
         cv2.rectangle(history_image, 
                      (button_x, button_y), 
-                     (button_x + button_width, button_y + button_height), 
+                     (button_x + this_button_width, button_y + button_height), 
                      button_border, 1, cv2.LINE_AA)
-        cv2.putText(history_image, f"Lane {lane}", 
+        cv2.putText(history_image, label, 
                    (button_x + 15, button_y + 22),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.55, button_text_color, 1, cv2.LINE_AA)
-        button_x += button_width + button_margin
+        button_x += this_button_width + button_margin
     
     # Add keyboard shortcut instructions - positioned well to the right for better spacing
     cv2.putText(history_image, "Press keys 0-5 to filter by lane", 
@@ -111,37 +125,15 @@ def create_detection_history_image(detection_history, width=1200, height=800, se
                cv2.FONT_HERSHEY_SIMPLEX, 0.55, (120, 120, 120), 1, cv2.LINE_AA)
     
     # Draw modern header row with light gradient for white theme
-    header_img = history_image.copy()
-    for y in range(header_height, header_height + row_height):
-        gradient_factor = (y - header_height) / row_height
-        color = (
-            int(245 - gradient_factor * 20),
-            int(245 - gradient_factor * 20),
-            int(250 - gradient_factor * 10)
-        )
-        cv2.line(header_img, (20, y), (width - 20, y), color, 1)
-    
-    cv2.addWeighted(header_img, 0.7, history_image, 0.3, 0, history_image)
-    
-    # Draw column headers with improved typography - darker color for white background
-    col_x = 20
-    headers = ["Detection Time", "Vehicle Type", "Lane", "ID", "Toll Fee", "Payment Status"]
-    col_widths = [time_col_width, type_col_width, lane_col_width, id_col_width, toll_fee_col_width, status_col_width]
+    header_region = (slice(header_height, header_height + row_height), slice(20, width - 19))
+    header_gradient = _gradient(row_height, (245, 245, 250), (20, 20, 10))
+    header_fill = np.repeat(header_gradient[:, None, :], width - 39, axis=1)
+    _blend_region(history_image, header_region, header_fill, 0.7)
     
     # Draw separator line under headers with gradient
-    separator_img = history_image.copy()
-    for x in range(20, width-20):
-        gradient_factor = (x - 20) / (width - 40)
-        color = (
-            int(200 - gradient_factor * 50),
-            int(200 - gradient_factor * 50),
-            int(220 - gradient_factor * 50)
-        )
-        cv2.line(separator_img, 
-                (x, header_height + row_height), 
-                (x, header_height + row_height), 
-                color, 1)
-    cv2.addWeighted(separator_img, 0.7, history_image, 0.3, 0, history_image)
+    separator_region = (slice(header_height + row_height, header_height + row_height + 1), slice(20, width - 20))
+    separator_fill = _gradient(width - 40, (200, 200, 220), (50, 50, 50))[None, :, :]
+    _blend_region(history_image, separator_region, separator_fill, 0.7)
     
     # Make header background more visible against white
     cv2.rectangle(history_image, 
@@ -149,177 +141,261 @@ def create_detection_history_image(detection_history, width=1200, height=800, se
                  (width - 20, header_height + row_height), 
                  (230, 235, 245), -1)
     
-    for i, header in enumerate(headers):
+    # Subtle vertical separators between columns, blended at the strength of their faded bottom end
+    separator_bottom = height - 21
+    separator_alpha = 0.3 - 0.2 * (separator_bottom - header_height) / (height - header_height - 20)
+    
+    col_x = 20
+    for i, header in enumerate(HISTORY_HEADERS):
         # Add subtle shadow effect to header text
         cv2.putText(history_image, header, 
                    (col_x + 10, header_height + 35),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (60, 60, 80), 1, cv2.LINE_AA)
         
-        # Draw subtle vertical separators between columns
         if i > 0:
-            separator_img = history_image.copy()
-            for y in range(header_height, height-20):
-                gradient_factor = (y - header_height) / (height - header_height - 20)
-                alpha = 0.3 - 0.2 * gradient_factor
-                cv2.line(separator_img, 
-                        (col_x, y), 
-                        (col_x, y), 
-                        (200, 200, 220), 1)
-            cv2.addWeighted(separator_img, alpha, history_image, 1-alpha, 0, history_image)
+            column_region = (slice(header_height, separator_bottom + 1), slice(col_x, col_x + 1))
+            column_fill = np.full_like(history_image[column_region], (200, 200, 220))
+            _blend_region(history_image, column_region, column_fill, separator_alpha)
         
         col_x += col_widths[i]
     
-    # Filter records by lane if a specific lane is selected
-    filtered_history = []
-    if selected_lane == 0:
-        filtered_history = detection_history.copy()
+    return history_image
+
+def draw_history_row(history_image, record, row_y, width=1200, striped=False):
+    """Draw one detection record as a table row whose top edge is at `row_y`."""
+    row_height = HISTORY_ROW_HEIGHT
+    time_col_width, type_col_width, lane_col_width, id_col_width, toll_fee_col_width, _ = _history_column_widths(width)
+    
+    # Draw alternating row backgrounds with subtle gradient for white theme
+    if striped:
+        row_region = (slice(row_y, row_y + row_height), slice(21, width - 20))
+        row_gradient = _gradient(row_height, (240, 240, 245), (10, 10, 10))
+        row_fill = np.repeat(row_gradient[:, None, :], width - 41, axis=1)
+        _blend_region(history_image, row_region, row_fill, 0.7)
+    
+    # Draw record data with improved styling for white theme
+    col_x = 20
+    
+    # Time with subtle time-ago indicator
+    time_text = record['time']
+    cv2.putText(history_image, time_text, 
+               (col_x + 10, row_y + 35),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 100), 1, cv2.LINE_AA)
+    col_x += time_col_width
+    
+    # Vehicle type with improved color coding for white background
+    vehicle_type = record['vehicle_type']
+    if "2-wheel" in vehicle_type:
+        type_color = (30, 150, 50)  # Green for 2-wheel
+        bg_color = (220, 245, 220)
+    elif "4-wheel" in vehicle_type:
+        type_color = (100, 70, 180)  # Purple for 4-wheel
+        bg_color = (235, 225, 245)
+    elif "6-wheel" in vehicle_type or "6-more-wheel" in vehicle_type:
+        type_color = (30, 120, 150)  # Teal for larger vehicles
+        bg_color = (220, 235, 245)
     else:
-        filtered_history = [record for record in detection_history if record['lane'] == selected_lane]
+        type_color = (100, 100, 100)  # Default gray
+        bg_color = (240, 240, 240)
+    
+    # Add colored tag background for vehicle type
+    tag_width = len(vehicle_type) * 12 + 20
+    
+    # Draw pill-shaped background for tag
+    cv2.rectangle(history_image, 
+                (col_x + 5, row_y + 15), 
+                (col_x + tag_width, row_y + 45), 
+                bg_color, -1, cv2.LINE_AA)
+    
+    # Border for tag
+    cv2.rectangle(history_image, 
+                (col_x + 5, row_y + 15), 
+                (col_x + tag_width, row_y + 45), 
+                type_color, 1, cv2.LINE_AA)
+    
+    cv2.putText(history_image, vehicle_type, 
+               (col_x + 12, row_y + 35),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, type_color, 1, cv2.LINE_AA)
+    col_x += type_col_width
+    
+    # Lane with modern styling
+    lane_text = f"Lane {record['lane']}"
+    cv2.putText(history_image, lane_text, 
+               (col_x + 10, row_y + 35),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 100), 1, cv2.LINE_AA)
+    col_x += lane_col_width
+    
+    # ID with modern styling
+    id_text = f"ID: {record['id']}"
+    cv2.putText(history_image, id_text, 
+               (col_x + 10, row_y + 35),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 100), 1, cv2.LINE_AA)
+    col_x += id_col_width
     
-    # Calculate how many rows we can show - more with increased height
-    max_rows = min(len(filtered_history), (height - header_height - row_height - 20) // row_height)
+    # Toll fee with modern styling
+    toll_fee = record.get('toll_fee', 0)
+    toll_text = f"{toll_fee} THB"
+    cv2.putText(history_image, toll_text, 
+               (col_x + 10, row_y + 35),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (30, 100, 30), 1, cv2.LINE_AA)
+    col_x += toll_fee_col_width
     
-    if max_rows == 0:
+    # Payment status with modern status indicator
+    status = record['payment_status']
+    
+    # Draw status indicator
+    if "Waiting" in status:
+        status_color = (150, 80, 30)  # Orange for waiting
+        bg_color = (250, 235, 220)  
+    elif "Paid" in status:
+        status_color = (30, 150, 50)  # Green for paid
+        bg_color = (220, 245, 220)
+    else:
+        status_color = (180, 40, 40)  # Red for other states
+        bg_color = (250, 220, 220)
+    
+    # Create status tag with rounded corners
+    tag_width = len(status) * 12 + 45
+    
+    # Draw pill-shaped background for status
+    cv2.rectangle(history_image, 
+                (col_x + 5, row_y + 15), 
+                (col_x + tag_width, row_y + 45), 
+                bg_color, -1, cv2.LINE_AA)
+    
+    # Border for status tag
+    cv2.rectangle(history_image, 
+                (col_x + 5, row_y + 15), 
+                (col_x + tag_width, row_y + 45), 
+                status_color, 1, cv2.LINE_AA)
+    
+    cv2.putText(history_image, status, 
+               (col_x + 12, row_y + 35),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, status_color, 1, cv2.LINE_AA)
+    
+    return history_image
+
+def _draw_no_records_message(history_image, selected_lane):
+    width, height = history_image.shape[1], history_image.shape[0]
+    message = f"No records found for Lane {selected_lane}"
+    cv2.putText(history_image, message, 
+               (width // 2 - 150, height // 2),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.9, (100, 100, 120), 1, cv2.LINE_AA)
+
+def create_detection_history_image(detection_history, width=1200, height=800, selected_lane=0):
+    """
+    Create an image showing recent detection history with payment status.
+    Latest detections will appear at the bottom of the table.
+    
+    This draws the whole panel from scratch; DetectionHistoryRenderer
+    produces the same image but reuses unchanged parts between frames.
+    
+    Args:
+        detection_history: DetectionHistory, DetectionStore or list of detection records
+        width: Width of the history image (increased from 900 to 1200)
+        height: Height of the history image (increased from 600 to 800)
+        selected_lane: Lane to filter by (0 for all lanes)
+        
+    Returns:
+        An image containing the detection history
+    """
+    history_image = create_history_chrome(width, height, selected_lane)
+    records = _latest_history_records(detection_history, _history_visible_rows(height), selected_lane)
+    
+    if not records:
         # Show a message when no records match the filter
-        message = f"No records found for Lane {selected_lane}"
-        cv2.putText(history_image, message, 
-                   (width // 2 - 150, height // 2),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.9, (100, 100, 120), 1, cv2.LINE_AA)
+        _draw_no_records_message(history_image, selected_lane)
         return history_image
     
-    # Draw the data rows with improved styling for white theme
-    start_index = max(0, len(filtered_history) - max_rows)
+    for i, record in enumerate(records):
+        row_y = HISTORY_HEADER_HEIGHT + HISTORY_ROW_HEIGHT + i * HISTORY_ROW_HEIGHT
+        draw_history_row(history_image, record, row_y, width, striped=i % 2 == 0)
     
-    for i in range(max_rows):
-        record_index = start_index + i
-        record = filtered_history[record_index]
-        row_y = header_height + row_height + i * row_height
-        
-        # Draw alternating row backgrounds with subtle gradient for white theme
-        if i % 2 == 0:
-            row_img = history_image.copy()
-            for y in range(row_y, row_y + row_height):
-                gradient_factor = (y - row_y) / row_height
-                color = (
-                    int(240 - gradient_factor * 10),
-                    int(240 - gradient_factor * 10),
-                    int(245 - gradient_factor * 10)
-                )
-                cv2.line(row_img, (21, y), (width - 21, y), color, 1)
-            cv2.addWeighted(row_img, 0.7, history_image, 0.3, 0, history_image)
-        
-        # Draw record data with improved styling for white theme
-        col_x = 20
-        
-        # Time with subtle time-ago indicator
-        time_text = record['time']
-        cv2.putText(history_image, time_text, 
-                   (col_x + 10, row_y + 35),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 100), 1, cv2.LINE_AA)
-        col_x += time_col_width
-        
-        # Vehicle type with improved color coding for white background
-        vehicle_type = record['vehicle_type']
-        if "2-wheel" in vehicle_type:
-            type_color = (30, 150, 50)  # Green for 2-wheel
-            bg_color = (220, 245, 220)
-        elif "4-wheel" in vehicle_type:
-            type_color = (100, 70, 180)  # Purple for 4-wheel
-            bg_color = (235, 225, 245)
-        elif "6-wheel" in vehicle_type or "6-more-wheel" in vehicle_type:
-            type_color = (30, 120, 150)  # Teal for larger vehicles
-            bg_color = (220, 235, 245)
-        else:
-            type_color = (100, 100, 100)  # Default gray
-            bg_color = (240, 240, 240)
-        
-        # Add colored tag background for vehicle type
-        tag_width = len(vehicle_type) * 12 + 20
-        
-        # Draw pill-shaped background for tag
-        cv2.rectangle(history_image, 
-                    (col_x + 5, row_y + 15), 
-                    (col_x + tag_width, row_y + 45), 
-                    bg_color, -1, cv2.LINE_AA)
-        
-        # Border for tag
-        cv2.rectangle(history_image, 
-                    (col_x + 5, row_y + 15), 
-                    (col_x + tag_width, row_y + 45), 
-                    type_color, 1, cv2.LINE_AA)
-        
-        cv2.putText(history_image, vehicle_type, 
-                   (col_x + 12, row_y + 35),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, type_color, 1, cv2.LINE_AA)
-        col_x += type_col_width
-        
-        # Lane with modern styling
-        lane_text = f"Lane {record['lane']}"
-        cv2.putText(history_image, lane_text, 
-                   (col_x + 10, row_y + 35),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 100), 1, cv2.LINE_AA)
-        col_x += lane_col_width
-        
-        # ID with modern styling
-        id_text = f"ID: {record['id']}"
-        cv2.putText(history_image, id_text, 
-                   (col_x + 10, row_y + 35),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 100), 1, cv2.LINE_AA)
-        col_x += id_col_width
-        
-        # Toll fee with modern styling
-        toll_fee = record.get('toll_fee', 0)
-        toll_text = f"{toll_fee} THB"
-        cv2.putText(history_image, toll_text, 
-                   (col_x + 10, row_y + 35),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (30, 100, 30), 1, cv2.LINE_AA)
-        col_x += toll_fee_col_width
-        
-        # Payment status with modern status indicator
-        status = record['payment_status']
-        
-        # Draw status indicator
-        if "Waiting" in status:
-            status_color = (150, 80, 30)  # Orange for waiting
-            bg_color = (250, 235, 220)  
-        elif "Paid" in status:
-            status_color = (30, 150, 50)  # Green for paid
-            bg_color = (220, 245, 220)
-        else:
-            status_color = (180, 40, 40)  # Red for other states
-            bg_color = (250, 220, 220)
+    return history_image
+
+class DetectionHistoryRenderer:
+    """
+    Cached renderer for the detection history panel.
+    
+    The static chrome (background, buttons, headers, separators) is drawn
+    once per `selected_lane`. Each table row is rendered once into a strip
+    and reused while the record and its position parity are unchanged, so a
+    new record costs one row plus a copy of the visible strips. When the
+    history is a DetectionHistory or DetectionStore, the finished panel is
+    reused as long as its version and the selected lane have not changed, so
+    a store is only queried after it commits new records.
+    """
+    def __init__(self, width=1200, height=800, max_cached_rows=512):
+        self.width = width
+        self.height = height
+        self.max_cached_rows = max_cached_rows
+        self._chrome = {}  # {selected_lane: image}
+        self._row_strips = {}  # {(record fields..., striped): row image}
+        self._last_key = None
+        self._last_image = None
+    
+    def render(self, detection_history, selected_lane=0):
+        version = getattr(detection_history, 'version', None)
+        key = (id(detection_history), selected_lane, version)
+        if version is not None and key == self._last_key:
+            return self._last_image
         
-        # Create status tag with rounded corners
-        tag_width = len(status) * 12 + 45
+        history_image = self._get_chrome(selected_lane).copy()
+        records = _latest_history_records(detection_history, _history_visible_rows(self.height), selected_lane)
         
-        # Draw pill-shaped background for status
-        cv2.rectangle(history_image, 
-                    (col_x + 5, row_y + 15), 
-                    (col_x + tag_width, row_y + 45), 
-                    bg_color, -1, cv2.LINE_AA)
+        if not records:
+            # Show a message when no records match the filter
+            _draw_no_records_message(history_image, selected_lane)
         
-        # Border for status tag
-        cv2.rectangle(history_image, 
-                    (col_x + 5, row_y + 15), 
-                    (col_x + tag_width, row_y + 45), 
-                    status_color, 1, cv2.LINE_AA)
+        for i, record in enumerate(records):
+            row_y = HISTORY_HEADER_HEIGHT + HISTORY_ROW_HEIGHT + i * HISTORY_ROW_HEIGHT
+            history_image[row_y:row_y + HISTORY_ROW_HEIGHT] = self._get_row_strip(record, i % 2 == 0, i == 0)
         
-        cv2.putText(history_image, status, 
-                   (col_x + 12, row_y + 35),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, status_color, 1, cv2.LINE_AA)
+        self._last_key = key
+        self._last_image = history_image
+        return history_image
     
-    return history_image
+    def _get_chrome(self, selected_lane):
+        chrome = self._chrome.get(selected_lane)
+        if chrome is None:
+            chrome = create_history_chrome(self.width, self.height, selected_lane)
+            self._chrome[selected_lane] = chrome
+        return chrome
+    
+    def _get_row_strip(self, record, striped, first_row):
+        key = (record['id'], record['vehicle_type'], record['lane'], record['time'],
+               record['payment_status'], record.get('toll_fee', 0), striped, first_row)
+        strip = self._row_strips.get(key)
+        if strip is None:
+            if len(self._row_strips) >= self.max_cached_rows:
+                self._row_strips.clear()
+            
+            # The table body looks the same under every row slot and lane filter, except
+            # that the first slot starts on the bottom edge of the header background
+            row_y = HISTORY_HEADER_HEIGHT + HISTORY_ROW_HEIGHT
+            if not first_row:
+                row_y += HISTORY_ROW_HEIGHT
+            strip = self._get_chrome(0)[row_y:row_y + HISTORY_ROW_HEIGHT].copy()
+            draw_history_row(strip, record, 0, self.width, striped)
+            self._row_strips[key] = strip
+        return strip
+
+_history_renderer = None
 
 def display_detection_history_window(detection_history, selected_lane=0):
     """
     Create and display a separate window showing recent detection history with payment status.
     
     Args:
-        detection_history: List of dictionaries containing detection information
+        detection_history: DetectionHistory, DetectionStore or list of dictionaries containing detection information
         selected_lane: Lane to filter by (0 for all lanes)
     """
-    # Create history image with larger dimensions
-    history_image = create_detection_history_image(detection_history, 1200, 800, selected_lane)
+    global _history_renderer
+    
+    # Create history image with larger dimensions, reusing what has not changed since the last frame
+    if _history_renderer is None:
+        _history_renderer = DetectionHistoryRenderer(1200, 800)
+    history_image = _history_renderer.render(detection_history, selected_lane)
     
     # Display in a separate window with a specific size
     cv2.namedWindow("Vehicle Detection History", cv2.WINDOW_NORMAL)
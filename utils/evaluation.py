@@ -0,0 +1,88 @@
+from constants import CLASS_NAMES
+from .calculate_toll_fee import calculate_toll_fee
+from .detection_store import DetectionStore
+
+
+def billable_passed(passed):
+  """
+  (lane, vehicle_type) of the vehicles in `passed` ((lane, class index) pairs,
+  as in a synthetic recording) that TollBilling bills; it never bills 2-wheelers.
+  """
+  billable = []
+  for lane, class_index in passed:
+    v_type = CLASS_NAMES[class_index]
+    if "2-wheel" not in v_type:
+      billable.append((lane, v_type))
+  return billable
+
+
+def truth_from_passed(passed):
+  """Lane summary of the billable vehicles in `passed`, the layout of load_lane_vehicle_counts."""
+  truth = {}
+  for lane, v_type in billable_passed(passed):
+    truth.setdefault(lane, {})[v_type] = truth.get(lane, {}).get(v_type, 0) + 1
+  return truth
+
+
+def billed_counts(detection_history):
+  """{lane: {vehicle_type: count}} of the billed records, the layout of load_lane_vehicle_counts."""
+  if isinstance(detection_history, DetectionStore):
+    detection_history.flush()
+    return detection_history.lane_vehicle_counts()
+  counts = {}
+  for record in detection_history:
+    lane_counts = counts.setdefault(record['lane'], {})
+    lane_counts[record['vehicle_type']] = lane_counts.get(record['vehicle_type'], 0) + 1
+  return counts
+
+
+def count_errors(counts, truth):
+  """Sum of absolute per-lane/class count errors, and the error in the overall total."""
+  keys = {(lane, v_type) for source in (counts, truth) for lane in source for v_type in source[lane]}
+  absolute = sum(abs(counts.get(lane, {}).get(v_type, 0) - truth.get(lane, {}).get(v_type, 0)) for lane, v_type in keys)
+  total = sum(map(sum, (c.values() for c in counts.values()))) - sum(map(sum, (c.values() for c in truth.values())))
+  return absolute, total
+
+
+def count_error_table(counts, truth):
+  """Rows (lane, vehicle_type, counted, truth, error) for every lane/class in either summary."""
+  keys = sorted({(lane, v_type) for source in (counts, truth) for lane in source for v_type in source[lane]})
+  rows = []
+  for lane, v_type in keys:
+    counted = counts.get(lane, {}).get(v_type, 0)
+    expected = truth.get(lane, {}).get(v_type, 0)
+    rows.append((lane, v_type, counted, expected, counted - expected))
+  return rows
+
+
+def fee_errors(counts, truth):
+  """
+  Billing error in money: the sum of absolute per-lane fee differences, and
+  the difference in total fees (a vehicle billed in the wrong lane counts in
+  the first, not the second).
+  """
+  def lane_fees(summary):
+    return {lane: sum(count * calculate_toll_fee(v_type) for v_type, count in types.items())
+            for lane, types in summary.items()}
+
+  counted, expected = lane_fees(counts), lane_fees(truth)
+  lanes = set(counted) | set(expected)
+  absolute = sum(abs(counted.get(lane, 0) - expected.get(lane, 0)) for lane in lanes)
+  return absolute, sum(counted.values()) - sum(expected.values())
+
+
+def pareto_front(rows, speed_key, error_key):
+  """
+  Indices of the rows no other row beats on both speed (higher is better)
+  and error (lower is better).
+  """
+  front = []
+  for i, row in enumerate(rows):
+    dominated = any(
+      other[speed_key] >= row[speed_key] and other[error_key] <= row[error_key]
+      and (other[speed_key] > row[speed_key] or other[error_key] < row[error_key])
+      for other in rows
+    )
+    if not dominated:
+      front.append(i)
+  return front
@@ -1,42 +1,34 @@
+import collections
 import csv
 import os
+import time
+from .detection_store import DetectionStore
 
 def save_detection_history_to_csv(detection_history, filename="vehicle_detection_data.csv"):
+  """
+  Export billing records and the lane summary to outputs/.
+
+  From a DetectionStore the counts come from its indexed aggregate query
+  and records are streamed from the database, so the export does not
+  load the whole history into memory. A DetectionHistory or a list of
+  records is counted here.
+  """
   # Create outputs directory if it doesn't exist
   output_dir = "outputs"
   os.makedirs(output_dir, exist_ok=True)
   
-  # Count vehicles by class
-  vehicle_counts = {}
+  if isinstance(detection_history, DetectionStore):
+    # Include records still queued for the writer thread
+    detection_history.flush()
+    lane_vehicle_counts = detection_history.lane_vehicle_counts()
+  else:
+    # Count vehicles by lane and class
+    lane_vehicle_counts = {}
+    for record in detection_history:
+      counts = lane_vehicle_counts.setdefault(record['lane'], {})
+      counts[record['vehicle_type']] = counts.get(record['vehicle_type'], 0) + 1
   # Count vehicles by lane
-  lane_counts = {}
-  # Count vehicles by lane and class
-  lane_vehicle_counts = {}
-  
-  for record in detection_history:
-    v_type = record['vehicle_type']
-    lane = record['lane']
-    
-    # Count by vehicle type
-    if v_type in vehicle_counts:
-      vehicle_counts[v_type] += 1
-    else:
-      vehicle_counts[v_type] = 1
-    
-    # Count by lane
-    if lane in lane_counts:
-      lane_counts[lane] += 1
-    else:
-      lane_counts[lane] = 1
-    
-    # Count by lane and vehicle type
-    if lane not in lane_vehicle_counts:
-      lane_vehicle_counts[lane] = {}
-    
-    if v_type in lane_vehicle_counts[lane]:
-      lane_vehicle_counts[lane][v_type] += 1
-    else:
-      lane_vehicle_counts[lane][v_type] = 1
+  lane_counts = {lane: sum(counts.values()) for lane, counts in lane_vehicle_counts.items()}
   
   # Save full detection history
   filepath = os.path.join(output_dir, filename)
@@ -64,4 +56,151 @@ def save_detection_history_to_csv(detection_history, filename="vehicle_detection
       writer.writerow(['', '', ''])
   
   print(f"Detection history saved to {filepath}")
-  print(f"Lane-specific vehicle counts saved to {lane_counts_filepath}")
\ No newline at end of file
+  print(f"Lane-specific vehicle counts saved to {lane_counts_filepath}")
+
+def load_lane_vehicle_counts(filepath):
+  """
+  Read a lane summary written by save_detection_history_to_csv or
+  DetectionHistoryWriter (or a hand-counted one in the same layout, such
+  as outputs/real_lane_vehicle_counts.csv). TOTAL and blank rows are skipped.
+
+  Returns:
+      {lane: {vehicle_type: count}}
+  """
+  lane_vehicle_counts = {}
+  with open(filepath, newline='') as csvfile:
+    for row in csv.DictReader(csvfile):
+      if not row['Lane'] or row['Vehicle Type'] == 'TOTAL':
+        continue
+      lane_vehicle_counts.setdefault(int(row['Lane']), {})[row['Vehicle Type']] = int(row['Count'])
+  return lane_vehicle_counts
+
+class DetectionHistoryWriter:
+  """
+  Incremental replacement for calling save_detection_history_to_csv every frame.
+
+  Billing records are appended to the detection CSV as they are created or
+  changed, so the cost per frame depends only on that frame's records, not
+  on the length of the shift. Writes are buffered and fsync'd at most every
+  `fsync_interval` seconds. If a record is changed after it was written, the
+  new version is appended as another row; the last row for an id wins.
+  Only the last `window` ids are remembered, like the DetectionHistory
+  window, so memory stays flat over a long run; an id billed again after
+  it left the window is counted as a new vehicle, as in the history.
+
+  Per-class, per-lane and per-lane/class counts are kept as running
+  counters. The lane summary file is rewritten every `summary_interval`
+  seconds and on close(), never on every frame.
+  """
+  FIELDNAMES = ['id', 'vehicle_type', 'lane', 'time', 'payment_status', 'toll_fee']
+
+  def __init__(self, filename="vehicle_detection_data.csv", output_dir="outputs",
+               summary_filename="lane_vehicle_counts.csv", fsync_interval=5.0, summary_interval=60.0,
+               window=5000):
+    os.makedirs(output_dir, exist_ok=True)
+    self.filepath = os.path.join(output_dir, filename)
+    self.summary_filepath = os.path.join(output_dir, summary_filename)
+    self.fsync_interval = fsync_interval
+    self.summary_interval = summary_interval
+    self.window = window
+
+    self._file = open(self.filepath, 'w', newline='', buffering=64 * 1024)
+    self._writer = csv.DictWriter(self._file, fieldnames=self.FIELDNAMES, extrasaction='ignore')
+    self._writer.writeheader()
+
+    # Last written version of each recent record, oldest first, to skip unchanged ones and undo old counts
+    self._written = collections.OrderedDict()
+
+    self.vehicle_counts = {}  # {vehicle_type: count}
+    self.lane_counts = {}  # {lane: count}
+    self.lane_vehicle_counts = {}  # {lane: {vehicle_type: count}}
+
+    now = time.monotonic()
+    self._last_fsync = now
+    self._last_summary = now
+    self._summary_dirty = True
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.close()
+
+  def write(self, records):
+    """Append the given new or changed records and update the running counts."""
+    for record in records:
+      row = tuple(record.get(field) for field in self.FIELDNAMES)
+      previous = self._written.get(record['id'])
+      if previous == row:
+        continue
+
+      if previous is not None:
+        self._count(previous[2], previous[1], -1)
+      self._count(record['lane'], record['vehicle_type'], 1)
+
+      self._writer.writerow(record)
+      self._written[record['id']] = row
+      if len(self._written) > self.window:
+        self._written.popitem(last=False)
+      self._summary_dirty = True
+
+    now = time.monotonic()
+    if now - self._last_fsync >= self.fsync_interval:
+      self.sync()
+    if now - self._last_summary >= self.summary_interval:
+      self.write_summary()
+
+  def sync(self):
+    """Flush buffered rows and fsync them to disk."""
+    self._file.flush()
+    os.fsync(self._file.fileno())
+    self._last_fsync = time.monotonic()
+
+  def write_summary(self):
+    """Rewrite the lane summary file from the running counters."""
+    self._last_summary = time.monotonic()
+    if not self._summary_dirty:
+      return
+
+    # Write to a temporary file first so readers never see a half-written summary
+    tmp_filepath = self.summary_filepath + ".tmp"
+    with open(tmp_filepath, 'w', newline='') as csvfile:
+      writer = csv.writer(csvfile)
+      writer.writerow(['Lane', 'Vehicle Type', 'Count'])
+
+      # Sort by lane number for better readability
+      for lane in sorted(self.lane_vehicle_counts.keys()):
+        for v_type, count in self.lane_vehicle_counts[lane].items():
+          writer.writerow([lane, v_type, count])
+        # Add a total row for each lane
+        writer.writerow([lane, 'TOTAL', self.lane_counts[lane]])
+        # Add an empty row for better readability
+        writer.writerow(['', '', ''])
+    os.replace(tmp_filepath, self.summary_filepath)
+    self._summary_dirty = False
+
+  def close(self):
+    if self._file.closed:
+      return
+    self.sync()
+    self._file.close()
+    self.write_summary()
+
+    print(f"Detection history saved to {self.filepath}")
+    print(f"Lane-specific vehicle counts saved to {self.summary_filepath}")
+
+  def _count(self, lane, v_type, delta):
+    self.vehicle_counts[v_type] = self.vehicle_counts.get(v_type, 0) + delta
+    self.lane_counts[lane] = self.lane_counts.get(lane, 0) + delta
+
+    lane_vehicle_counts = self.lane_vehicle_counts.setdefault(lane, {})
+    lane_vehicle_counts[v_type] = lane_vehicle_counts.get(v_type, 0) + delta
+
+    # Drop empty entries left behind when a record moves to another lane or class
+    if lane_vehicle_counts[v_type] == 0:
+      del lane_vehicle_counts[v_type]
+    if self.vehicle_counts[v_type] == 0:
+      del self.vehicle_counts[v_type]
+    if self.lane_counts[lane] == 0:
+      del self.lane_counts[lane]
+      del self.lane_vehicle_counts[lane]